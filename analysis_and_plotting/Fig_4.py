@@ -82,14 +82,7 @@ def make_plot(wrfOutputFile,plotpath,start_time=144,end_time=-1,lat=60,lon=55,pl
     if plot_cloud_base==True:            
         CWC = (wrfOutputFile.variables["QCLOUD"][144:,:,lat,lon]+wrfOutputFile.variables["QICE"][144:,:,lat,lon])*P/(287.058*T)
             
-        cloud_base_index = np.zeros(288)
-        cloud_base = np.zeros(288)
-        for i in range(288):
-            for j in np.arange(0,40):
-                if CWC[i,j+1]-CWC[i,j]>0:
-                    cloud_base_index[i] = j
-                    cloud_base[i] = H[j]
-                    break
+        cloud_base = fct.cloud_base_height(CWC[:288],H)
         cbase_avg24h = np.mean(cloud_base)  #time in minutes since simulation start
         ax2.hlines(cbase_avg24h,200,280, linestyle='--',color='black')
 
@@ -4,8 +4,6 @@ from netCDF4 import Dataset
 import numpy as np
 import matplotlib.pyplot as plt
 
-import statsmodels.api as sm
-
 from cartopy.feature import NaturalEarthFeature
 
 from wrf import (getvar, interplevel, to_np, latlon_coords, get_cartopy,
@@ -320,26 +318,8 @@ def var_std_err_lag_corr(file,var,title,vmin=0,vmax=15,plot=True,colorbar=True):
     # Average var over 24h
     avg = np.mean(data,axis=0)
 
-    # Standard deviation of variable at each grid point:
-    sigma = np.std(data,axis=0)
-    
-    # lag-1 autocorrelation
-    lags = [0,1,2]
-    
-    r1 = np.zeros_like(avg)
-    SE = np.zeros_like(avg)
-    
-    for i in range(np.shape(avg)[0]):
-        for j in range(np.shape(avg)[1]):
-            acorr = sm.tsa.acf(data[:,i,j], nlags = len(lags)-1)
-            # print("autocorr.: ",acorr)
-            r1[i,j] = acorr[1]
-    
-            # standard error:
-            N = np.shape(data)[0]
-            A = (1 + acorr[1])/(1 - acorr[1])# =N/N_eff
-            # print("N: ,",N," N_eff: ",N/A)
-            SE[i,j] = sigma[i,j]/np.sqrt(N)*np.sqrt(A)
+    # lag-1 autocorrelation and standard error:
+    r1,SE = fct.lag_corrected_std_err(data)
 
     if plot==True:
     
@@ -1,39 +1,63 @@
 """Calculations for shortwave cloud optical depth, in-cloud water path
 and hydrometeor particle sizes"""
 
+import warnings
 import numpy as np, matplotlib.pyplot as plt
 from scipy.special import gamma
 import scipy.integrate as integrate
 from netCDF4 import Dataset
 import number_size_distributions as nsd
+import wrf_state as ws
 
-def vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,r,N,q,P,T):
-    q_cloud = q
-    r_matrix = np.zeros(np.shape(q_cloud))
-    for i in range(np.shape(q_cloud)[0]):
-        for j in range(np.shape(q_cloud)[1]):
-            if q_cloud[i,j] == 0:
-                r_matrix[i,j] = np.nan     
-            elif q_cloud[i,j] > 0:
-                r_matrix[i,j] = nsd.r_eff_droplets(r, N, q[i,j], P[i,j], T[i,j])
+# hydrometeor categories: mixing ratio and number concentration in the wrfout
+# file (None: prescribed N_cloud), size distribution, bulk density (kg m-3)
+# in the optical depth and phase; a new category (e.g. hail) only needs an
+# entry here:
+categories = {'cloud': {'q': "QCLOUD", 'N': None, 'distribution': 'gamma', 'density': 1000., 'phase': 'liquid'},
+              'rain': {'q': "QRAIN", 'N': "QNRAIN", 'distribution': 'exponential', 'density': 1000., 'phase': 'liquid'},
+              'ice': {'q': "QICE", 'N': "QNICE", 'distribution': 'exponential', 'density': 500., 'phase': 'frozen'},
+              'snow': {'q': "QSNOW", 'N': "QNSNOW", 'distribution': 'exponential', 'density': 100., 'phase': 'frozen'},
+              'graupel': {'q': "QGRAUP", 'N': "QNGRAUPEL", 'distribution': 'exponential', 'density': 900., 'phase': 'frozen'}}
+# categories['hail'] = {'q': "QHAIL", 'N': "QNHAIL", 'distribution': 'exponential', 'density': 900., 'phase': 'frozen'}
+
+def vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,r,N,q,P,T,method='trapezoid'):
+    """
+    Vertical mean (over cloudy levels) of the droplet effective radius for
+    all time steps at once. method 'trapezoid' (default) integrates over
+    the radius grid r as for the Table S1 values, 'analytic' uses the
+    closed form (mu+3)/(2*lam), exact for the gamma distribution and up to
+    0.4% different in the vertical mean (see nsd.r_eff_droplets).
+    """
+    q_cloud = np.asarray(q)
+    r_matrix = nsd.r_eff_droplets(r, N, q_cloud, P, T, method=method)
+    r_matrix = np.where(q_cloud == 0, np.nan, np.where(q_cloud > 0, r_matrix, 0.))
     return np.nanmean(r_matrix,axis=1)
 
-def water_path(wrfout,var,lat,lon,max_level,start_time,end_time):
-    PH = wrfout.variables["PH"][288,:max_level+1,lat,lon]
-    PHB = wrfout.variables["PHB"][288,:max_level+1,lat,lon]
+def heights(state,slab,height_time=288):
+    """
+    Layer heights (time, level[, y, x]) for the hyperslab slab =
+    (start_time,end_time,max_level,lat,lon): from PH/PHB at time step
+    height_time for all time steps (time axis of length 1), or of every
+    time step if height_time is None.
+    """
+    if height_time is None:
+        return state.layer_heights_series(*slab)
+    return state.layer_heights(*slab[2:],height_time)[None]
 
-    H = np.zeros(len(PH)-1)
-    for k in range(len(H)):
-        H[k] = 0.5*(PHB[k] + PH[k] + PHB[k+1] + PH[k+1])/9.81
-        
-    # Get pressure, temperature and cloud properties at location of Ny-Ålesund, in time and altitude up to ca. 3 km:
-    P = wrfout.variables["P"][start_time:end_time,:max_level,lat,lon]+wrfout.variables["PB"][start_time:end_time,:max_level,lat,lon]
-    pot_T = wrfout.variables["T"][start_time:end_time,:max_level,lat,lon]+300
-    T = pot_T*(P/100000)**0.2854
+def water_path(wrfout,var,lat,lon,max_level,start_time,end_time,state=None,height_time=288):
+    """
+    Vertically integrated water content (kg m-2) of var, heights from
+    PH/PHB at time step height_time (None: heights of every time step).
+    state (wrf_state.WRFState of wrfout) shares the reads and the
+    pressure, temperature and heights with other calls.
+    """
+    if state is None:
+        state = ws.WRFState(wrfout)
 
-    WC = wrfout.variables[var][start_time:end_time,:max_level,lat,lon]*P/(287.058*T)
-    # print(np.shape(WC),np.shape(H))
-    WP = integrate.trapezoid(WC,x=H,axis=1)
+    # Get pressure, temperature and cloud properties at location of Ny-Ålesund, in time and altitude up to ca. 3 km:
+    slab = (start_time,end_time,max_level,lat,lon)
+    WC = state.variable(var,*slab)*state.air_density(*slab)
+    WP = integrate.trapezoid(WC,x=heights(state,slab,height_time),axis=1)
     return WP
 
 def cod_one_category(water_path,r_eff,density):
@@ -42,127 +66,282 @@ def cod_one_category(water_path,r_eff,density):
     tau = a/b
     return tau
     
-def tau_cloud(wrfout,lat=60,lon=55,start_time=144,end_time=-1,max_level=93):
-    
-    # Get pressure, temperature and cloud properties at location of Ny-Ålesund, in time and altitude up to ca. 3 km:
-    P = wrfout.variables["P"][start_time:end_time,:max_level,lat,lon]+wrfout.variables["PB"][start_time:end_time,:max_level,lat,lon]
-    pot_T = wrfout.variables["T"][start_time:end_time,:max_level,lat,lon]+300
-    T = pot_T*(P/100000)**0.2854
-    
-    q_cloud = wrfout.variables["QCLOUD"][start_time:end_time,:max_level,lat,lon]
-    q_rain = wrfout.variables["QRAIN"][start_time:end_time,:max_level,lat,lon]
-    q_ice = wrfout.variables["QICE"][start_time:end_time,:max_level,lat,lon]
-    q_snow = wrfout.variables["QSNOW"][start_time:end_time,:max_level,lat,lon]
-    q_graupel = wrfout.variables["QGRAUP"][start_time:end_time,:max_level,lat,lon]
-
-    N_cloud = 9.*1e+6 #in m-3
-    N_rain = wrfout.variables["QNRAIN"][start_time:end_time,:max_level,lat,lon]
-    N_ice = wrfout.variables["QNICE"][start_time:end_time,:max_level,lat,lon]
-    N_snow = wrfout.variables["QNSNOW"][start_time:end_time,:max_level,lat,lon]
-    N_graupel = wrfout.variables["QNGRAUPEL"][start_time:end_time,:max_level,lat,lon]
-    
-    # print(q_cloud,N_cloud,P,T)
-    
-    # r_cloud = np.arange(0,5e-4,2e-6) #up to 0.5mm in 2 micrometer steps
-    r_cloud = np.array([0,5e-7,1e-6,2e-6,3e-6,4e-6,6e-6,8e-6,1e-5,1.4e-5,
-                        1.8e-5,2.2e-5,2.6e-5,3.1e-5,3.6e-5,4.1e-5,4.7e-5,
-                        5.3e-5,5.9e-5,6.5e-5,7.2e-5,7.9e-5,8.6e-5,9.4e-5,
-                        1.2e-4,2.0e-4,2.8e-4,3.7e-4,4.6e-4,5.4e-4,6.4e-4,
-                        7.4e-4,8.6e-4,1e-3])
-    
-    # Calculate effective radius:
-    r_eff_rain = nsd.r_eff_non_droplets(N_rain, q_rain)
-    r_eff_ice = nsd.r_eff_non_droplets(N_ice, q_ice)
-    r_eff_snow = nsd.r_eff_non_droplets(N_snow, q_snow)
-    r_eff_graupel = nsd.r_eff_non_droplets(N_graupel, q_graupel)
-
-    # Average over altitude axis to get timeline of r_eff per category:
-    r_eff_cloud_vert_avg = vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,r_cloud, N_cloud, q_cloud, P, T)
-    r_eff_rain_vert_avg = np.mean(r_eff_rain, axis=1)
-    r_eff_ice_vert_avg = np.mean(r_eff_ice, axis=1)
-    r_eff_snow_vert_avg = np.mean(r_eff_snow, axis=1)
-    r_eff_graupel_vert_avg = np.mean(r_eff_graupel, axis=1)
+def category_fields(state,slab,names,N_cloud=9.*1e+6):
+    """
+    Mixing ratios and number concentrations of the categories names (keys
+    of categories), stacked as (category, time, level[, y, x]).
+    """
+    q = np.ma.stack([state.variable(categories[name]['q'],*slab) for name in names])
+    N = np.ma.stack([np.full(q.shape[1:],N_cloud) if categories[name]['N'] is None
+                     else state.variable(categories[name]['N'],*slab) for name in names])
+    return q,N
+
+def stacked_optical_depth(state,slab,names,N_cloud=9.*1e+6,height_time=288,method='trapezoid'):
+    """
+    Water path, vertical average effective radius and optical depth of all
+    categories names at once, each as (category, time[, y, x]), for the
+    hyperslab slab = (start_time,end_time,max_level,lat,lon) of state
+    (wrf_state.WRFState). method: droplet r_eff, see
+    vertical_average_r_eff_droplets.
+    """
+    q,N = category_fields(state,slab,names,N_cloud)
     
     # Calculate water path (vertically integrated water content) for all hydrometeor categories:
-    CWP = water_path(wrfout, "QCLOUD",lat,lon,max_level,start_time,end_time)
-    RWP = water_path(wrfout, "QRAIN",lat,lon,max_level,start_time,end_time)
-    IWP = water_path(wrfout, "QICE",lat,lon,max_level,start_time,end_time)
-    SWP = water_path(wrfout, "QSNOW",lat,lon,max_level,start_time,end_time)
-    GWP = water_path(wrfout, "QGRAUP",lat,lon,max_level,start_time,end_time)
-
+    WC = q*state.air_density(*slab)[None]
+    WP = integrate.trapezoid(WC,x=heights(state,slab,height_time)[None],axis=2)
+    
+    # Calculate effective radius and average over altitude axis to get timeline of r_eff per category:
+    r_eff = np.ma.zeros(WP.shape)
+    exponential = [k for k,name in enumerate(names) if categories[name]['distribution']=='exponential']
+    if exponential:
+        r_eff[exponential] = np.mean(nsd.r_eff_non_droplets(N[exponential], q[exponential]), axis=2)
+    for k,name in enumerate(names):
+        if categories[name]['distribution']=='gamma':
+            r_eff[k] = vertical_average_r_eff_droplets(slab[0],slab[1],slab[2],slab[3],slab[4],nsd.r_cloud_grid,
+                                                       N_cloud,q[k],state.pressure(*slab),state.temperature(*slab),method)
+    
     # Calculate cloud optical depth for each hydrometeor category individually:
-    cod_cloud = cod_one_category(CWP, r_eff_cloud_vert_avg, 1000.)
-    cod_rain = cod_one_category(RWP, r_eff_rain_vert_avg, 1000.)
-    cod_ice = cod_one_category(IWP, r_eff_ice_vert_avg, 500.)
-    cod_snow = cod_one_category(SWP, r_eff_snow_vert_avg, 100.)
-    cod_graupel = cod_one_category(GWP, r_eff_graupel_vert_avg, 900.)
-    
-    # Make optical depth zero where there's no cloud (of given hydrometeor type):
-    cod_cloud = np.array(cod_cloud)
-    cod_cloud = np.where(cod_cloud=='--',0,cod_cloud)
-    cod_rain = np.array(cod_rain)
-    cod_rain = np.where(cod_rain=='--',0,cod_rain)
-    cod_ice = np.array(cod_ice)
-    cod_ice = np.where(cod_ice=='--',0,cod_ice)
-    cod_snow = np.array(cod_snow)
-    cod_snow = np.where(cod_snow=='--',0,cod_snow)
-    cod_graupel = np.array(cod_graupel)
-    cod_graupel = np.where(cod_graupel=='--',0,cod_graupel)
+    density = np.array([categories[name]['density'] for name in names]).reshape((-1,)+(1,)*(WP.ndim-1))
+    cod = cod_one_category(WP, r_eff, density)
+    
+    return WP,r_eff,cod
+
+def phase_sum(cod,names,phase):
+    """
+    Sum of the stacked optical depths (category first) of one phase.
+    """
+    return np.sum(cod[[k for k,name in enumerate(names) if categories[name]['phase']==phase]],axis=0)
+
+def tau_cloud(wrfout,lat=60,lon=55,start_time=144,end_time=-1,max_level=93,state=None,N_cloud=9.*1e+6,
+              method='trapezoid'):
+    
+    if state is None:
+        state = ws.WRFState(wrfout)
+    
+    # Get pressure, temperature and cloud properties at location of Ny-Ålesund, in time and altitude up to ca. 3 km:
+    names = ('cloud','rain','ice','snow','graupel')
+    WP,r_eff,cod = stacked_optical_depth(state,(start_time,end_time,max_level,lat,lon),names,N_cloud,method=method)
+    
+    # No cloud (of given hydrometeor type): r_eff is zero, the masked optical depth keeps 3*water path (zero):
+    cod = np.array(cod)
     
     # Calculate total cloud optical depth and liquid and frozen/ice partition:
-    cod_liquid = cod_cloud + cod_rain
-    cod_frozen = cod_ice + cod_snow + cod_graupel
+    cod_liquid = phase_sum(cod,names,'liquid')
+    cod_frozen = phase_sum(cod,names,'frozen')
     cod_tot = cod_liquid + cod_frozen
     
-    return cod_tot,cod_cloud,cod_ice,cod_liquid,cod_frozen,CWP,RWP,IWP,SWP,GWP,r_eff_cloud_vert_avg,r_eff_rain_vert_avg,r_eff_ice_vert_avg,r_eff_snow_vert_avg,r_eff_graupel_vert_avg
+    return (cod_tot,cod[0],cod[2],cod_liquid,cod_frozen)+tuple(WP)+tuple(r_eff)
 
-def tau_cloud_no_ice(wrfout,lat=60,lon=55,start_time=144,end_time=-1,max_level=93):
+def tau_cloud_no_ice(wrfout,lat=60,lon=55,start_time=144,end_time=-1,max_level=93,state=None,N_cloud=9.*1e+6,
+                     method='trapezoid'):
+    
+    if state is None:
+        state = ws.WRFState(wrfout)
     
     # Get pressure, temperature and cloud properties at location of Ny-Ålesund, in time and altitude up to ca. 3 km:
-    P = wrfout.variables["P"][start_time:end_time,:max_level,lat,lon]+wrfout.variables["PB"][start_time:end_time,:max_level,lat,lon]
-    pot_T = wrfout.variables["T"][start_time:end_time,:max_level,lat,lon]+300
-    T = pot_T*(P/100000)**0.2854
+    names = ('cloud','rain')
+    WP,r_eff,cod = stacked_optical_depth(state,(start_time,end_time,max_level,lat,lon),names,N_cloud,method=method)
     
-    q_cloud = wrfout.variables["QCLOUD"][start_time:end_time,:max_level,lat,lon]
-    q_rain = wrfout.variables["QRAIN"][start_time:end_time,:max_level,lat,lon]
+    # Calculate total cloud optical depth and liquid and frozen/ice partition:
+    cod_liquid = phase_sum(np.array(cod),names,'liquid')
+    
+    return cod_liquid
 
-    N_cloud = 9.*1e+6 #in m-3
-    N_rain = wrfout.variables["QNRAIN"][start_time:end_time,:max_level,lat,lon]
+def N_cloud_sweep(wrfout,N_cloud,lat=60,lon=55,start_time=144,end_time=-1,max_level=93,state=None,
+                  height_time=288,method='trapezoid'):
+    """
+    Sensitivity of the cloud droplet effective radius and the liquid
+    optical depth to the assumed droplet number concentration: N_cloud
+    (m-3) is a vector of values, evaluated in one call against the fields
+    read once (the number concentration is broadcast as last dimension).
+    lat and lon can be indices or slices as in tau_cloud_domain.
     
-    # print(q_cloud,N_cloud,P,T)
+    Returns a dictionary with N_cloud, r_eff_cloud, cod_cloud and
+    cod_liquid, each (N_cloud[, time[, y, x]]) and equal to tau_cloud for
+    every single value.
+    """
+    if state is None:
+        state = ws.WRFState(wrfout)
+    slab = (start_time,end_time,max_level,lat,lon)
+    N_cloud = np.atleast_1d(np.asarray(N_cloud,dtype=float))
     
-    # r_cloud = np.arange(0,5e-4,2e-6) #up to 0.5mm in 2 micrometer steps
-    r_cloud = np.array([0,5e-7,1e-6,2e-6,3e-6,4e-6,6e-6,8e-6,1e-5,1.4e-5,
-                        1.8e-5,2.2e-5,2.6e-5,3.1e-5,3.6e-5,4.1e-5,4.7e-5,
-                        5.3e-5,5.9e-5,6.5e-5,7.2e-5,7.9e-5,8.6e-5,9.4e-5,
-                        1.2e-4,2.0e-4,2.8e-4,3.7e-4,4.6e-4,5.4e-4,6.4e-4,
-                        7.4e-4,8.6e-4,1e-3])
+    # shared reads: cloud water, pressure and temperature, and the rain optical depth (independent of N_cloud):
+    q = state.variable("QCLOUD",*slab)
+    P = np.asarray(state.pressure(*slab))[...,None]
+    T = np.asarray(state.temperature(*slab))[...,None]
+    CWP = water_path(wrfout,"QCLOUD",lat,lon,max_level,start_time,end_time,state=state,height_time=height_time)
+    cod_rain = np.array(stacked_optical_depth(state,slab,('rain',),height_time=height_time)[2][0])
     
-    # Calculate effective radius:
-    r_eff_rain = nsd.r_eff_non_droplets(N_rain, q_rain)
+    r_eff = vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,nsd.r_cloud_grid,
+                                            N_cloud,np.asarray(q)[...,None],P,T,method)
+    r_eff = np.moveaxis(r_eff,-1,0)
+    cod_cloud = np.array(cod_one_category(CWP[None], r_eff, 1000.))
+    
+    return {'N_cloud': N_cloud, 'r_eff_cloud': r_eff, 'cod_cloud': cod_cloud,
+            'cod_liquid': cod_cloud + cod_rain[None]}
+
+def domain_output(wrfout,output_file,time_steps,variables,levels=None):
+    """
+    NetCDF file for maps (time, y, x) of the whole domain, with the time
+    indices, XLAT/XLONG and the (empty) variables given as name: long_name;
+    fields (time, level, y, x) if the number of levels is given.
+    """
+    output = Dataset(output_file,'w')
+    output.createDimension('time',None)
+    dims = ('time','y','x')
+    if levels is not None:
+        output.createDimension('level',levels)
+        dims = ('time','level','y','x')
+    output.createDimension('y',len(wrfout.dimensions["south_north"]))
+    output.createDimension('x',len(wrfout.dimensions["west_east"]))
+    output.source = wrfout.filepath()
+    output.createVariable('time_index','i4',('time',))[:] = time_steps
+    output['time_index'].long_name = 'time index in the source wrfout file'
+    for name in ("XLAT","XLONG"):
+        if name in wrfout.variables:
+            output.createVariable(name,'f4',('y','x'))[:] = wrfout.variables[name][0]
+    for name,long_name in variables.items():
+        output.createVariable(name,'f4',dims,zlib=True).long_name = long_name
+    return output
+
+def time_chunks(time_steps,time_chunk):
+    """
+    Position in time_steps, first and end time index of consecutive chunks
+    of (at most) time_chunk time steps.
+    """
+    for i in range(0,len(time_steps),time_chunk):
+        yield i,time_steps[i],time_steps[min(i+time_chunk,len(time_steps))-1]+1
 
-    # Average over altitude axis to get timeline of r_eff per category:
-    r_eff_cloud_vert_avg = vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,r_cloud, N_cloud, q_cloud, P, T)
-    r_eff_rain_vert_avg = np.mean(r_eff_rain, axis=1)
+def water_path_domain(wrfout,start_time=144,end_time=-1,max_level=93,time_chunk=8,
+                      height_time=None,output_file=None):
+    """
+    Liquid (cloud and rain) and frozen (ice, snow and graupel) water path
+    maps (time, y, x) in kg m-2 of the whole domain, phases as in
+    categories. The layer heights are taken from PH/PHB of every time step
+    (or of time step height_time), and the domain is processed in chunks
+    of time_chunk time steps, so the memory is bounded by one chunk.
     
-    # Calculate water path (vertically integrated water content) for all hydrometeor categories:
-    CWP = water_path(wrfout, "QCLOUD",lat,lon,max_level,start_time,end_time)
-    RWP = water_path(wrfout, "QRAIN",lat,lon,max_level,start_time,end_time)
+    If output_file is given, LWP and IWP are written to this NetCDF file
+    (chunk by chunk).
+    
+    Returns a dictionary with LWP and IWP.
+    """
+    names = tuple(categories)
+    time_steps = np.arange(len(wrfout.dimensions["Time"]))[start_time:end_time]
+    state = ws.WRFState(wrfout)
+    domain = (slice(None),slice(None))
+    
+    if output_file is not None:
+        output = domain_output(wrfout,output_file,time_steps,
+                               {"LWP": "liquid water path (cloud droplets and rain)",
+                                "IWP": "ice water path (ice, snow and graupel)"})
+    
+    maps = {name: [] for name in ("LWP","IWP")}
+    for i,t0,t1 in time_chunks(time_steps,time_chunk):
+        slab = (t0,t1,max_level)+domain
+        q,N = category_fields(state,slab,names)
+        WC = np.ma.filled(q*state.air_density(*slab)[None],0.)
+        WP = integrate.trapezoid(WC,x=heights(state,slab,height_time)[None],axis=2)
+        
+        chunk = {'LWP': phase_sum(WP,names,'liquid'),
+                 'IWP': phase_sum(WP,names,'frozen')}
+        for name in maps:
+            maps[name].append(chunk[name])
+            if output_file is not None:
+                output[name][i:i+len(chunk[name])] = chunk[name]
+        state.clear()
+    
+    if output_file is not None:
+        output.close()
+    return {name: np.concatenate(values) for name,values in maps.items()}
 
-    # Calculate cloud optical depth for each hydrometeor category individually:
-    cod_cloud = cod_one_category(CWP, r_eff_cloud_vert_avg, 1000.)
-    cod_rain = cod_one_category(RWP, r_eff_rain_vert_avg, 1000.)
+def r_eff_domain(wrfout,output_file,start_time=144,end_time=-1,max_level=93,time_chunk=8,
+                 N_cloud=9.*1e+6,method='trapezoid'):
+    """
+    Effective radius fields (time, level, y, x) in m of all categories
+    (r_eff_cloud, r_eff_rain, ...) written to the compressed NetCDF file
+    output_file, masked where there is no mass or no particles. The domain
+    is processed in chunks of time_chunk time steps with every variable
+    read once per chunk. Cloud droplets as in nsd.r_eff_droplets, the other
+    categories as in nsd.r_eff_non_droplets.
+    """
+    names = tuple(categories)
+    time_steps = np.arange(len(wrfout.dimensions["Time"]))[start_time:end_time]
+    state = ws.WRFState(wrfout)
+    domain = (slice(None),slice(None))
     
-    # Make optical depth zero where there's no cloud (of given hydrometeor type):
-    cod_cloud = np.array(cod_cloud)
-    cod_cloud = np.where(cod_cloud=='--',0,cod_cloud)
-    cod_rain = np.array(cod_rain)
-    cod_rain = np.where(cod_rain=='--',0,cod_rain)
+    output = domain_output(wrfout,output_file,time_steps,
+                           {"r_eff_"+name: "effective radius of "+name for name in names},
+                           levels=min(max_level,len(wrfout.dimensions["bottom_top"])))
+    output.N_cloud = N_cloud
+    for name in names:
+        output["r_eff_"+name].units = 'm'
     
-    # Calculate total cloud optical depth and liquid and frozen/ice partition:
-    cod_liquid = cod_cloud + cod_rain
+    exponential = [k for k,name in enumerate(names) if categories[name]['distribution']=='exponential']
+    for i,t0,t1 in time_chunks(time_steps,time_chunk):
+        slab = (t0,t1,max_level)+domain
+        q,N = [np.ma.filled(x,0.) for x in category_fields(state,slab,names,N_cloud)]
+        
+        r_eff = np.zeros(q.shape,dtype=np.float32)
+        r_eff[exponential] = nsd.r_eff_non_droplets(N[exponential],q[exponential])
+        for k,name in enumerate(names):
+            if categories[name]['distribution']=='gamma':
+                r_eff[k] = nsd.r_eff_droplets(nsd.r_cloud_grid,N[k],q[k],np.asarray(state.pressure(*slab)),
+                                              np.asarray(state.temperature(*slab)),method)
+        
+        empty = nsd.empty_points(N,q)
+        for k,name in enumerate(names):
+            output["r_eff_"+name][i:i+len(r_eff[k])] = np.ma.masked_where(empty[k],r_eff[k])
+        state.clear()
     
-    return cod_liquid
+    output.close()
+
+def tau_cloud_domain(wrfout,start_time=144,end_time=-1,max_level=93,time_chunk=8,
+                     N_cloud=9.*1e+6,height_time=288,output_file=None,method='trapezoid'):
+    """
+    Cloud optical depth maps (time, y, x) of the whole domain, computed
+    like tau_cloud for every column, but with every variable read only once
+    per chunk of time steps (instead of once per column and category).
+    
+    Optical depth is zero where there is no cloud of a given category
+    (water path or effective radius zero or undefined).
+    
+    If output_file is given, the total, liquid and frozen optical depth are
+    written to this NetCDF file (chunk by chunk).
+    
+    Returns a dictionary with cod_tot, cod_liquid and cod_frozen.
+    """
+    names = tuple(categories)
+    time_steps = np.arange(len(wrfout.dimensions["Time"]))[start_time:end_time]
+    state = ws.WRFState(wrfout)
+    domain = (slice(None),slice(None))
+    
+    if output_file is not None:
+        output = domain_output(wrfout,output_file,time_steps,
+                               {"cod_tot": "total shortwave cloud optical depth",
+                                "cod_liquid": "shortwave cloud optical depth of cloud droplets and rain",
+                                "cod_frozen": "shortwave cloud optical depth of ice, snow and graupel"})
+    
+    maps = {name: [] for name in ("cod_tot","cod_liquid","cod_frozen")}
+    for i,t0,t1 in time_chunks(time_steps,time_chunk):
+        with warnings.catch_warnings(), np.errstate(divide='ignore',invalid='ignore'):
+            warnings.simplefilter('ignore',RuntimeWarning)
+            WP,r_eff,cod = [np.ma.filled(x,np.nan) for x in
+                            stacked_optical_depth(state,(t0,t1,max_level)+domain,names,N_cloud,height_time,method)]
+        cod = np.where((WP > 0) & (r_eff > 0) & np.isfinite(cod),cod,0.)
+        
+        chunk = {'cod_liquid': phase_sum(cod,names,'liquid'),
+                 'cod_frozen': phase_sum(cod,names,'frozen')}
+        chunk['cod_tot'] = chunk['cod_liquid'] + chunk['cod_frozen']
+        for name in maps:
+            maps[name].append(chunk[name])
+            if output_file is not None:
+                output[name][i:i+len(chunk[name])] = chunk[name]
+        state.clear()
+    
+    if output_file is not None:
+        output.close()
+    return {name: np.concatenate(values) for name,values in maps.items()}
     
 if __name__=="__main__":
     
@@ -172,6 +351,20 @@ if __name__=="__main__":
     # wrfOutputFile = Dataset("/nird/projects/NS9600K/brittsc/240131_WRF_NYA_T-4_corrected_SST/wrfout_d03_2019-11-11_12:00:00")
     # wrfOutputFile = Dataset("/nird/projects/NS9600K/brittsc/240209_Morr2_T+6_corrected_SST/wrfout_d03_2019-11-11_12:00:00")
 
+    # sensitivity of r_eff and liquid optical depth to the droplet number concentration (20 values, one call):
+    # sweep = N_cloud_sweep(wrfOutputFile,np.linspace(1e+6,1e+8,20),lat=60,lon=55)
+    # for N,cod in zip(sweep['N_cloud'],sweep['cod_liquid']):
+    #     print("N_cloud: %.3g m-3, mean cod_liquid: %.3f" % (N,np.nanmean(cod)))
+    
+    # effective radius fields of all categories (see r_eff_product.py for all experiments):
+    # r_eff_domain(wrfOutputFile,"/nird/projects/NS9600K/brittsc/240128_CTRL_corrected_SST/reff_d03_2019-11-11_12:00:00.nc")
+    
+    # full domain maps of liquid and ice water path with the heights of every time step:
+    # wp_maps = water_path_domain(wrfOutputFile,start_time=144,output_file="/nird/projects/NS9600K/brittsc/240128_CTRL_corrected_SST/wp_d03_2019-11-11_12:00:00.nc")
+    
+    # full domain maps of total, liquid and frozen optical depth in one read pass:
+    # cod_maps = tau_cloud_domain(wrfOutputFile,start_time=144,output_file="/nird/projects/NS9600K/brittsc/240128_CTRL_corrected_SST/cod_d03_2019-11-11_12:00:00.nc")
+
     # cod_tot = np.zeros((288,100,100))
     # cod_liquid = np.zeros((288,100,100))
     # cod_frozen = np.zeros((288,100,100))
@@ -185,6 +378,8 @@ if __name__=="__main__":
     # cod_tot=tau_cloud(wrfOutputFile,lat=60,lon=55)[0]
     # cod_liquid=tau_cloud(wrfOutputFile,lat=60,lon=55)[1]
     # cod_frozen=tau_cloud(wrfOutputFile,lat=60,lon=55)[2]
+    # droplet r_eff from the 34-point trapezoid over nsd.r_cloud_grid as for Table S1 (method='analytic' is the
+    # exact closed form, up to 0.4% different):
     cod_tot,cod_cloud,cod_ice,cod_liquid,cod_frozen,CWP,RWP,IWP,SWP,GWP,r_eff_cloud_vert_avg,r_eff_rain_vert_avg,r_eff_ice_vert_avg,r_eff_snow_vert_avg,r_eff_graupel_vert_avg = tau_cloud(wrfOutputFile,start_time=144,lat=60,lon=55)
     
     
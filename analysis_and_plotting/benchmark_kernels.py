@@ -0,0 +1,142 @@
+"""Microbenchmark of the numerical hot spots of the analysis on synthetic
+arrays: the droplet effective radius vertical average of Table_S1.py
+(per-point trapezoid loop as previously done, vectorised trapezoid and
+analytic), the per-grid-point lag-1 autocorrelation loop (sm.tsa.acf) of
+functions.lag_corrected_std_err (var_std_err_lag_corr in
+Fig_S4-5_and_S7-8.py) and the cloud base search loop of
+functions.cloud_base_height (make_plot in Fig_4.py), for the 'realistic' or
+'stress' size.
+
+Time (fastest of repeats) and peak memory (tracemalloc) of every kernel are
+compared to a stored baseline (written on the first run or with
+update_baseline = True); kernels slower or larger than the baseline by more
+than the tolerance are reported as regression and the script exits with
+status 1."""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import functions as fct
+import number_size_distributions as nsd
+import r_eff_reference as rer
+import Table_S1
+
+size = 'realistic'
+baseline_file = "/nird/projects/NS9600K/brittsc/plots_PGW_paper/benchmark_kernels_baseline.json"
+update_baseline = False
+# allowed relative increase of time and peak memory before a regression is reported:
+tolerance = {'time': 0.3, 'peak_memory': 0.1}
+repeats = 3
+N_cloud = 9.*1e+6 #in m-3
+
+# array shapes per kernel: r_eff (time, level[, y, x]), acf (time, y, x) and
+# cloud_base (time, level[, y, x]); None skips the kernel:
+sizes = {'realistic': {'r_eff_loop': (144,93), 'r_eff_trapezoid': (144,93), 'r_eff_analytic': (144,93),
+                       'acf_loop': (145,100,100), 'cloud_base_loop': (288,94)},
+         'stress': {'r_eff_loop': None, 'r_eff_trapezoid': (144,93,6,6), 'r_eff_analytic': (144,93,30,30),
+                    'acf_loop': (289,200,200), 'cloud_base_loop': (288,94,20,20)}}
+
+
+def ar1_field(shape, rng, phi=0.6):
+    """
+    Lag-1 autocorrelated time series (time, y, x), like 10 min output of a
+    radiation variable.
+    """
+    data = np.zeros(shape)
+    noise = rng.normal(0.,10.,shape)
+    for i in range(1,shape[0]):
+        data[i] = phi*data[i-1]+noise[i]
+    return data+200.
+
+def cloud_profiles(shape, rng):
+    """
+    Cloud water content (time, level[, y, x]), zero below a random cloud
+    base level, and staggered heights H (level+1) in m.
+    """
+    level = np.arange(shape[1]).reshape((1,shape[1])+(1,)*(len(shape)-2))
+    base = rng.integers(2,30,(shape[0],1)+shape[2:])
+    CWC = np.where(level>=base,rng.uniform(1e-5,1e-4,shape)*(level-base+1),0.)
+    H = np.cumsum(np.linspace(20.,400.,shape[1]+1))-20.
+    return CWC,H
+
+def r_eff_loop(q, P, T):
+    """
+    Per-point trapezoid integration and vertical mean as previously done in
+    Table_S1.vertical_average_r_eff_droplets.
+    """
+    return np.nanmean(rer.loop_r_eff(nsd.r_cloud_grid,N_cloud,q,P,T),axis=1)
+
+def kernel(name, shape, rng):
+    """
+    Kernel name on synthetic arrays of the given shape, as function without
+    arguments (the arrays are created beforehand).
+    """
+    if name.startswith('r_eff'):
+        q,P,T = rer.synthetic_cloud_fields(shape,rng)
+        if name == 'r_eff_loop':
+            return lambda: r_eff_loop(q,P,T)
+        method = name[len('r_eff_'):]
+        return lambda: Table_S1.vertical_average_r_eff_droplets(None,None,None,None,None,nsd.r_cloud_grid,
+                                                                N_cloud,q,P,T,method=method)
+    if name == 'acf_loop':
+        data = ar1_field(shape,rng)
+        return lambda: fct.lag_corrected_std_err(data)
+    CWC,H = cloud_profiles(shape,rng)
+    return lambda: fct.cloud_base_height(CWC,H)
+
+def measure(function):
+    """
+    Fastest time of repeats runs in seconds and peak memory in MB of one
+    (separate) run.
+    """
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]/1e6
+    tracemalloc.stop()
+    return {'time': min(times), 'peak_memory': peak_memory}
+
+rng = np.random.default_rng(0)
+results = {}
+for name,shape in sizes[size].items():
+    if shape is not None:
+        results[name] = dict(measure(kernel(name,shape,rng)),shape=list(shape))
+
+baselines = {}
+if os.path.exists(baseline_file):
+    with open(baseline_file) as f:
+        baselines = json.load(f)
+baseline = baselines.get(size,{})
+
+regressions = []
+print("size:", size, "; baseline:", baseline_file if baseline else "none")
+print("%-16s %-18s %10s %10s %12s %10s" % ("kernel","shape","time [s]","vs. base","peak [MB]","vs. base"))
+for name,result in results.items():
+    ratios = {}
+    for quantity in ('time','peak_memory'):
+        if name in baseline and baseline[name]['shape'] == result['shape'] and baseline[name][quantity] > 0:
+            ratios[quantity] = result[quantity]/baseline[name][quantity]
+            if ratios[quantity] > 1+tolerance[quantity]:
+                regressions.append((name,quantity,ratios[quantity]))
+    print("%-16s %-18s %10.4f %10s %12.2f %10s" % (name,"x".join(str(n) for n in result['shape']),
+          result['time'],"%.2f" % ratios['time'] if 'time' in ratios else "-",
+          result['peak_memory'],"%.2f" % ratios['peak_memory'] if 'peak_memory' in ratios else "-"))
+
+if update_baseline or not baseline:
+    baselines[size] = results
+    os.makedirs(os.path.dirname(baseline_file),exist_ok=True)
+    with open(baseline_file,'w') as f:
+        json.dump(baselines,f,indent=2)
+    print("baseline written: "+baseline_file)
+elif regressions:
+    for name,quantity,ratio in regressions:
+        print("REGRESSION: %s %s %.2f times the baseline" % (name,quantity,ratio))
+    sys.exit(1)
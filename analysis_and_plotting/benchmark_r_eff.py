@@ -0,0 +1,69 @@
+"""Benchmark and accuracy report of the droplet effective radius: per-point
+trapezoid integration on the 34-point radius grid (as previously done in
+Table_S1.py), vectorised trapezoid (reference mode) and the closed form
+(mu+3)/(2*lam) for a Ny-Ålesund column (time, level)"""
+
+import time
+
+import numpy as np
+from netCDF4 import Dataset
+import number_size_distributions as nsd
+import r_eff_reference as rer
+import Table_S1
+
+# wrfout file to take the column from, None for a synthetic column:
+wrfout_file = None
+# wrfout_file = "/nird/projects/NS9600K/brittsc/240128_CTRL_corrected_SST/wrfout_d03_2019-11-11_12:00:00"
+lat, lon, start_time, end_time, max_level = 60, 55, 144, -1, 93
+N_cloud = 9.*1e+6 #in m-3
+r_cloud = nsd.r_cloud_grid
+# fine radius grid (up to 1 mm in 10 nm steps) for the integration error:
+r_fine = np.arange(0,1e-3,1e-8)
+
+def column(wrfout_file):
+    if wrfout_file is not None:
+        wrfout = Dataset(wrfout_file)
+        P = wrfout.variables["P"][start_time:end_time,:max_level,lat,lon]+wrfout.variables["PB"][start_time:end_time,:max_level,lat,lon]
+        pot_T = wrfout.variables["T"][start_time:end_time,:max_level,lat,lon]+300
+        T = pot_T*(P/100000)**0.2854
+        q = wrfout.variables["QCLOUD"][start_time:end_time,:max_level,lat,lon]
+        return np.asarray(q),np.asarray(P),np.asarray(T)
+
+    return rer.synthetic_cloud_fields((143,max_level),np.random.default_rng(0))
+
+def timed(function, repeats=3):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter()-start)
+    return min(times),result
+
+q,P,T = column(wrfout_file)
+cloudy = q > 0
+
+t_loop,r_loop = timed(lambda: rer.loop_r_eff(r_cloud,N_cloud,q,P,T),repeats=1)
+t_trapezoid,r_trapezoid = timed(lambda: nsd.r_eff_droplets(r_cloud,N_cloud,q,P,T,method='trapezoid'))
+t_analytic,r_analytic = timed(lambda: nsd.r_eff_droplets(r_cloud,N_cloud,q,P,T,method='analytic'))
+
+# fine-grid integration of a sample of cloudy points (exact up to ~1e-6):
+sample = np.flatnonzero(cloudy)[:200]
+r_fine_sample = nsd.r_eff_droplets(r_fine,N_cloud,q.flat[sample],P.flat[sample],T.flat[sample])
+
+def relative(a,b):
+    return np.abs(a-b)/np.abs(b)
+
+profile_trapezoid = Table_S1.vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,r_cloud,N_cloud,q,P,T,method='trapezoid')
+profile_analytic = Table_S1.vertical_average_r_eff_droplets(start_time,end_time,max_level,lat,lon,r_cloud,N_cloud,q,P,T,method='analytic')
+
+print("column:", "synthetic" if wrfout_file is None else wrfout_file, np.shape(q), "cloudy points:", cloudy.sum())
+print("time per-point loop:        %8.4f s" % t_loop)
+print("time vectorised trapezoid:  %8.4f s (speedup %.0f)" % (t_trapezoid,t_loop/t_trapezoid))
+print("time analytic:              %8.4f s (speedup %.0f)" % (t_analytic,t_loop/t_analytic))
+print("loop vs vectorised trapezoid, max. rel. difference: %.2g" % np.nanmax(relative(r_trapezoid[cloudy],r_loop[cloudy])))
+print("analytic vs 34-point trapezoid, rel. difference: median %.2g, max. %.2g"
+      % (np.median(relative(r_analytic[cloudy],r_trapezoid[cloudy])),np.max(relative(r_analytic[cloudy],r_trapezoid[cloudy]))))
+print("analytic vs fine-grid trapezoid (sample), max. rel. difference: %.2g"
+      % np.max(relative(r_analytic.flat[sample],r_fine_sample)))
+print("vertical average r_eff (and COD), analytic vs 34-point trapezoid, max. rel. difference: %.2g"
+      % np.nanmax(relative(profile_analytic,profile_trapezoid)))
@@ -1,3 +1,4 @@
+import numpy as np
 import seaborn as sns
 
 def plotstyle_serif():
@@ -24,3 +25,78 @@ def plotstyle_sansserif():
                        )
     sns.set_palette("colorblind")
 # plotstyle_sansserif()
+
+
+def lag_corrected_std_err(data):
+    """
+    Lag-1 autocorrelation and standard error of the time mean per grid
+    point, corrected for the lag-1 correlation of the time series.
+
+    Parameters
+    ----------
+    data : numpy array (3D)
+        Time series (time, y, x), e.g. of OLR or GLW.
+
+    Returns
+    -------
+    r1 : numpy array (2D)
+        Lag-1 autocorrelation.
+    SE : numpy array (2D)
+        Standard error of the time mean, corrected for lag-correlation.
+
+    """
+    # only needed here, not by the plot styles every figure script uses:
+    import statsmodels.api as sm
+
+    avg = np.mean(data,axis=0)
+
+    # Standard deviation of variable at each grid point:
+    sigma = np.std(data,axis=0)
+    
+    # lag-1 autocorrelation
+    lags = [0,1,2]
+    
+    r1 = np.zeros_like(avg)
+    SE = np.zeros_like(avg)
+    
+    for i in range(np.shape(avg)[0]):
+        for j in range(np.shape(avg)[1]):
+            acorr = sm.tsa.acf(data[:,i,j], nlags = len(lags)-1)
+            r1[i,j] = acorr[1]
+    
+            # standard error:
+            N = np.shape(data)[0]
+            A = (1 + acorr[1])/(1 - acorr[1])# =N/N_eff
+            SE[i,j] = sigma[i,j]/np.sqrt(N)*np.sqrt(A)
+    return r1,SE
+
+
+def cloud_base_height(CWC,H,levels=40):
+    """
+    Cloud base height per time step: height of the first level (from the
+    ground) at which the cloud water content increases.
+
+    Parameters
+    ----------
+    CWC : numpy array
+        Cloud water content (time, level[, y, x]).
+    H : numpy array
+        Heights of the (staggered) levels in m.
+    levels : int, optional
+        Number of lowest levels searched. The default is 40.
+
+    Returns
+    -------
+    cloud_base : numpy array
+        Cloud base height in m (time[, y, x]), 0 if no increase is found.
+
+    """
+    columns = CWC.reshape(CWC.shape[:2]+(-1,))
+    cloud_base = np.zeros((CWC.shape[0],columns.shape[2]))
+    for k in range(columns.shape[2]):
+        for i in range(CWC.shape[0]):
+            for j in np.arange(0,levels):
+                if columns[i,j+1,k]-columns[i,j,k]>0:
+                    cloud_base[i,k] = H[j]
+                    break
+    return cloud_base.reshape((CWC.shape[0],)+CWC.shape[2:])
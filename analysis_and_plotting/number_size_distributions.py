@@ -9,54 +9,121 @@ concentration N and mass mixing ratio q, in first order for cloud droplets only.
 """
 
 import numpy as np, matplotlib.pyplot as plt
-from scipy.special import gamma
+from scipy.special import gammaln
 import scipy.integrate as integrate
 from netCDF4 import Dataset
 
+# radius grid (m) of the droplet r_eff integration in Table_S1.py:
+r_cloud_grid = np.array([0,5e-7,1e-6,2e-6,3e-6,4e-6,6e-6,8e-6,1e-5,1.4e-5,
+                         1.8e-5,2.2e-5,2.6e-5,3.1e-5,3.6e-5,4.1e-5,4.7e-5,
+                         5.3e-5,5.9e-5,6.5e-5,7.2e-5,7.9e-5,8.6e-5,9.4e-5,
+                         1.2e-4,2.0e-4,2.8e-4,3.7e-4,4.6e-4,5.4e-4,6.4e-4,
+                         7.4e-4,8.6e-4,1e-3])
+
 
 def shape_parameter(N,p,T):
     """
     N: cloud droplet number concentration
     p: pressure (in Pa)
     T: temperature
+    
+    Works on scalars and on whole fields, e.g. (time, level, y, x).
     """
     rho_air = p/(287.15*T)
     PGAM=0.0005714*(N/1e+6*rho_air)+0.2714
     PGAM=1./(PGAM**2)-1.
-    PGAM=max(PGAM,2.)
-    PGAM=min(PGAM,10.)
+    PGAM=np.clip(PGAM,2.,10.)
     return PGAM
 
+def empty_points(N,q):
+    """
+    True where there is no mass or no particles (q <= 0 or N <= 0), i.e.
+    no size distribution.
+    """
+    return (np.asarray(q)<=0) | (np.asarray(N)<=0)
+
 def lambda_cloud(N,q,mu):
+    """
+    Slope parameter (m-1) of the gamma distribution, broadcast over N, q
+    and mu. Gamma(mu+d+1)/Gamma(mu+1) is taken from log-gamma, so large mu
+    does not overflow. Points without mass or particles (see empty_points)
+    get lam = inf (no particles, N_0 = 0 and r_eff = 0) without division
+    warnings. For masked input (netCDF4 variables) these points are masked
+    instead, as the masked division did before, so that means over levels
+    (e.g. of r_eff_non_droplets in Table_S1.py) only include levels with
+    particles.
+    """
     rho_w = 997.
     c = rho_w*np.pi/6
     d = 3.
-    a = c*N*gamma(mu+d+1)
-    b = q*gamma(mu+1)
-    e = (a/b)**(1/d)
+    empty = empty_points(N,q)
+    N_safe = np.where(empty,1.,N)
+    q_safe = np.where(empty,1.,q)
+    log_e = (np.log(c*N_safe/q_safe)+gammaln(mu+d+1)-gammaln(mu+1))/d
+    e = np.where(empty,np.inf,np.exp(log_e))
+    if np.ma.isMaskedArray(N) or np.ma.isMaskedArray(q):
+        e = np.ma.masked_where(empty|np.ma.getmaskarray(N)|np.ma.getmaskarray(q),e)
     return e
 
+def log_N_0(N,lam,mu):
+    """
+    Natural logarithm of the intercept parameter N*lam**(mu+1)/Gamma(mu+1),
+    -inf where lam is inf or N is zero (no particles).
+    """
+    empty = ~np.isfinite(lam) | (np.asarray(N)<=0)
+    lam_safe = np.where(empty,1.,lam)
+    N_safe = np.where(empty,1.,N)
+    log_N_0 = np.log(N_safe)+(mu+1)*np.log(lam_safe)-gammaln(mu+1)
+    return np.where(empty,-np.inf,log_N_0)
+
 def N_0(N,lam,mu):
-    N_0 = N*lam**(mu+1)/gamma(mu+1)
+    """
+    Intercept parameter, zero where there are no particles (inf only if it
+    exceeds the float range, use log_N_0 then).
+    """
+    with np.errstate(over='ignore'):
+        N_0 = np.exp(log_N_0(N,lam,mu))
     return N_0
 
+def psd_parameters(N,q,p,T):
+    """
+    Shape (mu), slope (lam) and intercept (N_0) parameter of the cloud
+    droplet size distribution for scalars or whole fields in one call.
+    """
+    mu = shape_parameter(N,p,T)
+    lam = lambda_cloud(N,q,mu)
+    return mu,lam,N_0(N,lam,mu)
+
 def number_size_distribution(D,N,q,p,T):
     """
     Input:
-        D: droplet diameter in m
+        D: droplet diameter in m (1D array or scalar)
         N: droplet number concentration in m-3
         q: cloud water mixing ratio in kg kg-1
         p: pressure in Pa
         T: temperature in Kelvin
     
+    N, q, p and T can be scalars or fields of the same shape, e.g.
+    (time, level, y, x); the diameters are then added as last dimension.
+    
     Output:
-        N: cloud droplet size distribution in micrometer-1 m-3
+        N: cloud droplet size distribution in micrometer-1 m-3 (zero for
+        points without cloud water)
     """
     mu = shape_parameter(N,p,T)
     lam = lambda_cloud(N,q,mu)
-    N_zero = N_0(N,lam,mu)
-    N = N_zero*np.exp(-lam*D)*(D**mu)*1e-6
-    print("mu: ", mu, "; lam: ", lam, "; N_0: ", N_zero)
+    log_N_zero = log_N_0(N,lam,mu)
+    if np.ndim(mu)==0:
+        print("mu: ", mu, "; lam: ", lam, "; N_0: ", N_0(N,lam,mu))
+    else:
+        mu,lam,log_N_zero = mu[...,None],lam[...,None],log_N_zero[...,None]
+    
+    # evaluated in log space, zero for D = 0 (mu >= 2) and without cloud water:
+    D = np.asarray(D,dtype=float)
+    positive = (D>0) & np.isfinite(log_N_zero)
+    D_safe = np.where(positive,D,1.)
+    log_N = np.where(positive,log_N_zero,0.)-np.where(positive,lam,0.)*D_safe+mu*np.log(D_safe)
+    N = np.where(positive,np.exp(log_N),0.)*1e-6
     return N
 
 def r_eff_non_droplets(N,q):
@@ -79,15 +146,54 @@ def integrand_B(r,N,q,p,T):
         # print("N_zero: ", N_zero, ", lam: ", lam, ", mu: ", mu)
     return C
 
-def r_eff_droplets(r,N,q,p,T):
+def r_eff_droplets(r,N,q,p,T,method='trapezoid',chunk_size=65536):
+    """
+    Effective radius (m) of the cloud droplets, ratio of the third to the
+    second moment of the size distribution.
+    
+    method 'trapezoid' (reference): numerical integration over the radius
+    grid r (along the last dimension for fields of N, q, p and T);
+    method 'analytic': closed form of the gamma distribution (see
+    r_eff_droplets_analytic), r is not used.
+    Points without cloud water give NaN for fields; the cloudy points are
+    integrated in blocks of chunk_size points, so the memory does not grow
+    with the field size times len(r).
+    """
+    if method == 'analytic':
+        return r_eff_droplets_analytic(N,q,p,T)
+    
     # A = integrate.quad(integrand_A, 0, np.inf, args=(N,q,p,T))[0]
     # B = integrate.quad(integrand_B, 0, np.inf, args=(N,q,p,T))[0]
     
-    A = integrate.trapezoid(integrand_A(r, N, q, p, T),x=r)
-    B = integrate.trapezoid(integrand_B(r, N, q, p, T),x=r)
-    # print(A,B)
-    return A/B
+    if np.ndim(q)==0:
+        A = integrate.trapezoid(integrand_A(r, N, q, p, T),x=r)
+        B = integrate.trapezoid(integrand_B(r, N, q, p, T),x=r)
+        # print(A,B)
+        return A/B
+    
+    N,q,p,T = np.broadcast_arrays(*[np.asarray(x,dtype=float) for x in (N,q,p,T)])
+    shape = q.shape
+    N,q,p,T = [x.ravel() for x in (N,q,p,T)]
+    r_eff = np.full(q.shape,np.nan)
+    cloudy = np.flatnonzero(~empty_points(N,q))
+    for start in range(0,len(cloudy),chunk_size):
+        k = cloudy[start:start+chunk_size]
+        with np.errstate(invalid='ignore',divide='ignore'):
+            A = integrate.trapezoid(integrand_A(r, N[k,None], q[k,None], p[k,None], T[k,None]),x=r,axis=-1)
+            B = integrate.trapezoid(integrand_B(r, N[k,None], q[k,None], p[k,None], T[k,None]),x=r,axis=-1)
+            r_eff[k] = A/B
+    return r_eff.reshape(shape)
 
+def r_eff_droplets_analytic(N,q,p,T):
+    """
+    Effective radius (m) of the cloud droplets in closed form: for the
+    gamma distribution N_0*D**mu*exp(-lam*D) with D = 2r the ratio of the
+    third to the second moment in r is (mu+3)/(2*lam). Vectorised over
+    whole fields, NaN where there is no cloud water.
+    """
+    mu = shape_parameter(N,p,T)
+    lam = lambda_cloud(N,q,mu)
+    return np.where(empty_points(N,q),np.nan,(mu+3)/(2*lam))
 
 if __name__ == "__main__":
     
@@ -0,0 +1,167 @@
+"""Moments of the hydrometeor number size distributions (number, area, mass,
+6th moment, ...) over whole fields by quadrature on a fixed diameter grid.
+
+Each category has its own default (D_grids): cloud droplets are integrated
+on a log-spaced grid from 10 nm to 5 mm, the exponential categories (rain,
+ice, snow, graupel) use the closed form of analytic_moments, as their size
+distributions reach far beyond any grid fitting the droplets. An explicit
+grid D gives quadrature for any category, e.g. D_cloud_grid for the moments
+behind the droplet r_eff of Table_S1.py (psd_moments_check.py reports the
+accuracy of all of them).
+
+The quadrature weights of a grid (trapezoid weights times D**k for every
+requested moment order k) are computed once and cached, so any set of
+moments for any number of points is one matrix product of the size
+distribution evaluated on the grid with the weight matrix. The size
+distribution itself is evaluated in log space as one matrix product as
+well, only for points with mass and particles, and in chunks of points so
+that the memory stays bounded."""
+
+import numpy as np
+from scipy.special import gammaln
+import number_size_distributions as nsd
+
+# moment orders (in diameter) by name:
+moment_orders = {'number': 0, 'area': 2, 'mass': 3, 'reflectivity': 6}
+
+# diameter grid (m) of the radius grid in Table_S1.py:
+D_cloud_grid = 2*nsd.r_cloud_grid
+
+# droplet diameter grid (m), within 0.3 % of the closed form for N = 1e6 to
+# 3e8 m-3 and q = 1e-9 to 1e-3 kg kg-1:
+D_droplet_grid = np.concatenate([[0.],np.logspace(-8,np.log10(5e-3),100)])
+
+# default diameter grid per category, None for the closed form:
+D_grids = {'cloud': D_droplet_grid, 'rain': None, 'ice': None, 'snow': None, 'graupel': None}
+
+_weights = {}
+
+
+def quadrature_weights(D,orders):
+    """
+    D: diameter grid in m (increasing)
+    orders: moment orders k
+
+    Output:
+        W: (len(D), len(orders)) trapezoid weights times D**k, cached per
+        grid and orders
+    """
+    D = np.asarray(D,dtype=float)
+    orders = tuple(float(k) for k in orders)
+    key = (D.tobytes(),orders)
+    if key not in _weights:
+        dD = np.diff(D)
+        w = np.zeros(len(D))
+        w[:-1] += dD/2
+        w[1:] += dD/2
+        _weights[key] = w[:,None]*np.power(D[:,None],np.array(orders)[None,:])
+    return _weights[key]
+
+def category_parameters(category,N,q,p=None,T=None):
+    """
+    Shape (mu), slope (lam) and log intercept (log N_0) of the gamma size
+    distribution in diameter: cloud droplets with the shape parameter of
+    nsd.shape_parameter (needs p and T), rain, ice, snow and graupel
+    exponential (mu = 0) as in nsd.r_eff_non_droplets.
+    """
+    if category == 'cloud':
+        mu = nsd.shape_parameter(N,p,T)
+    else:
+        mu = np.zeros(np.broadcast(N,q).shape)
+    lam = nsd.lambda_cloud(N,q,mu)
+    return mu,lam,nsd.log_N_0(N,lam,mu)
+
+def _grid_terms(D,orders):
+    """
+    Basis (1, log D, -D) of log n(D) on the grid points D > 0, their
+    quadrature weights and the weights of D = 0.
+    """
+    W = quadrature_weights(D,orders)
+    D = np.asarray(D,dtype=float)
+    positive = D>0
+    basis = np.stack([np.ones(positive.sum()),np.log(D[positive]),-D[positive]])
+    return basis,W[positive],W[~positive].sum(axis=0)
+
+def _point_moments(mu,lam,log_N_0,basis,W_positive,W_zero):
+    """
+    Moments of points with particles (1D parameters): log n(D) = log_N_0 +
+    mu*log(D) - lam*D as one matrix product, then the moments as a second.
+    """
+    parameters = np.stack([log_N_0,mu,lam],axis=1)
+    M = np.exp(parameters@basis)@W_positive
+    # n(0) = N_0 for mu = 0, 0 for mu > 0:
+    mu_zero = mu==0
+    M[mu_zero] += np.exp(log_N_0[mu_zero])[:,None]*W_zero[None,:]
+    return M
+
+def moments_from_parameters(mu,lam,log_N_0,D,orders,chunk_size=65536):
+    """
+    mu, lam, log_N_0: size distribution parameters (any shape, broadcast)
+    D: diameter grid in m
+    orders: moment orders k
+    chunk_size: number of points evaluated at once
+
+    Output:
+        M: moments (shape of the parameters + (len(orders),)), integral of
+        D**k*N_0*D**mu*exp(-lam*D) over the grid; zero for points without
+        particles (log_N_0 = -inf)
+    """
+    mu,lam,log_N_0 = np.broadcast_arrays(*[np.asarray(x,dtype=float) for x in (mu,lam,log_N_0)])
+    shape = mu.shape
+    mu,lam,log_N_0 = mu.ravel(),lam.ravel(),log_N_0.ravel()
+    terms = _grid_terms(D,orders)
+
+    M = np.zeros((mu.size,len(orders)))
+    points = np.flatnonzero(np.isfinite(log_N_0))
+    for start in range(0,len(points),chunk_size):
+        index = points[start:start+chunk_size]
+        M[index] = _point_moments(mu[index],lam[index],log_N_0[index],*terms)
+    return M.reshape(shape+(len(orders),))
+
+def psd_moments(category,N,q,p=None,T=None,orders=(0,2,3,6),D=None,chunk_size=65536):
+    """
+    category: 'cloud', 'rain', 'ice', 'snow' or 'graupel'
+    N: number concentration in m-3 (scalar or field)
+    q: mixing ratio in kg kg-1 (field, e.g. (time, level, y, x))
+    p, T: pressure in Pa and temperature in K (cloud droplets only)
+    orders: moment orders k or names of moment_orders
+    D: diameter grid in m, None for the default of the category (D_grids)
+    chunk_size: number of points evaluated at once
+
+    Output:
+        M: moments in m^k m-3 (shape of q + (len(orders),), float32 for
+        float32 input); only points with mass and particles are evaluated,
+        and the size distribution parameters are computed per chunk, so
+        the memory besides input and output is bounded by chunk_size
+    """
+    orders = [moment_orders[k] if isinstance(k,str) else k for k in orders]
+    q = np.asarray(q)
+    N,q,p,T = np.broadcast_arrays(N,q,1. if p is None else p,1. if T is None else T)
+    if D is None:
+        D = D_grids[category]
+    terms = None if D is None else _grid_terms(D,orders)
+
+    M = np.zeros(q.shape+(len(orders),),dtype=np.result_type(q.dtype,np.float32))
+    M_points = M.reshape(-1,len(orders))
+    points = np.flatnonzero(~nsd.empty_points(N,q))
+    for start in range(0,len(points),chunk_size):
+        index = points[start:start+chunk_size]
+        where = np.unravel_index(index,q.shape)
+        mu,lam,log_N_0 = category_parameters(category,*[x[where].astype(float) for x in (N,q,p,T)])
+        if terms is None:
+            M_points[index] = analytic_moments(mu,lam,log_N_0,orders)
+        else:
+            M_points[index] = _point_moments(mu,lam,log_N_0,*terms)
+    return M
+
+def analytic_moments(mu,lam,log_N_0,orders):
+    """
+    Moments of the gamma distribution integrated from 0 to infinity,
+    N_0*Gamma(mu+k+1)/lam**(mu+k+1), as reference for the quadrature.
+    """
+    mu,lam,log_N_0 = [np.asarray(x,dtype=float)[...,None] for x in np.broadcast_arrays(mu,lam,log_N_0)]
+    k = np.asarray(orders,dtype=float)
+    empty = ~np.isfinite(log_N_0) | ~np.isfinite(lam)
+    lam_safe = np.where(empty,1.,lam)
+    log_M = np.where(empty,0.,log_N_0)+gammaln(mu+k+1)-(mu+k+1)*np.log(lam_safe)
+    return np.where(empty,0.,np.exp(log_M))
@@ -0,0 +1,57 @@
+"""Check of psd_moments against the closed form analytic_moments for every
+hydrometeor category over a range of number concentrations and mixing
+ratios, moment orders 0, 2, 3 and 6:
+
+- quadrature of every category on a fine diameter grid (0 to 1 m, 4000
+  log-spaced points) must match the closed form within the tolerance,
+- the default of every category (closed form for rain, ice, snow and
+  graupel, pm.D_droplet_grid for cloud droplets) must match it within the
+  tolerance of the category.
+
+The deviation of the 34-point grid of Table_S1.py (D_cloud_grid, used for
+the droplet r_eff) is reported as well, but not checked.
+
+Failures are reported and the script exits with status 1."""
+
+import sys
+
+import numpy as np
+import psd_moments as pm
+
+orders = (0,2,3,6)
+D_fine = np.concatenate([[0.],np.logspace(-9,0,4000)])
+tolerance_fine = 1e-3
+tolerance_default = {'cloud': 5e-3, 'rain': 1e-10, 'ice': 1e-10, 'snow': 1e-10, 'graupel': 1e-10}
+p, T = 85000., 265.
+
+# number concentrations (m-3) and mixing ratios (kg kg-1) per category:
+ranges = {'cloud':   (np.array([1e6,9e6,1e7,5e7,1e8,3e8]), np.logspace(-9,-3,13)),
+          'rain':    (np.logspace(0,5,6), np.logspace(-7,-3,9)),
+          'ice':     (np.logspace(2,7,6), np.logspace(-8,-4,9)),
+          'snow':    (np.logspace(1,6,6), np.logspace(-7,-3,9)),
+          'graupel': (np.logspace(0,5,6), np.logspace(-7,-3,9))}
+
+def relative(a,b):
+    return np.max(np.abs(a-b)/np.abs(b),axis=0)
+
+failures = []
+print("%-8s %-10s %s" % ("category","grid","max rel diff for orders "+str(orders)))
+for category,(N,q) in ranges.items():
+    N,q = [x.ravel() for x in np.meshgrid(N,q)]
+    reference = pm.analytic_moments(*pm.category_parameters(category,N,q,p,T),orders)
+    fine = pm.psd_moments(category,N,q,p,T,orders=orders,D=D_fine)
+    default = pm.psd_moments(category,N,q,p,T,orders=orders)
+    for grid,M,tolerance in [("fine",fine,tolerance_fine),("default",default,tolerance_default[category])]:
+        diff = relative(M,reference)
+        print("%-8s %-10s %s" % (category,grid," ".join("%9.2e" % d for d in diff)))
+        if np.any(diff > tolerance):
+            failures.append((category,grid))
+    if category == 'cloud':
+        M = pm.psd_moments(category,N,q,p,T,orders=orders,D=pm.D_cloud_grid)
+        print("%-8s %-10s %s (not checked)" % (category,"34-point"," ".join("%9.2e" % d for d in relative(M,reference))))
+
+if failures:
+    for category,grid in failures:
+        print("ACCURACY FAILURE: %s on the %s grid" % (category,grid))
+    sys.exit(1)
+print("psd_moments matches analytic_moments for all categories")
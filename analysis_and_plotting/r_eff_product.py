@@ -0,0 +1,30 @@
+"""Writes the effective radius fields (time, level, y, x) of cloud, rain, ice,
+snow and graupel of all PGW/INP/SIP experiments to reff_d03_*.nc next to the
+wrfout files (see Table_S1.r_eff_domain), so that radiation and microphysics
+diagnostics can read them instead of recomputing them; existing products
+are kept"""
+
+import os
+
+from netCDF4 import Dataset
+import Table_S1
+
+experiments = ["240131_WRF_NYA_T-4_corrected_SST","240216_NoSIP_T-4_corrected_SST",
+               "240131_WRF_NYA_T-2_corrected_SST","240815_NoSIP_T-2_corrected_SST",
+               "240128_CTRL_corrected_SST","240213_NoSIP_corrected_SST",
+               "240130_WRF_NYA_T+2_corrected_SST","240816_NoSIP_T+2_corrected_SST",
+               "240130_WRF_NYA_T+4_corrected_SST","240819_NoSIP_T+4_corrected_SST",
+               "240129_WRF_NYA_T+6_corrected_SST","240212_NoSIP_T+6_corrected_SST",
+               "240204_NoINP_corrected_SST","240204_MoreINP_corrected_SST"]
+directory = "/nird/projects/NS9600K/brittsc/"
+wrfout_name = "wrfout_d03_2019-11-11_12:00:00"
+
+for experiment in experiments:
+    output_file = directory+experiment+"/reff_d03_2019-11-11_12:00:00.nc"
+    if os.path.exists(output_file):
+        print('exists: '+output_file)
+        continue
+    wrfout = Dataset(directory+experiment+"/"+wrfout_name)
+    Table_S1.r_eff_domain(wrfout,output_file,start_time=144,end_time=-1,max_level=93)
+    wrfout.close()
+    print('written: '+output_file)
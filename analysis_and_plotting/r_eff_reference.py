@@ -0,0 +1,64 @@
+"""Shared fixture and reference of the droplet effective radius benchmarks
+(benchmark_r_eff.py, benchmark_kernels.py): a synthetic cloud column (or
+field) of cloud water mixing ratio, pressure and temperature, and the
+per-point trapezoid loop as previously done in Table_S1.py"""
+
+import numpy as np
+import number_size_distributions as nsd
+
+
+def synthetic_cloud_fields(shape, rng):
+    """
+    Parameters
+    ----------
+    shape : tuple
+        Shape (time, level[, y, x]) of the fields.
+    rng : numpy Generator
+        Random number generator, e.g. np.random.default_rng(0).
+
+    Returns
+    -------
+    q : numpy array
+        Cloud water mixing ratio in kg kg-1, log-uniform between 1e-7 and
+        1e-3, zero at half of the points.
+    P : numpy array
+        Pressure in Pa, 101000 to 70000 from the lowest to the highest level.
+    T : numpy array
+        Temperature in K, 272 to 250 with noise (standard deviation 2 K).
+
+    """
+    profile = (1,shape[1])+(1,)*(len(shape)-2)
+    P = np.linspace(101000.,70000.,shape[1]).reshape(profile)*np.ones(shape)
+    T = np.linspace(272.,250.,shape[1]).reshape(profile)+rng.normal(0.,2.,shape)
+    q = np.exp(rng.uniform(np.log(1e-7),np.log(1e-3),shape))
+    q[rng.random(shape)<0.5] = 0.
+    return q,P,T
+
+def loop_r_eff(r, N, q, P, T):
+    """
+    Per-point trapezoid integration of the droplet effective radius of a
+    (time, level) column, NaN where there is no cloud water.
+
+    Parameters
+    ----------
+    r : numpy array
+        Radius grid of the integration in m, e.g. nsd.r_cloud_grid.
+    N : float
+        Droplet number concentration in m-3.
+    q, P, T : numpy arrays (2D)
+        Cloud water mixing ratio, pressure and temperature (time, level).
+
+    Returns
+    -------
+    r_matrix : numpy array (2D)
+        Effective radius in m (time, level).
+
+    """
+    r_matrix = np.zeros(np.shape(q))
+    for i in range(np.shape(q)[0]):
+        for j in range(np.shape(q)[1]):
+            if q[i,j] == 0:
+                r_matrix[i,j] = np.nan
+            elif q[i,j] > 0:
+                r_matrix[i,j] = nsd.r_eff_droplets(r, N, q[i,j], P[i,j], T[i,j])
+    return r_matrix
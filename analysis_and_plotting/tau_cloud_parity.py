@@ -0,0 +1,145 @@
+"""Parity check of Table_S1.tau_cloud (stacked_optical_depth on a shared
+WRFState) against the original column calculation (kept below as
+legacy_tau_cloud: netCDF4 masked arrays, scipy gamma, masked division,
+per-point trapezoid loop for the droplets and np.mean over levels with
+particles) for some columns of a wrfout file, or of a synthetic in-memory
+wrfout file if none is given.
+
+All 15 outputs (optical depths, water paths and vertical mean effective
+radii) are compared; relative differences above the tolerance or a
+different NaN pattern are reported and the script exits with status 1."""
+
+import sys
+import warnings
+
+import numpy as np
+from scipy.special import gamma
+import scipy.integrate as integrate
+from netCDF4 import Dataset
+import number_size_distributions as nsd
+import Table_S1
+
+# wrfout file to take the columns from, None for a synthetic file:
+wrfout_file = None
+# wrfout_file = "/nird/projects/NS9600K/brittsc/240128_CTRL_corrected_SST/wrfout_d03_2019-11-11_12:00:00"
+columns = [(60,55),(30,30),(80,20)]
+synthetic_columns = [(0,0),(1,2),(3,1)]
+start_time = 144
+end_time = -1
+max_level = 93
+tolerance = 1e-5
+N_cloud = 9.*1e+6 #in m-3
+
+names = ["cod_tot","cod_cloud","cod_ice","cod_liquid","cod_frozen","CWP","RWP","IWP","SWP","GWP",
+         "r_eff_cloud","r_eff_rain","r_eff_ice","r_eff_snow","r_eff_graupel"]
+
+
+def synthetic_wrfout():
+    """
+    In-memory wrfout file (netCDF4 Dataset, 289 time steps, 4 x 4 columns)
+    with the variables read by tau_cloud: pressure and temperature profiles
+    with noise, and for every category a mixing ratio and number
+    concentration that are zero at half of the points.
+    """
+    rng = np.random.default_rng(0)
+    levels = max_level+1
+    wrfout = Dataset("synthetic_wrfout.nc","w",diskless=True)
+    for name,size in [("Time",289),("bottom_top",levels),("bottom_top_stag",levels+1),
+                      ("south_north",4),("west_east",4)]:
+        wrfout.createDimension(name,size)
+    shape = (289,levels,4,4)
+    profile = (1,levels,1,1)
+
+    def write(name,values,stagger=False):
+        dims = ("Time","bottom_top_stag" if stagger else "bottom_top","south_north","west_east")
+        wrfout.createVariable(name,"f4",dims)[:] = values
+
+    write("PB",np.linspace(100000.,15000.,levels).reshape(profile)*np.ones(shape))
+    write("P",rng.normal(0.,200.,shape))
+    write("T",np.linspace(-25.,40.,levels).reshape(profile)+rng.normal(0.,1.,shape))
+    write("PHB",np.cumsum(np.linspace(200.,4000.,levels+1)).reshape((1,levels+1,1,1))*np.ones((289,levels+1,4,4)),
+          stagger=True)
+    write("PH",rng.normal(0.,5.,(289,levels+1,4,4)),stagger=True)
+    for q,N,q_range,N_range in [("QCLOUD",None,(1e-7,1e-3),None),
+                                ("QRAIN","QNRAIN",(1e-7,1e-4),(1e0,1e5)),
+                                ("QICE","QNICE",(1e-8,1e-4),(1e2,1e7)),
+                                ("QSNOW","QNSNOW",(1e-7,1e-3),(1e1,1e6)),
+                                ("QGRAUP","QNGRAUPEL",(1e-7,1e-3),(1e0,1e5))]:
+        empty = rng.random(shape)<0.5
+        write(q,np.where(empty,0.,np.exp(rng.uniform(*np.log(q_range),shape))))
+        if N is not None:
+            write(N,np.where(empty,0.,np.exp(rng.uniform(*np.log(N_range),shape))))
+    return wrfout
+
+def legacy_lambda(N,q,mu):
+    c = 997.*np.pi/6
+    d = 3.
+    return (c*N*gamma(mu+d+1)/(q*gamma(mu+1)))**(1/d)
+
+def legacy_r_eff_droplets(r,N,q,p,T):
+    mu = nsd.shape_parameter(N,p,T)
+    lam = legacy_lambda(N,q,mu)
+    N_zero = N*lam**(mu+1)/gamma(mu+1)
+    A = integrate.trapezoid(r**3*N_zero*np.exp(-lam*2*r)*((2*r)**mu),x=r)
+    B = integrate.trapezoid(r**2*N_zero*np.exp(-lam*2*r)*((2*r)**mu),x=r)
+    return A/B
+
+def legacy_tau_cloud(wrfout,lat,lon):
+    """
+    Column optical depth, water paths and vertical mean r_eff as originally
+    computed in Table_S1.tau_cloud.
+    """
+    var = lambda name: wrfout.variables[name][start_time:end_time,:max_level,lat,lon]
+    P = var("P")+var("PB")
+    T = (var("T")+300)*(P/100000)**0.2854
+    geopotential = wrfout.variables["PH"][288,:max_level+1,lat,lon]+wrfout.variables["PHB"][288,:max_level+1,lat,lon]
+    H = 0.5*(geopotential[:-1]+geopotential[1:])/9.81
+
+    q_cloud = var("QCLOUD")
+    r_matrix = np.zeros(np.shape(q_cloud))
+    for i in range(np.shape(q_cloud)[0]):
+        for j in range(np.shape(q_cloud)[1]):
+            if q_cloud[i,j] == 0:
+                r_matrix[i,j] = np.nan
+            elif q_cloud[i,j] > 0:
+                r_matrix[i,j] = legacy_r_eff_droplets(nsd.r_cloud_grid,N_cloud,q_cloud[i,j],P[i,j],T[i,j])
+    r_eff = [np.nanmean(r_matrix,axis=1)]
+    for q,N in [("QRAIN","QNRAIN"),("QICE","QNICE"),("QSNOW","QNSNOW"),("QGRAUP","QNGRAUPEL")]:
+        r_eff.append(np.mean(3/(2*legacy_lambda(var(N),var(q),0)),axis=1))
+
+    WP = [integrate.trapezoid(var(q)*P/(287.058*T),x=H,axis=1) for q in ("QCLOUD","QRAIN","QICE","QSNOW","QGRAUP")]
+    cod = [np.array(3*wp/(2*r*density)) for wp,r,density in zip(WP,r_eff,(1000.,1000.,500.,100.,900.))]
+    cod_liquid = cod[0]+cod[1]
+    cod_frozen = cod[2]+cod[3]+cod[4]
+    return [cod_liquid+cod_frozen,cod[0],cod[2],cod_liquid,cod_frozen]+WP+r_eff
+
+def as_float(x):
+    return np.ma.filled(np.ma.asarray(x,dtype=float),np.nan)
+
+if wrfout_file is None:
+    wrfout,columns = synthetic_wrfout(),synthetic_columns
+else:
+    wrfout = Dataset(wrfout_file)
+failures = []
+print("wrfout:", "synthetic" if wrfout_file is None else wrfout_file)
+print("%-10s %-14s %12s" % ("column","output","max rel diff"))
+for lat,lon in columns:
+    with warnings.catch_warnings(), np.errstate(divide='ignore',invalid='ignore'):
+        warnings.simplefilter('ignore',RuntimeWarning)
+        legacy = legacy_tau_cloud(wrfout,lat,lon)
+        new = Table_S1.tau_cloud(wrfout,lat=lat,lon=lon,start_time=start_time,end_time=end_time,max_level=max_level)
+    for name,x,y in zip(names,legacy,new):
+        x,y = as_float(x),as_float(y)
+        both = np.isfinite(x) & np.isfinite(y)
+        diff = np.max(np.abs(x-y)[both]/np.maximum(np.abs(x[both]),1e-12)) if both.any() else 0.
+        same_nan = np.array_equal(np.isnan(x),np.isnan(y))
+        print("%-10s %-14s %12.2e%s" % ("%d,%d" % (lat,lon),name,diff,"" if same_nan else " (NaN pattern differs)"))
+        if diff > tolerance or not same_nan:
+            failures.append((lat,lon,name))
+wrfout.close()
+
+if failures:
+    for lat,lon,name in failures:
+        print("PARITY FAILURE: column %d,%d %s" % (lat,lon,name))
+    sys.exit(1)
+print("tau_cloud matches the legacy calculation within", tolerance)
@@ -0,0 +1,111 @@
+"""Thermodynamic state of one wrfout file (pressure, temperature, air density
+and layer heights), read and computed lazily and only once per hyperslab,
+so that the cloud optical depth, water path and particle size calculations
+of Table_S1.py share the reads instead of reopening the same variables for
+every hydrometeor category.
+
+One tau_cloud column reads every variable it needs exactly once: 14 reads
+(P, PB, T, PH, PHB and the five mixing ratios and four number
+concentrations) instead of 42, i.e. 3 times fewer; this is the lower bound
+for a single call. Further calls with the same state add no reads, e.g.
+tau_cloud and tau_cloud_no_ice of one column take 14 instead of 60."""
+
+import numpy as np
+
+
+def _index_key(index):
+    """
+    Hashable version of an index (int, slice or None).
+    """
+    if isinstance(index,slice):
+        return ('slice',index.start,index.stop,index.step)
+    return index
+
+class WRFState:
+    """
+    Cache of variables and derived fields of one wrfout file for hyperslabs
+    [start_time:end_time, :max_level, lat, lon] (lat and lon as index or
+    slice, e.g. slice(None) for the whole domain).
+
+    reads counts the variables actually read from the file. Use one state
+    per column or chunk of time steps (or call clear) to keep the memory
+    bounded.
+    """
+
+    def __init__(self,wrfout):
+        self.wrfout = wrfout
+        self.reads = 0
+        self._cache = {}
+
+    def _cached(self,key,compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _read(self,name,index):
+        self.reads += 1
+        return self.wrfout.variables[name][index]
+
+    def variable(self,name,start_time,end_time,max_level,lat,lon):
+        """
+        Variable on the mass levels, e.g. "QCLOUD" or "QNRAIN".
+        """
+        key = ('variable',name,start_time,end_time,max_level,_index_key(lat),_index_key(lon))
+        return self._cached(key,lambda: self._read(name,(slice(start_time,end_time),slice(None,max_level),lat,lon)))
+
+    def pressure(self,start_time,end_time,max_level,lat,lon):
+        """
+        Pressure in Pa (P + PB).
+        """
+        key = ('pressure',start_time,end_time,max_level,_index_key(lat),_index_key(lon))
+        return self._cached(key,lambda: self.variable("P",start_time,end_time,max_level,lat,lon)
+                                        +self.variable("PB",start_time,end_time,max_level,lat,lon))
+
+    def temperature(self,start_time,end_time,max_level,lat,lon):
+        """
+        Temperature in K from the perturbation potential temperature.
+        """
+        def compute():
+            P = self.pressure(start_time,end_time,max_level,lat,lon)
+            pot_T = self.variable("T",start_time,end_time,max_level,lat,lon)+300
+            return pot_T*(P/100000)**0.2854
+        key = ('temperature',start_time,end_time,max_level,_index_key(lat),_index_key(lon))
+        return self._cached(key,compute)
+
+    def air_density(self,start_time,end_time,max_level,lat,lon):
+        """
+        Air density in kg m-3 (ideal gas, dry air).
+        """
+        key = ('air_density',start_time,end_time,max_level,_index_key(lat),_index_key(lon))
+        return self._cached(key,lambda: self.pressure(start_time,end_time,max_level,lat,lon)
+                                        /(287.058*self.temperature(start_time,end_time,max_level,lat,lon)))
+
+    def layer_heights(self,max_level,lat,lon,height_time=288):
+        """
+        Height in m of the mass levels (level[, y, x]) from the staggered
+        geopotential at one time step.
+        """
+        def compute():
+            index = (height_time,slice(None,max_level+1),lat,lon)
+            geopotential = np.asarray(self._read("PHB",index))+np.asarray(self._read("PH",index))
+            return 0.5*(geopotential[:-1]+geopotential[1:])/9.81
+        key = ('layer_heights',max_level,_index_key(lat),_index_key(lon),height_time)
+        return self._cached(key,compute)
+
+    def layer_heights_series(self,start_time,end_time,max_level,lat,lon):
+        """
+        Height in m of the mass levels (time, level[, y, x]) of every time
+        step, destaggered from PH + PHB in one array operation.
+        """
+        def compute():
+            index = (slice(start_time,end_time),slice(None,max_level+1),lat,lon)
+            geopotential = np.asarray(self._read("PHB",index))+np.asarray(self._read("PH",index))
+            return 0.5*(geopotential[:,:-1]+geopotential[:,1:])/9.81
+        key = ('layer_heights_series',start_time,end_time,max_level,_index_key(lat),_index_key(lon))
+        return self._cached(key,compute)
+
+    def clear(self):
+        """
+        Drop all cached fields except the (time-independent) layer heights.
+        """
+        self._cache = {key: value for key,value in self._cache.items() if key[0] == 'layer_heights'}
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Area-weighted averaging of GCM warming signals over the WRF domain (or a
+sub-region like Svalbard).
+
+The normalised weights are computed once per grid and mask and kept in a
+cache, so every warming signal (surface warming, atmospheric profile, soil
+profile, snow depth change) reduces to one array contraction over lat/lon,
+independent of how many leading dimensions (level, depth, time, scenario)
+the field has. Points where the field is NaN (e.g. pressure levels below
+ground) are left out and the weights are renormalised over the remaining
+points.
+
+Instead of the all-or-nothing selection of rio.clip (a coarse 2.5 deg
+NorESM2 cell either counts fully or not at all), the fraction of each GCM
+cell inside the WRF domain polygon can be used as mask. It is computed
+once per (GCM grid, WRF domain) pair and cached in memory and on disk.
+
+Land regions (e.g. Svalbard for soil temperature and snow depth) are
+selected with the fraction of each cell inside a region polygon, optionally
+times the model land fraction (sftlf). The resulting weights and the index
+box of the region are cached per grid, so the regional averages need
+neither hard-coded lat/lon slices nor manual trimming. The default region
+SVALBARD_BOX reproduces the cells of the published soil and snow deltas;
+SVALBARD_POLYGON with sftlf follows the archipelago instead (see
+compare_svalbard_selection.py for the difference).
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+
+_weights_cache = {}
+_overlap_cache = {}
+_region_cache = {}
+
+# cell edges (lon, lat) of the NorESM2 cells averaged for the published soil
+# and snow deltas (lat 76.74-80.53, lon 12.5-25.0; formerly sel(lat=slice(
+# '74.84','82.42'),lon=slice('12.5','25.0'))[1:,4:]), latitudes rounded
+# inwards, for region_weights without land fraction:
+SVALBARD_BOX = np.array([[11.25, 75.789474],
+                         [26.25, 75.789474],
+                         [26.25, 81.473684],
+                         [11.25, 81.473684],
+                         [11.25, 75.789474]])
+
+# Svalbard archipelago (lon, lat) without Bjørnøya, for region_weights with
+# land fraction:
+SVALBARD_POLYGON = np.array([[ 9.5, 78.0],
+                             [13.0, 76.3],
+                             [17.0, 76.3],
+                             [22.0, 77.0],
+                             [28.0, 76.8],
+                             [33.5, 78.5],
+                             [33.5, 80.5],
+                             [27.0, 81.0],
+                             [20.0, 80.9],
+                             [15.0, 80.2],
+                             [10.0, 79.9],
+                             [ 9.5, 78.0]])
+
+
+def _grid_key(area, mask=None):
+    """
+    Hash of the grid coordinates, the area values and the mask, used as
+    key for the weights cache.
+    """
+    key = hashlib.sha1()
+    for array in (area['lat'].values, area['lon'].values, area.values):
+        key.update(np.ascontiguousarray(array,dtype=float).tobytes())
+    if mask is not None:
+        key.update(np.ascontiguousarray(mask,dtype=float).tobytes())
+    return key.hexdigest()
+
+def normalised_weights(area, mask=None, dims=('lat','lon')):
+    """
+    Parameters
+    ----------
+    area : xarray
+        Area per grid point (e.g. output from get_area_per_grid_point),
+        NaN outside the region of interest.
+    mask : xarray or numpy array, optional
+        Fraction (0 to 1) of each grid point that belongs to the region,
+        multiplied with area. The default is None (whole area).
+    dims : tuple of string, optional
+        Horizontal dimensions. The default is ('lat','lon').
+
+    Returns
+    -------
+    weights : xarray
+        Weights summing up to 1 over dims, zero where area is NaN.
+
+    """
+    key = _grid_key(area, mask)
+    if key not in _weights_cache:
+        weights = area.fillna(0.)
+        if mask is not None:
+            weights = weights*np.nan_to_num(np.asarray(mask,dtype=float))
+        weights = weights/weights.sum(dim=list(dims))
+        _weights_cache[key] = weights.drop_vars([name for name in weights.coords
+                                                 if name not in weights.dims])
+    return _weights_cache[key]
+
+def weighted_domain_mean(field, weights, dims=('lat','lon')):
+    """
+    Parameters
+    ----------
+    field : xarray
+        Field to be averaged, e.g. a difference future minus present.
+        Can have any number of dimensions in addition to dims.
+    weights : xarray
+        Output from normalised_weights.
+    dims : tuple of string, optional
+        Horizontal dimensions to average over. The default is ('lat','lon').
+
+    Returns
+    -------
+    field_mean : xarray
+        Weighted mean over dims. Where field is NaN the weights are
+        renormalised over the valid points; all-NaN results are NaN.
+
+    """
+    # sum of weighted values and sum of valid weights in one contraction:
+    stacked = xr.concat([field.fillna(0.),field.notnull().astype(float)],dim='_part')
+    contracted = xr.dot(stacked,weights,dim=list(dims))
+
+    weighted_sum = contracted.isel(_part=0,drop=True)
+    valid_weight = contracted.isel(_part=1,drop=True)
+
+    return weighted_sum/valid_weight.where(valid_weight>0)
+
+def _cell_edges(centres, lower, upper):
+    """
+    Cell boundaries halfway between the cell centres, the outer boundaries
+    mirrored at the first/last centre and limited to [lower, upper].
+    """
+    centres = np.asarray(centres,dtype=float)
+    if len(centres) < 2:
+        raise ValueError("At least two grid points per dimension are needed "
+                         "to derive the cell boundaries")
+    mid = 0.5*(centres[1:]+centres[:-1])
+    edges = np.concatenate(([2*centres[0]-mid[0]],mid,[2*centres[-1]-mid[-1]]))
+    return np.clip(edges,lower,upper)
+
+def _overlap_key(lat, lon, polygon):
+    """
+    Hash of the GCM grid and the domain polygon, used as cache key.
+    """
+    key = hashlib.sha1()
+    for array in (lat, lon, polygon):
+        key.update(np.ascontiguousarray(array,dtype=float).tobytes())
+    return key.hexdigest()
+
+def fractional_overlap(lat, lon, polygon, cache_dir=None):
+    """
+    Parameters
+    ----------
+    lat : numpy array
+        Latitudes of the GCM grid cell centres (1D).
+    lon : numpy array
+        Longitudes of the GCM grid cell centres (1D), in the same range as
+        the polygon (-180 to 180 after the usual reordering).
+    polygon : numpy array
+        Border coordinates (lon, lat) of the WRF domain, e.g. output from
+        get_domain_polygon or the coordinates of create_domain_geometry.
+    cache_dir : string, optional
+        Directory for the cache file of this grid/domain pair. The default
+        is None (only cached in memory).
+
+    Returns
+    -------
+    fraction : xarray
+        Fraction (0 to 1) of the area of each GCM cell that lies inside the
+        polygon, on the (lat, lon) grid.
+
+    """
+    import shapely
+
+    lat = np.asarray(lat,dtype=float)
+    lon = np.asarray(lon,dtype=float)
+    polygon = np.asarray(polygon,dtype=float)
+    key = _overlap_key(lat,lon,polygon)
+
+    if key in _overlap_cache:
+        return _overlap_cache[key]
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir,'overlap_fraction_'+key[:16]+'.nc')
+        if os.path.exists(cache_file):
+            fraction = xr.open_dataarray(cache_file).load()
+            _overlap_cache[key] = fraction
+            return fraction
+
+    # Areas are compared in (lon, sin(lat)), a cylindrical equal-area
+    # projection, i.e. the fractions are fractions of the spherical area:
+    lat_edges = np.sin(np.deg2rad(_cell_edges(lat,-90.,90.)))
+    lon_edges = np.deg2rad(_cell_edges(lon,-360.,360.))
+    domain = shapely.Polygon(np.column_stack((np.deg2rad(polygon[:,0]),
+                                              np.sin(np.deg2rad(polygon[:,1])))))
+    if not domain.is_valid:
+        domain = domain.buffer(0)
+    shapely.prepare(domain)
+
+    y_low,x_low = np.meshgrid(lat_edges[:-1],lon_edges[:-1],indexing='ij')
+    y_up,x_up = np.meshgrid(lat_edges[1:],lon_edges[1:],indexing='ij')
+    cells = shapely.box(x_low,np.minimum(y_low,y_up),x_up,np.maximum(y_low,y_up))
+
+    fraction = np.zeros(cells.shape)
+    inside = shapely.contains(domain,cells)
+    fraction[inside] = 1.
+    edge = shapely.intersects(domain,cells) & ~inside
+    fraction[edge] = (shapely.area(shapely.intersection(cells[edge],domain))
+                      /shapely.area(cells[edge]))
+
+    fraction = xr.DataArray(fraction,
+                            dims=('lat','lon'),
+                            coords={'lat':lat,'lon':lon},
+                            name='overlap_fraction')
+    if cache_file is not None:
+        os.makedirs(cache_dir,exist_ok=True)
+        fraction.to_netcdf(cache_file)
+    _overlap_cache[key] = fraction
+
+    return fraction
+
+def overlap_weights(area, polygon, cache_dir=None):
+    """
+    Parameters
+    ----------
+    area : xarray
+        Area per grid point (areacella), not clipped or clipped with
+        all_touched=True so that the cells along the domain edge are kept.
+    polygon : numpy array
+        Border coordinates (lon, lat) of the WRF domain.
+    cache_dir : string, optional
+        Directory for the cache of the overlap fractions. The default is
+        None (only cached in memory).
+
+    Returns
+    -------
+    weights : xarray
+        Output from normalised_weights with each cell weighted by the
+        fraction of its area inside the domain.
+
+    """
+    fraction = fractional_overlap(area['lat'].values,area['lon'].values,
+                                  polygon,cache_dir=cache_dir)
+    return normalised_weights(area,mask=fraction.values)
+
+def region_weights(area, land_fraction=None, polygon=SVALBARD_BOX, cache_dir=None):
+    """
+    Parameters
+    ----------
+    area : xarray
+        Area per grid point (areacella) on the (lat, lon) grid of the data,
+        longitudes -180 to 180 (not clipped to the region).
+    land_fraction : xarray or numpy array, optional
+        Land area fraction (sftlf) on the same grid, in percent or 0 to 1.
+        The default is None (area and fraction inside polygon only; points
+        without data, e.g. ocean points of tsl, are left out by
+        weighted_domain_mean).
+    polygon : numpy array, optional
+        Border coordinates (lon, lat) of the land region. The default is
+        SVALBARD_BOX.
+    cache_dir : string, optional
+        Directory for the cache of the overlap fractions. The default is
+        None (only cached in memory).
+
+    Returns
+    -------
+    weights : xarray
+        Normalised weights (area times fraction inside polygon, times land
+        fraction if given), cropped to the smallest lat/lon box containing the
+        region. Use with weighted_domain_mean; fields on the same grid are
+        matched by their lat/lon coordinates.
+    indexers : dictionary
+        Position of that box on the full grid ({'lat': slice, 'lon':
+        slice}), for isel.
+
+    """
+    if land_fraction is None:
+        land_fraction = np.ones(area.shape)
+    land_fraction = np.nan_to_num(np.asarray(land_fraction,dtype=float))
+    if land_fraction.max() > 1.:
+        land_fraction = land_fraction/100.
+
+    polygon = np.asarray(polygon,dtype=float)
+    key = _grid_key(area,land_fraction)+_overlap_key([],[],polygon)
+    if key not in _region_cache:
+        mask = fractional_overlap(area['lat'].values,area['lon'].values,
+                                  polygon,cache_dir=cache_dir).values*land_fraction
+        mask = mask*np.isfinite(area.values)
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if len(rows) == 0:
+            raise ValueError("No land points of the grid inside the region polygon")
+        indexers = {'lat': slice(int(rows[0]),int(rows[-1])+1), 'lon': slice(int(cols[0]),int(cols[-1])+1)}
+
+        weights = normalised_weights(area.isel(indexers),mask[indexers['lat'],indexers['lon']])
+        _region_cache[key] = (weights,indexers)
+
+    return _region_cache[key]
+
+def region_mean(field, weights, tolerance=1e-3):
+    """
+    Parameters
+    ----------
+    field : xarray
+        Field on the (lat, lon) grid of the weights, e.g. a difference
+        future minus present clipped to the WRF domain. Can have any
+        number of dimensions in addition to lat and lon.
+    weights : xarray
+        Output from region_weights.
+    tolerance : float, optional
+        Maximum difference in degrees when matching the grid points of
+        field to those of weights (files may round the coordinates
+        differently). The default is 1e-3.
+
+    Returns
+    -------
+    field_mean : xarray
+        Weighted mean over the region, see weighted_domain_mean.
+
+    """
+    field = field.sel(lat=weights['lat'].values,lon=weights['lon'].values,
+                      method='nearest',tolerance=tolerance)
+    field = field.assign_coords(lat=weights['lat'].values,lon=weights['lon'].values)
+    return weighted_domain_mean(field,weights)
+
+def clear_weights_cache():
+    """
+    Empty the caches of normalised weights, overlap fractions and region
+    weights (in memory, files in cache_dir are kept).
+    """
+    _weights_cache.clear()
+    _overlap_cache.clear()
+    _region_cache.clear()
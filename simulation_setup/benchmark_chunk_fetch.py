@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark of the chunk fetch path (chunk_fetch.py) on synthetic
+NorESM2-like data (see synthetic_cmip6.py), for the 'small', 'typical' or
+'stress' size.
+
+The ts zarr store is served by a local HTTP stand-in server with a fixed
+latency per request; the first requests of chunks answer 503 (service
+unavailable) and one path answers 403 (forbidden). Timed is the November
+selection of one window read and clipped to the WRF domain
+(cmip6_mirror.open_domain_variable) directly from the HTTP filesystem and
+through a CachedChunkFileSystem with a cold and a warm block cache, as
+throughput in MB/s of the chunks read. Checked are the equality of the
+results, that the 503 answers were retried and that 403/404 answers were
+not.
+"""
+
+import functools
+import http.server
+import os
+import posixpath
+import shutil
+import socketserver
+import threading
+import time
+
+import fsspec
+import numpy as np
+
+import chunk_fetch as cf
+import cmip6_access as ca
+import cmip6_mirror as cm
+import domain_footprint as dfp
+import synthetic_cmip6 as sc
+
+size = 'small'
+root = "C:/Users/xxx/Pseudo Global Warming/synthetic_cmip6_"+size+"_ts"
+cache_dir = "C:/Users/xxx/Pseudo Global Warming/benchmark_chunk_cache"
+years = (2040,2049)
+month = 11
+# stand-in server: latency per request (s) and number of 503 answers:
+latency = 0.02
+n_unavailable = 3
+
+
+class StandInHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static file server with latency, n_unavailable 503 answers to requests
+    of the ts array and 403 for paths containing /forbidden/.
+    """
+    requests = []
+    # 503 answers given so far (armed before the cold cache read):
+    unavailable = n_unavailable
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(latency)
+        StandInHandler.requests.append(self.path)
+        if '/forbidden/' in self.path:
+            self.send_error(403)
+            return
+        if '/'+sc.VERSION+'/ts/' in self.path and StandInHandler.unavailable < n_unavailable:
+            StandInHandler.unavailable += 1
+            self.send_error(503)
+            return
+        super().do_GET()
+
+def timed(function):
+    """
+    Seconds of one run of function and its result.
+    """
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter()-start,result
+
+def requests_of(path):
+    return sum(request.rstrip('/').endswith(path) for request in StandInHandler.requests)
+
+
+# synthetic data (written once per size):
+if not os.path.exists(os.path.join(root,'pangeo-cmip6.csv')):
+    sc.write_zarr_stores(root,variables=('ts',),size=size)
+    sc.write_met_em_file(os.path.join(root,'met_em_synthetic.nc'))
+
+df = ca.load_catalog(os.path.join(root,'pangeo-cmip6.csv'))
+zstore = ca.get_zstore(df,'ts',experiment_id='ssp585')
+geometry = dfp.domain_footprint(os.path.join(root,'met_em_synthetic.nc'),cache_dir=None)
+
+server = socketserver.ThreadingTCPServer(('127.0.0.1',0),functools.partial(StandInHandler,directory=root))
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever,daemon=True).start()
+url = 'http://127.0.0.1:%d/' % server.server_address[1]+os.path.relpath(zstore,root).replace(os.sep,'/')
+
+http_fs = fsspec.filesystem('http')
+shutil.rmtree(cache_dir,ignore_errors=True)
+cached_fs = cf.CachedChunkFileSystem(http_fs,cache_dir,backoff=0.01)
+
+def read(fs):
+    return cm.open_domain_variable(url,'ts',geometry,years=years,months=[month],fs=fs).load()
+
+positions = cm.time_positions(ca.open_zstore(url,fs=http_fs)['time'],years,[month])
+chunks = cf.chunk_keys(http_fs,url,'ts',{'time': positions})
+MB = sum(http_fs.size(chunk) for chunk in chunks)/1e6
+
+results = {}
+for label,fs in [('http',http_fs),('cached cold',cached_fs),('cached warm',cached_fs)]:
+    if label == 'cached cold':
+        # plain HTTP has no retries, so only the cached reads get 503s:
+        StandInHandler.unavailable = 0
+    seconds,results[label] = timed(lambda: read(fs))
+    print("%-12s %8.3f s %8.1f MB/s" % (label,seconds,MB/seconds))
+
+print("chunks:", len(chunks), "; MB:", round(MB,2), "; cache stats:", cached_fs.stats)
+print("equal results:", all(np.array_equal(da.values,results['http'].values) for da in results.values()))
+print("503 retried:", cached_fs.stats['retries'] == n_unavailable)
+
+for status,path in [(403,posixpath.join(url,'forbidden/ts/c/0/0/0')),(404,posixpath.join(url,'ts/missing'))]:
+    try:
+        cached_fs.cat_file(path)
+        print(status, "not raised")
+    except Exception as err:
+        print(status, "raised", type(err).__name__, "after", requests_of(path[len(url):]), "request(s)")
+
+server.shutdown()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark of the warming signal extraction on synthetic NorESM2-like
+data (see synthetic_cmip6.py), for the 'small', 'typical' or 'stress' size.
+
+Timed are the stages of the extraction of every variable (open the store,
+subset the years/month, read and clip to the WRF domain, window means,
+weighted reduction) from the zarr stores (Pangeo layout) and, for tsl and
+snd, from the NetCDF files (CEDA layout), plus the complete delta set with
+pgw_deltas.extract_pgw_deltas. The extracted deltas are compared to the
+imposed trend, and the timings are appended to a JSON file so runs before
+and after a change of the extraction path can be compared.
+"""
+
+import datetime
+import json
+import os
+import time
+
+import fsspec
+import numpy as np
+
+import area_weights as aw
+import cmip6_access as ca
+import cmip6_files as c6f
+import cmip6_mirror as cm
+import domain_footprint as dfp
+import ensemble_signals as es
+import pgw_deltas as pd_
+import synthetic_cmip6 as sc
+
+size = 'typical'
+root = "C:/Users/xxx/Pseudo Global Warming/synthetic_cmip6_"+size
+results_file = "C:/Users/xxx/Pseudo Global Warming/benchmark_extraction.json"
+start_years = [1955,2047,2058,2074] if size != 'small' else [2005,2040]
+reference_start_year = 2015
+window_length = 10
+month = 11
+repeats = 3
+
+
+def timed(function):
+    """
+    Fastest of repeats runs of function (seconds) and its last result.
+    """
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter()-start)
+    return min(times),result
+
+def stage_times(open_data, variable_id, years, geometry, weights, reduce):
+    """
+    Time the extraction stages of one variable for the given start years
+    and return the seconds per stage and the deltas (start_year[, level]).
+    """
+    first_year = min(years+[reference_start_year])
+    last_year = max(years+[reference_start_year])+window_length-1
+
+    seconds = {}
+    seconds['open'],ds = timed(open_data)
+    seconds['subset'],ds = timed(lambda: ds.isel(time=cm.time_positions(ds['time'],(first_year,last_year),[month])))
+    seconds['read_and_clip'],da = timed(lambda: ca.clip_to_domain(ds,variable_id,geometry).load())
+    seconds['window_means'],deltas = timed(lambda: pd_.period_deltas(da,years,reference_start_year,
+                                                                     window_length,month))
+    seconds['weighted_reduction'],deltas = timed(lambda: reduce(deltas,weights).compute())
+    seconds['total'] = sum(seconds.values())
+    return seconds,deltas
+
+def max_error(variable_id, deltas, years, profile=None):
+    """
+    Largest deviation of the extracted deltas from the imposed trend (times
+    profile per level instead of the trend profile of the data, if given).
+    """
+    expected = np.array([sc.expected_delta(variable_id,year,reference_start_year) for year in years])
+    if profile is not None:
+        expected = expected[:,:1]*profile
+    return float(np.nanmax(np.abs(np.asarray(deltas).reshape(expected.shape)-expected)))
+
+
+# synthetic data (written once per size):
+if not os.path.exists(os.path.join(root,'pangeo-cmip6.csv')):
+    sc.write_zarr_stores(root,size=size)
+    sc.write_local_directories(root,size=size)
+    sc.write_met_em_file(os.path.join(root,'met_em_synthetic.nc'))
+
+df = ca.load_catalog(os.path.join(root,'pangeo-cmip6.csv'))
+fs = fsspec.filesystem('file')
+met_em_file = os.path.join(root,'met_em_synthetic.nc')
+local_directories = {variable_id: {experiment_id: os.path.join(root,'NorESM2-LM_'+experiment_id+'_'+variable_id)
+                                   for experiment_id in ('historical','ssp585')}
+                     for variable_id in ('tsl','snd')}
+geometry = dfp.domain_footprint(met_em_file,cache_dir=None)
+
+def fx_field(variable_id):
+    return ca.reorder_lon(ca.open_zstore(ca.get_zstore(df,variable_id),fs=fs))[variable_id].load()
+
+domain_weights = aw.normalised_weights(ca.clip_to_domain(ca.open_zstore(ca.get_zstore(df,'areacella'),fs=fs),
+                                                         'areacella',geometry).load())
+svalbard_weights = aw.region_weights(fx_field('areacella'))[0]
+
+run = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+       'size': size, 'start_years': start_years, 'stages': {}, 'max_error': {}}
+
+# stages per variable from the scenario data (start years from 2015 on):
+scenario_years = [year for year in start_years if year >= reference_start_year]
+for variable_id in ('ta','ts','tsl','snd'):
+    if variable_id in ('ta','ts'):
+        weights,reduce = domain_weights,aw.weighted_domain_mean
+    else:
+        weights,reduce = svalbard_weights,aw.region_mean
+    table_id = es.signal_variables[variable_id]
+
+    def open_zarr():
+        return ca.open_zstore(ca.get_zstore(df,variable_id,activity_id='ScenarioMIP',table_id=table_id),fs=fs)
+    seconds,deltas = stage_times(open_zarr,variable_id,scenario_years,geometry,weights,reduce)
+    run['stages'][variable_id+'_zarr'] = seconds
+    run['max_error'][variable_id+'_zarr'] = {variable_id: max_error(variable_id,deltas,scenario_years)}
+    if variable_id in ('tsl','snd'):
+        def open_netcdf():
+            return c6f.open_variable(local_directories[variable_id]['ssp585'],variable_id,table_id=table_id)
+        seconds,deltas = stage_times(open_netcdf,variable_id,scenario_years,geometry,weights,reduce)
+        run['stages'][variable_id+'_netcdf'] = seconds
+
+# complete delta set, all variables from the zarr stores or tsl/snd from the NetCDF files:
+for name,directories in (('pgw_deltas_zarr',None),('pgw_deltas_netcdf',local_directories)):
+    def extract():
+        aw.clear_weights_cache()
+        return pd_.extract_pgw_deltas(met_em_file,start_years,
+                                      reference_start_year=reference_start_year,
+                                      window_length=window_length,month=month,
+                                      local_directories=directories,df=df,fs=fs)
+    seconds,deltas = timed(extract)
+    run['stages'][name] = {'total': seconds}
+    run['max_error'][name] = {'ta': max_error('ta',deltas['delta_T_GCM'],start_years),
+                              'ts': max_error('ts',deltas['delta_ts'],start_years),
+                              'tsl': max_error('tsl',deltas['delta_T_soil_layers'],start_years,
+                                               np.exp(-es.soil_levels_met_em/10.)),
+                              'snd': max_error('snd',deltas['delta_SNOWH'],start_years)}
+
+for name,seconds in run['stages'].items():
+    print(name.ljust(20)+'  '.join('%s %.3f s' % (stage,value) for stage,value in seconds.items()))
+for name,errors in run['max_error'].items():
+    print(name.ljust(20)+'  '.join('%s %.3g' % (variable_id,value) for variable_id,value in errors.items()))
+
+runs = []
+if os.path.exists(results_file):
+    with open(results_file) as f:
+        runs = json.load(f)
+with open(results_file,'w') as f:
+    json.dump(runs+[run],f,indent=2)
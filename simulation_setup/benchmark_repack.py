@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Repack the CEDA tsl and snd files into local zarr stores for the WRF
+domain (see repack_store.py) and compare the extraction time of the
+November window means and the bytes read for it before and after
+repacking.
+"""
+
+import geojson
+
+import domain_footprint as dfp
+import repack_store as rs
+
+met_em_testfile = "C:/Users/xxx/Pseudo Global Warming/yyy/met_em.d01.2019-11-11_12%3A00%3A00.nc"
+start_years = [2015,2047,2074]
+
+lat_bounds,lon_bounds = rs.bounds_from_geometry(geojson.loads(dfp.domain_geometries(met_em_testfile)[1]))
+
+for variable_id,table_id in [('tsl','Lmon'),('snd','LImon')]:
+    source_path = "C:/Users/xxx/Pseudo Global Warming/NorESM2-LM_ssp585_"+variable_id+"/"
+    store_path = "C:/Users/xxx/Pseudo Global Warming/NorESM2-LM_ssp585_"+variable_id+"_repacked.zarr"
+
+    rs.repack_variable(source_path,variable_id,store_path,lat_bounds,lon_bounds,
+                       table_id=table_id,experiment_id='ssp585')
+    result = rs.benchmark_extraction(source_path,variable_id,store_path,start_years,
+                                     lat_bounds,lon_bounds,table_id=table_id,
+                                     experiment_id='ssp585')
+
+    print(variable_id)
+    if result['source_bytes_read'] is None:
+        print("  extraction from NetCDF files: %.2f s (bytes read not counted, needs h5netcdf)"
+              % result['source_seconds'])
+    else:
+        print("  extraction from NetCDF files: %.2f s (%.1f MB read)"
+              % (result['source_seconds'],result['source_bytes_read']/1e6))
+    print("  extraction from repacked store: %.2f s (%.1f MB read)"
+          % (result['store_seconds'],result['store_bytes_read']/1e6))
+    print("  speedup: %.1f, max. difference: %.2g" % (result['speedup'],result['max_difference']))
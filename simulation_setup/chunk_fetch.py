@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Fetch layer for the CMIP6 zarr chunks below the extractors.
+
+fs.get_mapper(zstore) on the GCS filesystem fetches the chunks one by one
+when dask asks for them, without a persistent cache and without any limit
+on the number of requests in flight. CachedChunkFileSystem wraps such a
+filesystem (GCS, HTTP, local, ...) and
+
+- keeps every fetched object (chunk or metadata file) in an on-disk block
+  cache with a size cap and least-recently-used eviction,
+- prefetches the chunks a selection will need with a bounded number of
+  concurrent requests,
+- retries failed requests with exponential backoff (only transient
+  failures: connection errors, timeouts and HTTP 408/429/5xx).
+
+It is an fsspec filesystem itself, so it can be passed as fs to
+cmip6_access.open_zstore, cmip6_mirror.open_domain_variable or
+ensemble_signals.ensemble_signals. Any fsspec filesystem can be wrapped,
+e.g. an HTTP filesystem pointing to a local stand-in server to measure
+the throughput (see benchmark_chunk_fetch.py).
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import os
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from fsspec import AbstractFileSystem
+
+# HTTP status codes worth retrying (timeout, rate limit, server errors):
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+try:
+    from aiohttp import ClientConnectionError, ClientPayloadError
+    _connection_errors = (ConnectionError, TimeoutError, ClientConnectionError, ClientPayloadError)
+except ImportError:
+    _connection_errors = (ConnectionError, TimeoutError)
+
+
+def is_transient(err):
+    """
+    Whether a failed request is worth retrying: connection errors, timeouts
+    and HTTP status codes in TRANSIENT_STATUS (status or code attribute of
+    the error or its cause, as raised by aiohttp and gcsfs). Missing
+    objects, permission errors and all other errors are not retried.
+    """
+    for error in (err, err.__cause__):
+        if error is None or isinstance(error,(FileNotFoundError,PermissionError)):
+            continue
+        status = getattr(error,'status',getattr(error,'code',None))
+        if isinstance(status,int):
+            return status in TRANSIENT_STATUS
+        if isinstance(error,_connection_errors):
+            return True
+    return False
+
+
+class CachedChunkFileSystem(AbstractFileSystem):
+    """
+    Read-only fsspec filesystem serving the objects of fs through an
+    on-disk LRU block cache.
+
+    Parameters
+    ----------
+    fs : fsspec filesystem
+        Remote filesystem, e.g. cmip6_access.get_filesystem().
+    cache_dir : string
+        Directory of the block cache.
+    max_cache_size : int, optional
+        Size cap of the cache in bytes. The default is 2 GB.
+    max_workers : int, optional
+        Maximum number of concurrent requests when prefetching. The default
+        is 8.
+    retries : int, optional
+        Number of retries of a failed request. The default is 4.
+    backoff : float, optional
+        Wait before the first retry in seconds, doubled for every further
+        retry. The default is 0.5.
+
+    """
+
+    protocol = 'chunkcache'
+    cachable = False
+
+    def __init__(self, fs, cache_dir, max_cache_size=2*1024**3, max_workers=8,
+                 retries=4, backoff=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.fs = fs
+        self.cache_dir = cache_dir
+        self.max_cache_size = max_cache_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {'hits': 0, 'misses': 0, 'retries': 0, 'evicted': 0}
+
+        os.makedirs(cache_dir,exist_ok=True)
+        self._lock = threading.Lock()
+        # cache file name: size, least recently used first:
+        self._blocks = OrderedDict()
+        files = [entry for entry in os.scandir(cache_dir)
+                 if entry.is_file() and entry.name.endswith('.blk')]
+        for entry in sorted(files,key=lambda entry: entry.stat().st_mtime):
+            self._blocks[entry.name] = entry.stat().st_size
+        self._size = sum(self._blocks.values())
+        self._evict()
+
+    def _block_name(self, path):
+        return hashlib.sha1(self.fs.unstrip_protocol(path).encode()).hexdigest()+'.blk'
+
+    def _evict(self):
+        """
+        Remove least recently used blocks until the cache fits the size cap
+        (call with the lock held).
+        """
+        while self._size > self.max_cache_size and self._blocks:
+            name,size = self._blocks.popitem(last=False)
+            self._size -= size
+            self.stats['evicted'] += 1
+            try:
+                os.remove(os.path.join(self.cache_dir,name))
+            except FileNotFoundError:
+                pass
+
+    def _fetch(self, path):
+        """
+        Read an object from the remote filesystem, retrying transient
+        failures (see is_transient) with exponential backoff.
+        """
+        for attempt in range(self.retries+1):
+            try:
+                return self.fs.cat_file(path)
+            except Exception as err:
+                if attempt == self.retries or not is_transient(err):
+                    raise
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(self.backoff*2**attempt)
+
+    def _store(self, name, data):
+        """
+        Write a block to the cache and evict old blocks if necessary.
+        """
+        cache_file = os.path.join(self.cache_dir,name)
+        temp_file = cache_file+'.'+str(threading.get_ident())+'.tmp'
+        with open(temp_file,'wb') as f:
+            f.write(data)
+        os.replace(temp_file,cache_file)
+        with self._lock:
+            self._size += len(data)-self._blocks.pop(name,0)
+            self._blocks[name] = len(data)
+            self._evict()
+
+    def _cached(self, path):
+        """
+        Content of a cached block, None if it is not in the cache.
+        """
+        name = self._block_name(path)
+        with self._lock:
+            if name not in self._blocks:
+                return None
+            self._blocks.move_to_end(name)
+        try:
+            with open(os.path.join(self.cache_dir,name),'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            # evicted by another thread in the meantime
+            return None
+        os.utime(os.path.join(self.cache_dir,name))
+        return data
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        data = self._cached(path)
+        if data is None:
+            data = self._fetch(path)
+            self._store(self._block_name(path),data)
+            with self._lock:
+                self.stats['misses'] += 1
+        else:
+            with self._lock:
+                self.stats['hits'] += 1
+        return data[start:end]
+
+    def prefetch(self, paths):
+        """
+        Parameters
+        ----------
+        paths : list of string
+            Objects (e.g. chunks) that will be read soon.
+
+        Returns
+        -------
+        n_fetched : int
+            Number of objects fetched from the remote filesystem; objects
+            already in the cache and missing objects (chunks that only
+            contain the fill value) are skipped.
+
+        """
+        with self._lock:
+            missing = [path for path in dict.fromkeys(paths)
+                       if self._block_name(path) not in self._blocks]
+
+        def fetch(path):
+            try:
+                self._store(self._block_name(path),self._fetch(path))
+                return 1
+            except FileNotFoundError:
+                return 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return sum(pool.map(fetch,missing))
+
+    def clear_cache(self):
+        """
+        Remove all blocks from the cache directory.
+        """
+        with self._lock:
+            for name in self._blocks:
+                try:
+                    os.remove(os.path.join(self.cache_dir,name))
+                except FileNotFoundError:
+                    pass
+            self._blocks.clear()
+            self._size = 0
+
+    # listing and metadata are passed on to the remote filesystem:
+    def info(self, path, **kwargs):
+        return self.fs.info(path,**kwargs)
+
+    def ls(self, path, detail=True, **kwargs):
+        return self.fs.ls(path,detail=detail,**kwargs)
+
+    def exists(self, path, **kwargs):
+        with self._lock:
+            if self._block_name(path) in self._blocks:
+                return True
+        return self.fs.exists(path,**kwargs)
+
+    def find(self, path, **kwargs):
+        return self.fs.find(path,**kwargs)
+
+    def _open(self, path, mode='rb', **kwargs):
+        if mode != 'rb':
+            raise NotImplementedError("CachedChunkFileSystem is read-only")
+        return io.BytesIO(self.cat_file(path))
+
+def _array_metadata(fs, zstore, variable_id):
+    """
+    Shape, chunk shape, dimension names and chunk key pattern of a zarr
+    array (zarr format 2 or 3).
+    """
+    root = posixpath.join(zstore.rstrip('/'),variable_id)
+    try:
+        meta = json.loads(fs.cat_file(root+'/.zarray'))
+        attrs = json.loads(fs.cat_file(root+'/.zattrs')) if fs.exists(root+'/.zattrs') else {}
+        return (meta['shape'],meta['chunks'],attrs.get('_ARRAY_DIMENSIONS'),
+                '',meta.get('dimension_separator','.'))
+    except FileNotFoundError:
+        meta = json.loads(fs.cat_file(root+'/zarr.json'))
+        encoding = meta.get('chunk_key_encoding',{'name':'default'})
+        separator = encoding.get('configuration',{}).get('separator',
+                                                         '/' if encoding['name']=='default' else '.')
+        prefix = 'c'+separator if encoding['name']=='default' else ''
+        return (meta['shape'],meta['chunk_grid']['configuration']['chunk_shape'],
+                meta.get('dimension_names'),prefix,separator)
+
+def chunk_keys(fs, zstore, variable_id, indexers=None):
+    """
+    Parameters
+    ----------
+    fs : fsspec filesystem
+        Filesystem of the store.
+    zstore : string
+        Path to the zarr store.
+    variable_id : string
+        Variable (zarr array) in the store.
+    indexers : dictionary, optional
+        Positions selected along some of the dimensions, e.g.
+        {'time': array of integers} or {'lat': slice(150,192)}. The default
+        is None (whole array).
+
+    Returns
+    -------
+    paths : list of string
+        Paths of all chunks overlapping the selection.
+
+    """
+    shape,chunks,dims,prefix,separator = _array_metadata(fs,zstore,variable_id)
+    if indexers is None:
+        indexers = {}
+    if dims is None:
+        dims = [None]*len(shape)
+
+    chunk_ids = []
+    for dim,size,chunk in zip(dims,shape,chunks):
+        positions = np.arange(size)[indexers[dim]] if dim in indexers else np.arange(size)
+        chunk_ids.append(np.unique(np.atleast_1d(positions)//chunk))
+
+    root = posixpath.join(zstore.rstrip('/'),variable_id)
+    if len(shape) == 0:
+        # single chunk: 'c' with the zarr 3 default key encoding, '0' otherwise
+        return [root+'/'+('c' if prefix else '0')]
+    return [root+'/'+prefix+separator.join(str(i) for i in ids)
+            for ids in itertools.product(*chunk_ids)]
+
+def prefetch_selection(fs, zstore, variable_id, indexers=None):
+    """
+    Prefetch the chunks of a selection (see chunk_keys) into the block
+    cache of fs. Does nothing if fs is not a CachedChunkFileSystem.
+
+    Returns
+    -------
+    n_fetched : int
+        Number of chunks fetched from the remote filesystem.
+
+    """
+    if not isinstance(fs,CachedChunkFileSystem):
+        return 0
+    return fs.prefetch(chunk_keys(fs,zstore,variable_id,indexers))
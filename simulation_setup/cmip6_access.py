@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Access to the Pangeo CMIP6 cloud data without the module-level side
+effects of cmip6_data_from_pangeo.py (catalog download and GCS connection
+on import): catalog lookup, opening a zarr store and the data preparation
+shared by all extractors (longitude reordering, clipping to the WRF
+domain).
+
+Starting point (latest accessed 30 July 2024):
+https://pangeo-data.github.io/pangeo-cmip6-cloud/accessing_data.html
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+CATALOG_URL = "https://cmip6.storage.googleapis.com/pangeo-cmip6.csv"
+
+_catalogs = {}
+_filesystems = {}
+
+
+def load_catalog(url=CATALOG_URL):
+    """
+    Parameters
+    ----------
+    url : string, optional
+        Location of the CMIP6 catalog (csv). The default is CATALOG_URL
+        (Google Cloud).
+
+    Returns
+    -------
+    df : pandas DataFrame
+        CMIP6 catalog, read only once per url.
+
+    """
+    if url not in _catalogs:
+        _catalogs[url] = pd.read_csv(url)
+    return _catalogs[url]
+
+def get_filesystem():
+    """
+    Returns
+    -------
+    fs : gcsfs.GCSFileSystem
+        Anonymous read-only connection to Google Cloud Storage, created
+        only once.
+
+    """
+    if 'gcs' not in _filesystems:
+        import gcsfs
+        _filesystems['gcs'] = gcsfs.GCSFileSystem(token='anon', access='read_only')
+    return _filesystems['gcs']
+
+def get_zstore(df,
+               variable_id,
+               activity_id='ScenarioMIP',
+               source_id='NorESM2-LM',
+               experiment_id='ssp585',
+               table_id=None,
+               member_id=None):
+    """
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Output from load_catalog.
+    variable_id : string
+        Abbreviation for the variable, e.g. 'ta', 'ts', 'tsl', 'snd' or
+        'areacella'.
+    activity_id : string, optional
+        CMIP6 intercomparison project. The default is 'ScenarioMIP'.
+    source_id : string, optional
+        CMIP6 model name and configuration. The default is 'NorESM2-LM'.
+    experiment_id : string, optional
+        CMIP6 modeling experiment ID. The default is 'ssp585'.
+    table_id : string, optional
+        Specifying what kind of data, e.g. 'Amon'. The default is None
+        (any table).
+    member_id : string, optional
+        Ensemble member, e.g. 'r1i1p1f1'. The default is None (last
+        matching entry, as in the scripts).
+
+    Returns
+    -------
+    zstore : string
+        Path to the zarr store.
+
+    """
+    query = "activity_id==@activity_id & source_id==@source_id & experiment_id==@experiment_id & variable_id==@variable_id"
+    if table_id is not None:
+        query += " & table_id==@table_id"
+    if member_id is not None:
+        query += " & member_id==@member_id"
+    df_subset = df.query(query)
+
+    if len(df_subset) == 0:
+        raise KeyError("No CMIP6 data found for "+variable_id+" from "
+                       +source_id+" "+experiment_id
+                       +("" if member_id is None else " "+member_id))
+
+    return df_subset.zstore.values[-1]
+
+def open_zstore(zstore, fs=None, consolidated=True):
+    """
+    Parameters
+    ----------
+    zstore : string
+        Path to a zarr store, output from get_zstore.
+    fs : fsspec filesystem, optional
+        Filesystem to read from. The default is None (get_filesystem).
+    consolidated : bool, optional
+        Whether the store has consolidated metadata. The default is True.
+
+    Returns
+    -------
+    ds : xarray Dataset
+        Lazily opened (dask-backed) dataset.
+
+    """
+    if fs is None:
+        fs = get_filesystem()
+    return xr.open_zarr(fs.get_mapper(zstore), consolidated=consolidated)
+
+def reorder_lon(ds):
+    """
+    Transform lon coordinate from 0,360 to -180,180 and reorder the whole
+    dataset accordingly.
+    """
+    ds = ds.assign_coords(lon=(ds.coords['lon'] + 180) % 360 - 180)
+    return ds.sortby(ds.lon)
+
+def clip_to_domain(ds, variable_id, geometry, all_touched=False):
+    """
+    Parameters
+    ----------
+    ds : xarray Dataset
+        CMIP6 data, e.g. output from open_zstore.
+    variable_id : string
+        Variable to extract.
+    geometry : dictionary
+        GeoJSON polygon of the WRF domain (geojson.loads of the string from
+        create_domain_geometry).
+    all_touched : bool, optional
+        Whether to keep all grid cells touched by the domain border. The
+        default is False.
+
+    Returns
+    -------
+    da : xarray
+        Variable clipped to the domain, longitudes in -180,180.
+
+    """
+    import rioxarray
+
+    da = reorder_lon(ds)[variable_id]
+
+    # prepare DataArray for extraction of a certain geometry
+    # (assign correct dimension names and Coordinate Reference System):
+    da = da.rio.set_spatial_dims(x_dim='lon', y_dim='lat')
+    da = da.rio.write_crs("epsg:4326")
+
+    return da.rio.clip(geometries=[geometry],crs="epsg:4326",drop=True,all_touched=all_touched)
+
+def polygon_from_geometry(geometry):
+    """
+    Border coordinates (lon, lat) of a GeoJSON polygon as numpy array.
+    """
+    return np.asarray(geometry['coordinates'][0],dtype=float)
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy loading of CMIP6 variables that are stored as several NetCDF files
+(time chunks), e.g. the tsl and snd files downloaded from the CEDA Archive.
+
+The files are found by glob and the CMIP6 filename convention
+
+    <variable_id>_<table_id>_<source_id>_<experiment_id>_<member_id>_<grid_label>[_<start>-<end>].nc
+
+and opened together as one dask-backed dataset (files opened in
+parallel), so only the data that is actually used is read from disk. The
+combined time axis is checked to be strictly increasing (no overlapping,
+duplicated or misordered files).
+
+The <start>-<end> part of the filenames gives a time-interval index of the
+directory, so that only the files overlapping the requested periods (and
+months) are opened at all, e.g. 2-4 instead of 9-17 files for a November
+average over a present and a future 10-year period.
+"""
+
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+CMIP6_FILENAME = re.compile(r"^(?P<variable_id>[^_]+)_(?P<table_id>[^_]+)_(?P<source_id>[^_]+)_"
+                            r"(?P<experiment_id>[^_]+)_(?P<member_id>[^_]+)_(?P<grid_label>[^_.]+)"
+                            r"(_(?P<start>\d{4,8})-(?P<end>\d{4,8}))?\.nc$")
+
+
+def parse_filename(path):
+    """
+    Parameters
+    ----------
+    path : string
+        Path to a CMIP6 NetCDF file.
+
+    Returns
+    -------
+    attributes : dictionary
+        variable_id, table_id, source_id, experiment_id, member_id,
+        grid_label, start and end (strings, None for time-independent
+        files) from the filename, None if the name does not follow the
+        CMIP6 convention.
+
+    """
+    match = CMIP6_FILENAME.match(os.path.basename(path))
+    return None if match is None else match.groupdict()
+
+def month_number(date, end=False):
+    """
+    Running month number (12*year+month-1) of a CMIP6 filename date
+    (YYYY, YYYYMM or YYYYMMDD); a year only means January, or December if
+    end is True.
+    """
+    year = int(date[:4])
+    month = int(date[4:6]) if len(date) >= 6 else (12 if end else 1)
+    return 12*year+month-1
+
+def find_files(directory,
+               variable_id,
+               table_id=None,
+               source_id='NorESM2-LM',
+               experiment_id='ssp585',
+               member_id='r1i1p1f1',
+               grid_label=None):
+    """
+    Parameters
+    ----------
+    directory : string
+        Directory with the downloaded files.
+    variable_id : string
+        Abbreviation for the variable, e.g. 'tsl' or 'snd'.
+    table_id : string, optional
+        E.g. 'Lmon' or 'LImon'. The default is None (any table).
+    source_id : string, optional
+        CMIP6 model name and configuration. The default is 'NorESM2-LM'.
+    experiment_id : string, optional
+        CMIP6 modeling experiment ID. The default is 'ssp585'.
+    member_id : string, optional
+        Ensemble member. The default is 'r1i1p1f1'.
+    grid_label : string, optional
+        E.g. 'gn'. The default is None (any grid).
+
+    Returns
+    -------
+    files : list of string
+        Matching files, sorted by the start of their time range.
+
+    """
+    wanted = {'variable_id': variable_id, 'table_id': table_id,
+              'source_id': source_id, 'experiment_id': experiment_id,
+              'member_id': member_id, 'grid_label': grid_label}
+
+    files = []
+    for path in glob.glob(os.path.join(glob.escape(directory),variable_id+'_*.nc')):
+        attributes = parse_filename(path)
+        if attributes is None:
+            continue
+        if all(value is None or attributes[key]==value for key,value in wanted.items()):
+            files.append((attributes['start'] or '',path))
+
+    return [path for start,path in sorted(files)]
+
+def file_index(directory, variable_id, **kwargs):
+    """
+    Parameters
+    ----------
+    directory : string
+        Directory with the downloaded files.
+    variable_id : string
+        Abbreviation for the variable, e.g. 'tsl' or 'snd'.
+    **kwargs
+        Passed on to find_files (table_id, source_id, experiment_id, ...).
+
+    Returns
+    -------
+    index : pandas DataFrame
+        One row per file: path and the first and last month (running month
+        number, see month_number) covered according to the filename,
+        sorted by the first month. Files without time range cover all
+        times.
+
+    """
+    rows = []
+    for path in find_files(directory,variable_id,**kwargs):
+        attributes = parse_filename(path)
+        if attributes['start'] is None:
+            first,last = -np.inf,np.inf
+        else:
+            first,last = month_number(attributes['start']),month_number(attributes['end'],end=True)
+        rows.append({'path': path, 'first_month': first, 'last_month': last})
+
+    return pd.DataFrame(rows,columns=['path','first_month','last_month'])
+
+def select_files(index, periods, months=None):
+    """
+    Parameters
+    ----------
+    index : pandas DataFrame
+        Output from file_index.
+    periods : list of tuple
+        Requested periods as (first_year, last_year), both inclusive, e.g.
+        [(2015,2025),(2047,2057)].
+    months : list of int, optional
+        Only files containing at least one of these months within a period
+        are needed, e.g. [11]. The default is None (all months).
+
+    Returns
+    -------
+    files : list of string
+        Files overlapping at least one of the periods, in time order.
+
+    """
+    needed = np.zeros(len(index),dtype=bool)
+    for first_year,last_year in periods:
+        first = np.maximum(index['first_month'].values,12*first_year)
+        last = np.minimum(index['last_month'].values,12*last_year+11)
+        overlap = first <= last
+        if months is not None:
+            for i in np.flatnonzero(overlap):
+                covered = np.arange(int(first[i]),int(last[i])+1)%12+1
+                overlap[i] = np.isin(covered,months).any()
+        needed |= overlap
+
+    return list(index['path'].values[needed])
+
+def check_time_axis(ds):
+    """
+    Raise a ValueError if the time axis of ds is not strictly increasing,
+    e.g. because files overlap, are duplicated or are sorted wrongly.
+    """
+    time = ds.indexes['time']
+    if not time.is_unique:
+        duplicates = time[time.duplicated()]
+        raise ValueError("Duplicated time steps (overlapping files?), first: "+str(duplicates[0]))
+    if not time.is_monotonic_increasing:
+        raise ValueError("Time axis is not increasing (files in wrong order?)")
+
+def open_cmip6_files(files, parallel=True, chunks=None):
+    """
+    Parameters
+    ----------
+    files : list of string
+        NetCDF files of one variable and experiment, e.g. output from
+        find_files.
+    parallel : bool, optional
+        Open the files in parallel with dask. The default is True.
+    chunks : dictionary, optional
+        Dask chunks. The default is None (one chunk per file).
+
+    Returns
+    -------
+    ds : xarray Dataset
+        Lazily opened (dask-backed) dataset of all files along time.
+
+    """
+    if len(files) == 0:
+        raise FileNotFoundError("No CMIP6 files to open")
+
+    ds = xr.open_mfdataset(files,
+                           combine='nested',
+                           concat_dim='time',
+                           data_vars='minimal',
+                           coords='minimal',
+                           compat='override',
+                           join='override',
+                           parallel=parallel,
+                           chunks={} if chunks is None else chunks)
+    check_time_axis(ds)
+
+    return ds
+
+def open_variable(directory, variable_id, periods=None, months=None,
+                  parallel=True, chunks=None, **kwargs):
+    """
+    Parameters
+    ----------
+    directory : string
+        Directory with the downloaded files.
+    variable_id : string
+        Abbreviation for the variable, e.g. 'tsl' or 'snd'.
+    periods : list of tuple, optional
+        Only open files overlapping these (first_year, last_year) periods,
+        see select_files. The default is None (all files).
+    months : list of int, optional
+        Only open files containing these months within the periods. The
+        default is None (all months).
+    parallel : bool, optional
+        Open the files in parallel with dask. The default is True.
+    chunks : dictionary, optional
+        Dask chunks. The default is None (one chunk per file).
+    **kwargs
+        Passed on to find_files (table_id, source_id, experiment_id, ...).
+
+    Returns
+    -------
+    ds : xarray Dataset
+        Lazily opened dataset of the selected files.
+
+    """
+    index = file_index(directory,variable_id,**kwargs)
+    if len(index) == 0:
+        raise FileNotFoundError("No "+variable_id+" files found in "+directory)
+
+    files = list(index['path'].values) if periods is None else select_files(index,periods,months)
+    if len(files) == 0:
+        raise FileNotFoundError("No "+variable_id+" files in "+directory+" overlap "+str(periods))
+
+    return open_cmip6_files(files,parallel=parallel,chunks=chunks)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Local mirror of the domain-clipped CMIP6 subsets.
+
+We only ever use the Svalbard/Barents part of the global NorESM2 fields,
+but every run of cmip6_data_from_pangeo.py streams the same ta, ts and
+areacella chunks from Google Cloud again. The first request of a
+(zarr store, variable, domain, time filter) combination writes the clipped
+and time-filtered subset to a local zarr store with consolidated metadata
+and provenance attributes (source zstore and version); later requests are
+served from that store.
+
+The mirror location is an fsspec filesystem (local directory by default),
+so it can be tested with the in-memory filesystem and a local stand-in for
+the cloud store, without network access.
+
+Mirror stores are written under a temporary name and renamed when
+complete, one writer per store at a time, so concurrent requests of the
+same subset (e.g. the areacella field shared by all members of a model in
+ensemble_signals.py) neither see nor remove a half-written store.
+"""
+
+import hashlib
+import json
+import posixpath
+import re
+import threading
+import uuid
+
+import fsspec
+import numpy as np
+import xarray as xr
+
+import chunk_fetch as cf
+import cmip6_access as ca
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _mirror_lock(path):
+    """
+    Lock of one mirror store, shared by all threads of the process.
+    """
+    with _locks_lock:
+        return _locks.setdefault(path,threading.Lock())
+
+def zstore_version(zstore):
+    """
+    Version of a Pangeo CMIP6 zarr store, taken from the last path element
+    (e.g. 'v20191108'), None if the path does not contain a version.
+    """
+    match = re.search(r'/(v\d{8})/?$', zstore)
+    return match.group(1) if match else None
+
+def mirror_key(zstore, variable_id, geometry, years=None, months=None, all_touched=False):
+    """
+    Parameters
+    ----------
+    zstore : string
+        Path to the source zarr store.
+    variable_id : string
+        Mirrored variable.
+    geometry : dictionary
+        GeoJSON polygon the data is clipped to.
+    years : tuple of int, optional
+        First and last year kept. The default is None (all years).
+    months : list of int, optional
+        Months kept. The default is None (all months).
+    all_touched : bool, optional
+        Clipping option, see cmip6_access.clip_to_domain. The default is
+        False.
+
+    Returns
+    -------
+    key : string
+        Name of the mirror store for this request.
+
+    """
+    request = json.dumps({'zstore': zstore.rstrip('/'),
+                          'variable_id': variable_id,
+                          'geometry': np.asarray(geometry['coordinates'],dtype=float).round(6).tolist(),
+                          'years': None if years is None else [int(y) for y in years],
+                          'months': None if months is None else sorted(int(m) for m in months),
+                          'all_touched': bool(all_touched)},
+                         sort_keys=True)
+    return variable_id+'_'+hashlib.sha1(request.encode()).hexdigest()[:16]+'.zarr'
+
+def time_positions(time, years=None, months=None):
+    """
+    Positions along time of the given years (first, last; inclusive) and
+    months.
+    """
+    keep = np.ones(time.size,dtype=bool)
+    if years is not None:
+        year = time.dt.year.values
+        keep &= (year>=years[0]) & (year<=years[1])
+    if months is not None:
+        keep &= np.isin(time.dt.month.values,months)
+    return np.flatnonzero(keep)
+
+def select_time(da, years=None, months=None):
+    """
+    Keep only the given years (first, last; inclusive) and months.
+    """
+    if 'time' not in da.dims:
+        return da
+    return da.isel(time=time_positions(da['time'],years,months))
+
+def _read_source(zstore, variable_id, geometry, years, months, all_touched, fs):
+    """
+    Clipped and time-filtered variable from the source store. With a
+    chunk_fetch.CachedChunkFileSystem the chunks of the selected time steps
+    are prefetched concurrently first.
+    """
+    ds = ca.open_zstore(zstore,fs=fs)
+    if 'time' in ds[variable_id].dims:
+        cf.prefetch_selection(fs,zstore,variable_id,
+                              {'time': time_positions(ds['time'],years,months)})
+    da = ca.clip_to_domain(ds,variable_id,geometry,all_touched)
+    return select_time(da,years,months)
+
+def _open_mirror(mapper, zstore):
+    """
+    Open an existing mirror store, None if it does not exist, is
+    incomplete or was built from another source/version.
+    """
+    try:
+        ds = xr.open_zarr(mapper, consolidated=True)
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+    if (ds.attrs.get('mirror_source_zstore') != zstore.rstrip('/')
+            or ds.attrs.get('mirror_source_version') != str(zstore_version(zstore))):
+        return None
+    return ds
+
+def _write_mirror(da, zstore, variable_id, years, months, path, mirror_fs):
+    """
+    Write da with provenance attributes to a temporary store next to path,
+    replace the store at path by it and open it.
+    """
+    ds = da.to_dataset(name=variable_id)
+    for name in ds.variables:
+        ds[name].encoding = {}
+    ds = ds.chunk({dim:-1 for dim in ds.dims if dim != 'time'})
+    ds.attrs['mirror_source_zstore'] = zstore.rstrip('/')
+    ds.attrs['mirror_source_version'] = str(zstore_version(zstore))
+    ds.attrs['mirror_variable_id'] = variable_id
+    ds.attrs['mirror_years'] = 'all' if years is None else str(years[0])+'-'+str(years[1])
+    ds.attrs['mirror_months'] = 'all' if months is None else ','.join(str(m) for m in months)
+
+    temporary_path = path+'.tmp-'+uuid.uuid4().hex
+    ds.to_zarr(mirror_fs.get_mapper(temporary_path),mode='w',consolidated=True)
+    if mirror_fs.exists(path):
+        mirror_fs.rm(path,recursive=True)
+    mirror_fs.mv(temporary_path,path,recursive=True)
+    return xr.open_zarr(mirror_fs.get_mapper(path),consolidated=True)
+
+def open_domain_variable(zstore,
+                         variable_id,
+                         geometry,
+                         years=None,
+                         months=None,
+                         all_touched=False,
+                         fs=None,
+                         mirror_root=None,
+                         mirror_fs=None):
+    """
+    Parameters
+    ----------
+    zstore : string
+        Path to the source zarr store (output from cmip6_access.get_zstore).
+    variable_id : string
+        Variable to extract.
+    geometry : dictionary
+        GeoJSON polygon of the WRF domain.
+    years : tuple of int, optional
+        First and last year kept. The default is None (all years).
+    months : list of int, optional
+        Months kept, e.g. [11]. The default is None (all months).
+    all_touched : bool, optional
+        Clipping option, see cmip6_access.clip_to_domain. The default is
+        False.
+    fs : fsspec filesystem, optional
+        Filesystem of the source store, e.g. a
+        chunk_fetch.CachedChunkFileSystem. The default is None
+        (cmip6_access.get_filesystem, i.e. Google Cloud).
+    mirror_root : string, optional
+        Directory of the mirror. The default is None (no mirror, always
+        read from the source).
+    mirror_fs : fsspec filesystem, optional
+        Filesystem of the mirror. The default is None (local disk).
+
+    Returns
+    -------
+    da : xarray
+        Clipped and time-filtered variable, read from the mirror if it was
+        requested before.
+
+    """
+    if mirror_root is None:
+        return _read_source(zstore,variable_id,geometry,years,months,all_touched,fs)
+
+    if mirror_fs is None:
+        mirror_fs = fsspec.filesystem('file',auto_mkdir=True)
+    path = posixpath.join(mirror_root,mirror_key(zstore,variable_id,geometry,years,months,all_touched))
+    mapper = mirror_fs.get_mapper(path)
+
+    ds = _open_mirror(mapper,zstore)
+    if ds is None:
+        with _mirror_lock(path):
+            # written by another thread while waiting for the lock?
+            ds = _open_mirror(mapper,zstore)
+            if ds is None:
+                ds = _write_mirror(_read_source(zstore,variable_id,geometry,years,months,all_touched,fs),
+                                   zstore,variable_id,years,months,path,mirror_fs)
+
+    return ds[variable_id]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Comparison of the Svalbard selection of the soil temperature and snow depth
+deltas: the lat/lon slices with the manual [1:,4:] trim used for the
+published deltas (kept below as legacy_svalbard_mean), area_weights.
+region_weights with the default SVALBARD_BOX, and SVALBARD_POLYGON with the
+land fraction (sftlf).
+
+Reported are the cells selected by each method and the tsl (met_em soil
+layers) and snd deltas of the paper's warming level windows. The data is
+read from the CEDA tsl/snd files and the Pangeo areacella/sftlf fields, or
+from synthetic NorESM2-like data (see synthetic_cmip6.py) if no
+directories are given. The synthetic data has the NorESM2-LM grid, so the
+selected cells are those of the real data, but its spatial variability is
+random, so its delta differences only show the size of the effect, not the
+real-data values.
+"""
+
+import os
+
+import fsspec
+import numpy as np
+
+import area_weights as aw
+import cmip6_access as ca
+import domain_footprint as dfp
+import ensemble_signals as es
+import pgw_deltas as pd_
+import synthetic_cmip6 as sc
+
+# CEDA files ({variable_id: {experiment_id: directory}}), None for synthetic data:
+local_directories = None
+# local_directories = {'tsl': {'historical': "C:/Users/xxx/Pseudo Global Warming/NorESM2-LM_historical_tsl/",
+#                              'ssp585': "C:/Users/xxx/Pseudo Global Warming/NorESM2-LM_ssp585_tsl/"},
+#                      'snd': {'historical': "C:/Users/xxx/Pseudo Global Warming/NorESM2-LM_historical_snd/",
+#                              'ssp585': "C:/Users/xxx/Pseudo Global Warming/NorESM2-LM_ssp585_snd/"}}
+met_em_file = "C:/Users/xxx/Pseudo Global Warming/yyy/met_em.d01.2019-11-11_12%3A00%3A00.nc"
+root = "C:/Users/xxx/Pseudo Global Warming/synthetic_cmip6_typical"
+
+# windows of the -4K, -2K, +2K, +4K and +6K scenarios (see modify_met_em_files.py):
+start_years = [1955,1963,2040,2047,2058]
+reference_start_year = 2015
+window_length = 10
+month = 11
+
+
+def legacy_svalbard_mean(diff, area):
+    """
+    Svalbard mean as originally computed in calc_avg_soil_warming_svalbard
+    and calc_avg_snowdepth_difference_svalbard (area and data matched by
+    position).
+
+    The string slices are resolved by a search on the lon index that depends
+    on where the index starts: on the global grid and on the paper's domain
+    (lon from about -15) they select lon 2.5-25 (12.5-25 after the trim),
+    on other domains other cells. diff is therefore put on the global grid
+    first.
+    """
+    diff = diff.reindex(lat=area.lat.values,lon=area.lon.values)
+    diff = diff.sel(lat=slice('74.84','82.42'),lon=slice('12.5','25.0'))[...,1:,4:]
+    area = area.sel(lat=slice('74.84','82.42'),lon=slice('12.5','25.0'))[1:,4:]
+    weights = aw.normalised_weights(area)
+    weights = weights.assign_coords(lat=diff.lat.values,lon=diff.lon.values)
+    return aw.weighted_domain_mean(diff,weights)
+
+def legacy_weights(area):
+    area = area.sel(lat=slice('74.84','82.42'),lon=slice('12.5','25.0'))[1:,4:]
+    return aw.normalised_weights(area)
+
+def describe(weights):
+    selected = weights.where(weights>0).stack(cell=('lat','lon')).dropna('cell')
+    return "%2d cells, lat %.2f-%.2f, lon %.2f-%.2f" % (selected.size,
+            selected['lat'].min(),selected['lat'].max(),selected['lon'].min(),selected['lon'].max())
+
+
+if local_directories is None:
+    if not os.path.exists(os.path.join(root,'pangeo-cmip6.csv')):
+        sc.write_zarr_stores(root,size='typical')
+        sc.write_local_directories(root,size='typical')
+        sc.write_met_em_file(os.path.join(root,'met_em_synthetic.nc'))
+    df = ca.load_catalog(os.path.join(root,'pangeo-cmip6.csv'))
+    fs = fsspec.filesystem('file')
+    met_em_file = os.path.join(root,'met_em_synthetic.nc')
+    local_directories = {variable_id: {experiment_id: os.path.join(root,'NorESM2-LM_'+experiment_id+'_'+variable_id)
+                                       for experiment_id in ('historical','ssp585')}
+                         for variable_id in ('tsl','snd')}
+else:
+    df = ca.load_catalog()
+    fs = None
+
+def fx_field(variable_id):
+    return ca.reorder_lon(ca.open_zstore(ca.get_zstore(df,variable_id),fs=fs))[variable_id].load()
+
+area = fx_field('areacella')
+methods = {'legacy slices': legacy_weights(area),
+           'SVALBARD_BOX': aw.region_weights(area)[0],
+           'POLYGON+sftlf': aw.region_weights(area,fx_field('sftlf').values,aw.SVALBARD_POLYGON)[0]}
+print("selected cells (weight > 0):")
+for name,weights in methods.items():
+    print("  %-14s %s" % (name,describe(weights)))
+
+geometry = dfp.domain_footprint(met_em_file)
+periods = pd_.merged_periods(start_years,reference_start_year,window_length)
+deltas = {variable_id: pd_.period_deltas(pd_.local_series(local_directories[variable_id],variable_id,
+                                                          es.signal_variables[variable_id],periods,
+                                                          month,geometry),
+                                         start_years,reference_start_year,window_length,month)
+          for variable_id in ('tsl','snd')}
+
+results = {'legacy slices': (pd_.soil_layer_deltas(legacy_svalbard_mean(deltas['tsl'],area)),
+                             legacy_svalbard_mean(deltas['snd'],area))}
+for name in ('SVALBARD_BOX','POLYGON+sftlf'):
+    results[name] = (pd_.soil_layer_deltas(aw.region_mean(deltas['tsl'],methods[name])),
+                     aw.region_mean(deltas['snd'],methods[name]))
+
+print("deltas (soil layers %s m in K, snow depth in m):" % es.soil_levels_met_em)
+for i,year in enumerate(start_years):
+    for name,(soil,snow) in results.items():
+        print("  %d %-14s %s  %8.4f" % (year,name," ".join("%7.3f" % x for x in soil.values[i]),float(snow[i])))
+for name in ('SVALBARD_BOX','POLYGON+sftlf'):
+    soil = np.abs(results[name][0].values-results['legacy slices'][0].values).max()
+    snow = np.abs(results[name][1].values-results['legacy slices'][1].values).max()
+    print("max. difference to legacy slices, %-14s soil %.2e K, snow depth %.2e m" % (name,soil,snow))
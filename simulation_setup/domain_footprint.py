@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Footprint (border polygon) of the WRF domain of a met_em file, shared by
+all CMIP6 extractors.
+
+Only the four boundary rows/columns of XLONG_M and XLAT_M are read (as
+hyperslabs, not the full 2D fields). The border is simplified to a
+tolerance in degrees and cached in memory, keyed by a hash of the met_em
+file (path, size and modification time), and as GeoJSON file in cache_dir
+if one is given. A new domain therefore only needs a new met_em file
+instead of coordinates pasted into the scripts.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from netCDF4 import Dataset
+
+_footprints = {}
+
+
+def file_hash(met_em_file):
+    """
+    Hash of the absolute path, size and modification time of a file
+    (cheap compared to hashing the content of a large met_em file).
+    """
+    stat = os.stat(met_em_file)
+    key = '|'.join([os.path.realpath(met_em_file),str(stat.st_size),str(stat.st_mtime_ns)])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def boundary_coordinates(met_em_file):
+    """
+    Parameters
+    ----------
+    met_em_file : string
+        Path to met_em file (intermediate WRF input file).
+
+    Returns
+    -------
+    polygon : numpy array
+        Border coordinates (lon, lat) of the domain, counter-clockwise in
+        grid space (south, east, north and west edge) and closed (first
+        point repeated at the end).
+
+    """
+    with Dataset(met_em_file) as data:
+        edges = []
+        for name in ("XLONG_M","XLAT_M"):
+            var = data.variables[name]          # index 0 removes time dimension
+            edges.append(np.concatenate((np.ma.filled(var[0,0,:]),
+                                         np.ma.filled(var[0,1:,-1]),
+                                         np.flip(np.ma.filled(var[0,-1,:-1])),
+                                         np.flip(np.ma.filled(var[0,:-1,0])))))
+
+    return np.column_stack(edges).astype(float)
+
+def simplify_polygon(polygon, tolerance=0.01):
+    """
+    Parameters
+    ----------
+    polygon : numpy array
+        Border coordinates (lon, lat), e.g. output from boundary_coordinates.
+    tolerance : float, optional
+        Maximum deviation of the simplified border in degrees. The default
+        is 0.01 (about 1 km, well below the GCM grid spacing).
+
+    Returns
+    -------
+    polygon : numpy array
+        Simplified, closed border coordinates (lon, lat).
+
+    """
+    import shapely
+
+    simplified = shapely.simplify(shapely.Polygon(polygon),tolerance,preserve_topology=True)
+    return np.asarray(simplified.exterior.coords)
+
+def domain_footprint(met_em_file, tolerance=0.01, cache_dir=None):
+    """
+    Parameters
+    ----------
+    met_em_file : string
+        Path to met_em file (intermediate WRF input file).
+    tolerance : float, optional
+        Simplification tolerance in degrees, see simplify_polygon. The
+        default is 0.01.
+    cache_dir : string, optional
+        Directory of the GeoJSON cache files (created if needed). The
+        default is None (nothing written, only cached in memory).
+
+    Returns
+    -------
+    geometry : dictionary
+        GeoJSON polygon of the domain border.
+
+    """
+    key = file_hash(met_em_file)+'_'+str(tolerance)
+    if key in _footprints:
+        return _footprints[key]
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir,'footprint_'+hashlib.sha1(key.encode()).hexdigest()[:16]+'.geojson')
+        if os.path.exists(cache_file):
+            with open(cache_file) as f:
+                _footprints[key] = json.load(f)
+            return _footprints[key]
+
+    polygon = simplify_polygon(boundary_coordinates(met_em_file),tolerance)
+    geometry = {'type': 'Polygon',
+                'coordinates': [np.round(polygon,6).tolist()]}
+
+    if cache_file is not None:
+        os.makedirs(cache_dir,exist_ok=True)
+        temp_file = cache_file+'.'+str(os.getpid())+'.tmp'
+        with open(temp_file,'w') as f:
+            json.dump(geometry,f)
+        os.replace(temp_file,cache_file)
+    _footprints[key] = geometry
+
+    return geometry
+
+def domain_geometries(met_em_file, tolerance=0.01, cache_dir=None):
+    """
+    Parameters
+    ----------
+    met_em_file : string
+        Path to met_em file (intermediate WRF input file).
+    tolerance : float, optional
+        Simplification tolerance in degrees. The default is 0.01.
+    cache_dir : string, optional
+        Directory of the GeoJSON cache files, see domain_footprint. The
+        default is None (no cache files).
+
+    Returns
+    -------
+    geometries : dictionary list
+        Border of met_em file domain (coordinates as numpy array).
+    geometries_string : dictionary string
+        Border of met_em file domain as GeoJSON string (for geojson.loads).
+
+    """
+    geometry = domain_footprint(met_em_file,tolerance,cache_dir)
+    geometries = [
+        {'type': 'Polygon',
+         'coordinates': [np.array(geometry['coordinates'][0])]}
+        ]
+    return geometries,json.dumps(geometry)
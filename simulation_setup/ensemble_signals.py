@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Warming signals (atmospheric profile, surface/sea surface temperature,
+soil temperature and snow depth changes) for several CMIP6 models and
+ensemble members, e.g. to build a multi-model PGW envelope.
+
+The signal of each model/member is extracted in its own thread. The work
+is dominated by reading zarr chunks from the cloud (I/O bound), so running
+the models concurrently with a bounded thread pool makes the whole
+ensemble take about as long as the slowest model instead of the sum of
+all of them.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xarray as xr
+from scipy.interpolate import CubicSpline
+
+import area_weights as aw
+import cmip6_access as ca
+import cmip6_mirror as cm
+import window_climatology as wc
+
+# soil levels of the WRF met_em files (see soil_warming_NorESM2_to_met_em.py):
+soil_levels_met_em = np.array([0.035, 0.175, 0.64, 1.945, 5.0])
+
+# variable_id: table_id
+signal_variables = {'ta': 'Amon',
+                    'ts': 'Amon',
+                    'tsl': 'Lmon',
+                    'snd': 'LImon'}
+
+
+def open_series(variable_id, table_id, first_year, last_year, month, geometry,
+                source_id, member_id, scenario, df, fs, mirror_root):
+    """
+    Domain-clipped monthly series covering first_year to last_year, taken
+    from the historical experiment before 2015 and from the scenario after.
+    """
+    parts = []
+    if first_year < 2015:
+        parts.append(('CMIP','historical'))
+    if last_year >= 2015:
+        parts.append(('ScenarioMIP',scenario))
+
+    series = []
+    for activity_id,experiment_id in parts:
+        zstore = ca.get_zstore(df,variable_id,activity_id=activity_id,
+                               source_id=source_id,experiment_id=experiment_id,
+                               table_id=table_id,member_id=member_id)
+        series.append(cm.open_domain_variable(zstore,variable_id,geometry,
+                                              years=(first_year,last_year),
+                                              months=[month],fs=fs,
+                                              mirror_root=mirror_root))
+
+    return series[0] if len(series)==1 else xr.concat(series,dim='time')
+
+def _window_delta(variable_id, table_id, start_year, reference_start_year,
+                  window_length, month, geometry, source_id, member_id,
+                  scenario, df, fs, mirror_root):
+    """
+    Difference of the month-filtered window means (assessed minus
+    reference period) of one variable.
+    """
+    means = []
+    for year in (start_year,reference_start_year):
+        series = open_series(variable_id,table_id,year,year+window_length-1,
+                             month,geometry,source_id,member_id,scenario,df,
+                             fs,mirror_root)
+        means.append(wc.yearly_month_series(series,month).mean(dim='year'))
+
+    return (means[0]-means[1]).compute()
+
+def empty_signal(error=''):
+    """
+    Signal of a model/member without any valid variable (all NaN).
+    """
+    return {'surface_warming': np.nan,
+            'warming_profile': None,
+            'plev': None,
+            'soil_warming': np.full(len(soil_levels_met_em),np.nan),
+            'snow_depth_change': np.nan,
+            'error': error}
+
+def _member_signal(source_id, member_id, geometry, start_year, **kwargs):
+    """
+    model_signal of one model/member; any failure (I/O, clipping, ...) is
+    recorded in error instead of aborting the whole ensemble.
+    """
+    try:
+        return model_signal(source_id,member_id,geometry,start_year,**kwargs)
+    except Exception as err:
+        return empty_signal(type(err).__name__+': '+str(err))
+
+def model_signal(source_id,
+                 member_id,
+                 geometry,
+                 start_year,
+                 reference_start_year=2015,
+                 scenario='ssp585',
+                 window_length=10,
+                 month=11,
+                 land_geometry=None,
+                 df=None,
+                 fs=None,
+                 mirror_root=None):
+    """
+    Parameters
+    ----------
+    source_id : string
+        CMIP6 model name and configuration, e.g. 'NorESM2-LM'.
+    member_id : string
+        Ensemble member, e.g. 'r1i1p1f1'.
+    geometry : dictionary
+        GeoJSON polygon of the WRF domain.
+    start_year : int
+        Start year of the assessed (historic or future) period.
+    reference_start_year : int, optional
+        Start year of the reference period. The default is 2015.
+    scenario : string, optional
+        Scenario used from 2015 on. The default is 'ssp585'.
+    window_length : int, optional
+        Number of years per period. The default is 10.
+    month : int, optional
+        Month averaged in each period. The default is 11 (November).
+    land_geometry : dictionary, optional
+        GeoJSON polygon of the land region soil temperature and snow depth
+        are averaged over (e.g. Svalbard). The default is None (land points
+        in the whole WRF domain).
+    df : pandas DataFrame, optional
+        Output from cmip6_access.load_catalog. The default is None
+        (catalog loaded on first use).
+    fs : fsspec filesystem, optional
+        The default is None (cmip6_access.get_filesystem).
+    mirror_root : string, optional
+        Local directory where the clipped subsets are mirrored (see
+        cmip6_mirror.py). The default is None (no mirror).
+
+    Returns
+    -------
+    signal : dictionary
+        surface_warming (float), warming_profile and plev (numpy arrays),
+        soil_warming (numpy array on soil_levels_met_em), snow_depth_change
+        (float) and error (string, empty if all variables were found).
+        Variables that are not available for the model are NaN.
+
+    """
+    if df is None:
+        df = ca.load_catalog()
+    if land_geometry is None:
+        land_geometry = geometry
+
+    signal = empty_signal()
+    errors = []
+
+    def delta(variable_id, clip_geometry):
+        return _window_delta(variable_id,signal_variables[variable_id],
+                             start_year,reference_start_year,window_length,
+                             month,clip_geometry,source_id,member_id,scenario,
+                             df,fs,mirror_root)
+
+    def weights(clip_geometry):
+        zstore = ca.get_zstore(df,'areacella',source_id=source_id)
+        area = cm.open_domain_variable(zstore,'areacella',clip_geometry,fs=fs,
+                                       mirror_root=mirror_root)
+        return aw.normalised_weights(area.load())
+
+    try:
+        domain_weights = weights(geometry)
+        land_weights = domain_weights if land_geometry is geometry else weights(land_geometry)
+    except KeyError as err:
+        signal['error'] = str(err)
+        return signal
+
+    try:
+        signal['surface_warming'] = float(aw.weighted_domain_mean(delta('ts',geometry),domain_weights))
+    except KeyError as err:
+        errors.append(str(err))
+
+    try:
+        profile = aw.weighted_domain_mean(delta('ta',geometry),domain_weights)
+        signal['warming_profile'] = profile.values
+        signal['plev'] = profile['plev'].values
+    except KeyError as err:
+        errors.append(str(err))
+
+    try:
+        # ocean points are NaN and drop out of the average:
+        soil = aw.weighted_domain_mean(delta('tsl',land_geometry),land_weights)
+        valid = np.isfinite(soil.values)
+        spline = CubicSpline(soil['depth'].values[valid],soil.values[valid])
+        signal['soil_warming'] = spline(soil_levels_met_em)
+    except KeyError as err:
+        errors.append(str(err))
+
+    try:
+        signal['snow_depth_change'] = float(aw.weighted_domain_mean(delta('snd',land_geometry),land_weights))
+    except KeyError as err:
+        errors.append(str(err))
+
+    signal['error'] = '; '.join(errors)
+
+    return signal
+
+def ensemble_signals(source_ids,
+                     member_ids,
+                     geometry,
+                     start_year,
+                     max_workers=4,
+                     **kwargs):
+    """
+    Parameters
+    ----------
+    source_ids : list of string
+        CMIP6 models, e.g. ['NorESM2-LM','NorESM2-MM','CESM2'].
+    member_ids : list of string or dictionary
+        Ensemble members used for every model, or a dictionary with a list
+        of members per source_id.
+    geometry : dictionary
+        GeoJSON polygon of the WRF domain.
+    start_year : int
+        Start year of the assessed (historic or future) period.
+    max_workers : int, optional
+        Number of models/members read concurrently. The default is 4.
+    **kwargs
+        Passed on to model_signal (reference_start_year, scenario,
+        window_length, month, land_geometry, mirror_root).
+
+    Returns
+    -------
+    signals : xarray Dataset
+        Ensemble table with dimension 'member' (coordinates source_id and
+        member_id): surface_warming, warming_profile (member, plev),
+        soil_warming (member, soil_level), snow_depth_change and error
+        (missing variables or the failure of a member, which is then NaN
+        for all signals; the other members are still computed).
+    statistics : xarray Dataset
+        Output from ensemble_statistics.
+
+    """
+    if isinstance(member_ids,dict):
+        runs = [(source_id,member_id) for source_id in source_ids
+                for member_id in member_ids.get(source_id,[])]
+    else:
+        runs = [(source_id,member_id) for source_id in source_ids
+                for member_id in member_ids]
+
+    # catalog and filesystem are shared by all threads:
+    if kwargs.get('df') is None:
+        kwargs['df'] = ca.load_catalog()
+    if kwargs.get('fs') is None:
+        kwargs['fs'] = ca.get_filesystem()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_member_signal,source_id,member_id,geometry,
+                               start_year,**kwargs)
+                   for source_id,member_id in runs]
+        results = [future.result() for future in futures]
+
+    # pressure levels in Pa, rounded to match between models:
+    plev = sorted({int(round(p)) for result in results
+                   if result['plev'] is not None for p in result['plev']},
+                  reverse=True)
+    profiles = np.full((len(runs),len(plev)),np.nan)
+    for i,result in enumerate(results):
+        if result['plev'] is not None:
+            index = [plev.index(int(round(p))) for p in result['plev']]
+            profiles[i,index] = result['warming_profile']
+
+    signals = xr.Dataset(
+        {'surface_warming': ('member',[r['surface_warming'] for r in results]),
+         'warming_profile': (('member','plev'),profiles),
+         'soil_warming': (('member','soil_level'),np.array([r['soil_warming'] for r in results])),
+         'snow_depth_change': ('member',[r['snow_depth_change'] for r in results]),
+         'error': ('member',[r['error'] for r in results])},
+        coords={'source_id': ('member',[run[0] for run in runs]),
+                'member_id': ('member',[run[1] for run in runs]),
+                'plev': np.array(plev,dtype=float),
+                'soil_level': soil_levels_met_em})
+    signals.attrs['start_year'] = start_year
+
+    return signals,ensemble_statistics(signals)
+
+def ensemble_statistics(signals):
+    """
+    Parameters
+    ----------
+    signals : xarray Dataset
+        Ensemble table from ensemble_signals.
+
+    Returns
+    -------
+    statistics : xarray Dataset
+        Mean, standard deviation (sample, ddof=1; NaN with fewer than two
+        valid members), minimum, maximum and number of valid members of
+        every signal along dimension 'statistic'.
+
+    """
+    signals = signals.drop_vars(['error','source_id','member_id'])
+    statistics = xr.concat([signals.mean(dim='member'),
+                            signals.std(dim='member',ddof=1),
+                            signals.min(dim='member'),
+                            signals.max(dim='member'),
+                            signals.count(dim='member')],
+                           dim='statistic')
+    return statistics.assign_coords(statistic=['mean','std','min','max','count'])
@@ -8,6 +8,8 @@ import numpy as np
 from scipy.interpolate import CubicSpline
 import os
 
+import pgw_scenarios as ps
+
 def perturb_atm_temp(met_em_file,delta_T_profile,x_length,y_length):
     """
     Parameters
@@ -320,9 +322,21 @@ delta_SST = 6.0
 delta_SNOWH = -1.6792828
 delta_SNOW  = delta_SNOWH*250.
 
-# soil warming per layer:
-delta_T_soil_layers = np.array([5.35247425, 5.41100253, 5.5025648,
-                                4.25167636, 2.06164913])
+# soil warming per layer
+# (written by soil_warming_NorESM2_to_met_em.py, 2058 = +6K scenario):
+scenario_file = "/nird/projects/NS9600K/brittsc/xxx/pgw_scenarios.json"
+delta_T_soil_layers = ps.get_scenario(scenario_file,'2058')['delta_T_soil_layers']
+# delta_T_soil_layers = np.array([5.35247425, 5.41100253, 5.5025648,
+#                                 4.25167636, 2.06164913])
+
+# (the complete delta set of a scenario, written in one job by
+# pgw_deltas.extract_pgw_deltas, can be read the same way; delta_SST is the
+# target warming level given as warming_levels, the measured surface
+# warming of the window is delta_ts:)
+# deltas = ps.get_scenario(scenario_file,'2058')
+# delta_T_GCM,delta_SST = deltas['delta_T_GCM'],deltas['delta_SST']
+# delta_SNOWH,delta_SNOW = deltas['delta_SNOWH'],deltas['delta_SNOW']
+# delta_T_soil_layers = deltas['delta_T_soil_layers']
 
 
 path = "/nird/projects/NS9600K/brittsc/xxx/met_em_files/"
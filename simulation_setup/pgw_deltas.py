@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Complete PGW delta set (atmospheric warming profile, SST, soil layers,
+snow depth and snow water equivalent) for several warming levels in one
+job, instead of running cmip6_data_from_pangeo.py, cmip6_tsl_from_CEDA.py
+and cmip6_snd_from_CEDA.py separately and copying the results.
+
+The work shared between the variables is done once: the domain footprint
+of the met_em file, the catalog, the area weights of the WRF domain and the
+Svalbard weights, and the year selection of the periods. Every
+variable is read once as a November (or other month) series of only the
+reference and assessed periods (overlapping periods merged, so local files
+and cloud chunks of the years in between are not read), and all period
+means are computed in one pass over that series.
+
+Variables are read from the Pangeo CMIP6 cloud data, or from local CMIP6
+files (e.g. tsl and snd downloaded from the CEDA Archive) if a directory
+is given for them.
+"""
+
+import numpy as np
+import xarray as xr
+from scipy.interpolate import CubicSpline
+
+import area_weights as aw
+import cmip6_access as ca
+import cmip6_files as c6f
+import cmip6_mirror as cm
+import domain_footprint as dfp
+import ensemble_signals as es
+import pgw_scenarios as ps
+import window_climatology as wc
+
+# snow water equivalent per snow depth (kg m-3), as in modify_met_em_files.py:
+snow_density = 250.
+
+
+def merged_periods(start_years, reference_start_year=2015, window_length=10):
+    """
+    Periods (first_year, last_year) of the reference and all assessed
+    windows in time order, overlapping or adjacent windows merged.
+    """
+    periods = []
+    for year in sorted(set(start_years)|{reference_start_year}):
+        if periods and year <= periods[-1][1]+1:
+            periods[-1] = (periods[-1][0],max(periods[-1][1],year+window_length-1))
+        else:
+            periods.append((year,year+window_length-1))
+    return periods
+
+def local_series(directories, variable_id, table_id, periods, month, geometry,
+                 source_id='NorESM2-LM', member_id='r1i1p1f1', scenario='ssp585'):
+    """
+    Domain-clipped series of the given month and periods (list of
+    (first_year, last_year), e.g. from merged_periods) from local CMIP6
+    files (directories: {experiment_id: directory}), taken from the
+    historical experiment before 2015 and from the scenario after. Only the
+    files overlapping the periods are opened.
+    """
+    parts = [('historical',[(first,min(last,2014)) for first,last in periods if first < 2015]),
+             (scenario,[(max(first,2015),last) for first,last in periods if last >= 2015])]
+    years = np.concatenate([np.arange(first,last+1) for first,last in periods])
+
+    series = []
+    for experiment_id,experiment_periods in parts:
+        if not experiment_periods:
+            continue
+        ds = c6f.open_variable(directories[experiment_id],variable_id,
+                               periods=experiment_periods,months=[month],
+                               table_id=table_id,source_id=source_id,
+                               experiment_id=experiment_id,member_id=member_id)
+        da = ca.clip_to_domain(ds,variable_id,geometry)
+        time = da['time']
+        series.append(da.isel(time=np.flatnonzero(np.isin(time.dt.year.values,years)
+                                                  & (time.dt.month.values==month))))
+
+    return series[0] if len(series)==1 else xr.concat(series,dim='time')
+
+def cloud_series(variable_id, table_id, periods, month, geometry, source_id,
+                 member_id, scenario, df, fs, mirror_root):
+    """
+    Domain-clipped series of the given month and periods from the Pangeo
+    CMIP6 cloud data, one ensemble_signals.open_series request (and mirror
+    store) per period.
+    """
+    series = [es.open_series(variable_id,table_id,first,last,month,geometry,
+                             source_id,member_id,scenario,df,fs,mirror_root)
+              for first,last in periods]
+    return series[0] if len(series)==1 else xr.concat(series,dim='time')
+
+def period_deltas(series, start_years, reference_start_year=2015,
+                  window_length=10, month=11):
+    """
+    Parameters
+    ----------
+    series : xarray
+        Monthly data covering the reference and all assessed periods.
+    start_years : list of int
+        Start years of the assessed periods.
+    reference_start_year : int, optional
+        Start year of the reference period. The default is 2015.
+    window_length : int, optional
+        Number of years per period. The default is 10.
+    month : int, optional
+        Month averaged in each period. The default is 11 (November).
+
+    Returns
+    -------
+    deltas : xarray
+        Period mean minus reference period mean, with dimension
+        start_year. All period means are computed in one pass.
+
+    """
+    yearly = wc.yearly_month_series(series,month)
+    means = [yearly.sel(year=slice(year,year+window_length-1)).mean(dim='year')
+             for year in list(start_years)+[reference_start_year]]
+    means = xr.concat(means,dim='start_year').compute()
+
+    deltas = means.isel(start_year=slice(0,-1))-means.isel(start_year=-1)
+    return deltas.assign_coords(start_year=list(start_years))
+
+def soil_layer_deltas(soil_profiles, soil_levels=es.soil_levels_met_em):
+    """
+    Interpolate soil warming profiles (start_year, depth) to the met_em soil
+    levels with one cubic spline for all periods; depths without data
+    (NaN in any period) are left out.
+    """
+    valid = np.isfinite(soil_profiles.values).all(axis=0)
+    spline = CubicSpline(soil_profiles['depth'].values[valid],
+                         soil_profiles.values[:,valid],axis=1)
+    return xr.DataArray(spline(soil_levels),
+                        dims=('start_year','soil_level'),
+                        coords={'start_year': soil_profiles['start_year'].values,
+                                'soil_level': soil_levels})
+
+def extract_pgw_deltas(met_em_file,
+                       start_years,
+                       warming_levels=None,
+                       variables=('ta','ts','tsl','snd'),
+                       reference_start_year=2015,
+                       window_length=10,
+                       month=11,
+                       source_id='NorESM2-LM',
+                       member_id='r1i1p1f1',
+                       scenario='ssp585',
+                       local_directories=None,
+                       land_polygon=aw.SVALBARD_BOX,
+                       land_fraction=False,
+                       scenario_file=None,
+                       df=None,
+                       fs=None,
+                       mirror_root=None,
+                       footprint_cache_dir=None):
+    """
+    Parameters
+    ----------
+    met_em_file : string
+        Path to met_em file (intermediate WRF input file).
+    start_years : list of int
+        Start years of the assessed (historic or future) periods, e.g. the
+        output of window_climatology.find_warming_level_windows.
+    warming_levels : list of float, optional
+        Target warming level of each start year (e.g. the 'target'
+        coordinate of find_warming_level_windows), written as delta_SST:
+        as in modify_met_em_files.py, the SST is perturbed by the target
+        level (6.0, 4.0, ...), not by the surface warming measured in the
+        window (delta_ts). The default is None (no delta_SST).
+    variables : tuple of string, optional
+        Variables to extract, any of 'ta' (delta_T_GCM), 'ts' (delta_ts),
+        'tsl' (delta_T_soil_layers) and 'snd' (delta_SNOWH, delta_SNOW).
+        The default is all of them.
+    reference_start_year : int, optional
+        Start year of the reference period. The default is 2015.
+    window_length : int, optional
+        Number of years per period. The default is 10.
+    month : int, optional
+        Month averaged in each period. The default is 11 (November).
+    source_id : string, optional
+        CMIP6 model name and configuration. The default is 'NorESM2-LM'.
+    member_id : string, optional
+        Ensemble member. The default is 'r1i1p1f1'.
+    scenario : string, optional
+        Scenario used from 2015 on. The default is 'ssp585'.
+    local_directories : dictionary, optional
+        Local files for some variables, {variable_id: {experiment_id:
+        directory}}, e.g. {'tsl': {'ssp585': ..., 'historical': ...}}.
+        The default is None (all variables from the Pangeo cloud data).
+    land_polygon : numpy array, optional
+        Land region soil temperature and snow depth are averaged over. The
+        default is area_weights.SVALBARD_BOX (the NorESM2 cells of the
+        published deltas).
+    land_fraction : bool, optional
+        Whether to weight the land region with the model land fraction
+        (sftlf), e.g. with land_polygon=area_weights.SVALBARD_POLYGON. The
+        default is False (area weights only, as for the published deltas).
+    scenario_file : string, optional
+        If given, the deltas are written to this scenario file (see
+        pgw_scenarios.py), one scenario per start year. The default is
+        None.
+    df : pandas DataFrame, optional
+        Output from cmip6_access.load_catalog. The default is None
+        (catalog loaded on first use).
+    fs : fsspec filesystem, optional
+        The default is None (cmip6_access.get_filesystem).
+    mirror_root : string, optional
+        Local mirror of the clipped cloud data (see cmip6_mirror.py). The
+        default is None (no mirror).
+    footprint_cache_dir : string, optional
+        Directory of the GeoJSON cache files of the domain footprint, shared
+        with the single-variable extractors (see domain_footprint.py). The
+        default is None (footprint only cached in memory).
+
+    Returns
+    -------
+    deltas : xarray Dataset
+        delta_T_GCM (start_year, plev), delta_ts (start_year, measured
+        domain mean surface warming), delta_T_soil_layers (start_year,
+        soil_level), delta_SNOWH and delta_SNOW (start_year), depending on
+        variables, and delta_SST (start_year, target warming level) if
+        warming_levels is given.
+
+    """
+    if df is None:
+        df = ca.load_catalog()
+    if local_directories is None:
+        local_directories = {}
+    start_years = [int(year) for year in start_years]
+    if warming_levels is not None and len(warming_levels) != len(start_years):
+        raise ValueError("warming_levels needs one target per start year")
+
+    # shared by all variables:
+    geometry = dfp.domain_footprint(met_em_file,cache_dir=footprint_cache_dir)
+    periods = merged_periods(start_years,reference_start_year,window_length)
+
+    def fx_field(variable_id, clip):
+        zstore = ca.get_zstore(df,variable_id,source_id=source_id)
+        if clip:
+            return cm.open_domain_variable(zstore,variable_id,geometry,fs=fs,
+                                           mirror_root=mirror_root).load()
+        return ca.reorder_lon(ca.open_zstore(zstore,fs=fs))[variable_id].load()
+
+    if 'ta' in variables or 'ts' in variables:
+        domain_weights = aw.normalised_weights(fx_field('areacella',clip=True))
+    if 'tsl' in variables or 'snd' in variables:
+        land_weights = aw.region_weights(fx_field('areacella',clip=False),
+                                         fx_field('sftlf',clip=False).values if land_fraction else None,
+                                         land_polygon)[0]
+
+    def deltas_of(variable_id):
+        table_id = es.signal_variables[variable_id]
+        if variable_id in local_directories:
+            series = local_series(local_directories[variable_id],variable_id,
+                                  table_id,periods,month,geometry,source_id,
+                                  member_id,scenario)
+        else:
+            series = cloud_series(variable_id,table_id,periods,month,geometry,
+                                  source_id,member_id,scenario,df,fs,mirror_root)
+        return period_deltas(series,start_years,reference_start_year,
+                             window_length,month)
+
+    deltas = xr.Dataset(coords={'start_year': start_years})
+    if 'ta' in variables:
+        deltas['delta_T_GCM'] = aw.weighted_domain_mean(deltas_of('ta'),domain_weights)
+    if 'ts' in variables:
+        deltas['delta_ts'] = aw.weighted_domain_mean(deltas_of('ts'),domain_weights)
+    if warming_levels is not None:
+        deltas['delta_SST'] = ('start_year',np.asarray(warming_levels,dtype=float))
+    if 'tsl' in variables:
+        deltas['delta_T_soil_layers'] = soil_layer_deltas(aw.region_mean(deltas_of('tsl'),land_weights))
+    if 'snd' in variables:
+        deltas['delta_SNOWH'] = aw.region_mean(deltas_of('snd'),land_weights)
+        deltas['delta_SNOW'] = deltas['delta_SNOWH']*snow_density
+
+    deltas.attrs.update({'source_id': source_id, 'member_id': member_id,
+                         'scenario': scenario, 'window_length': window_length,
+                         'month': month, 'reference_start_year': reference_start_year})
+
+    if scenario_file is not None:
+        ps.write_scenarios(scenario_file,
+                           {str(year): {name: deltas[name].sel(start_year=year).values
+                                        for name in deltas.data_vars}
+                            for year in start_years})
+
+    return deltas
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Machine-readable file (JSON) with the PGW deltas of every scenario, written
+by the scripts that derive the deltas from NorESM2 (e.g.
+soil_warming_NorESM2_to_met_em.py) and read by modify_met_em_files.py, so
+no values have to be copied between the scripts.
+
+Layout of the file:
+
+    {"<scenario>": {"<delta name>": value or list of values, ...}, ...}
+
+with the scenario named by the start year of the assessed 10-year period
+(e.g. "2058") and delta names as used in modify_met_em_files.py (e.g.
+"delta_T_soil_layers").
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+def read_scenarios(scenario_file):
+    """
+    All scenarios in scenario_file as dictionary (empty if the file does
+    not exist yet).
+    """
+    if not os.path.exists(scenario_file):
+        return {}
+    with open(scenario_file) as f:
+        return json.load(f)
+
+def write_scenarios(scenario_file, scenarios):
+    """
+    Parameters
+    ----------
+    scenario_file : string
+        Path to the scenario file (created if it does not exist).
+    scenarios : dictionary
+        {scenario: {delta name: value}}, values as float or numpy array.
+        Deltas already in the file are replaced, all others are kept.
+
+    Returns
+    -------
+    None.
+
+    """
+    content = read_scenarios(scenario_file)
+    for scenario,deltas in scenarios.items():
+        entry = content.setdefault(str(scenario),{})
+        for name,value in deltas.items():
+            value = np.asarray(value,dtype=float)
+            entry[name] = value.tolist() if value.ndim else float(value)
+
+    directory = os.path.dirname(scenario_file)
+    if directory:
+        os.makedirs(directory,exist_ok=True)
+    temp_file = scenario_file+'.'+str(os.getpid())+'.tmp'
+    with open(temp_file,'w') as f:
+        json.dump(content,f,indent=2,sort_keys=True)
+    os.replace(temp_file,scenario_file)
+
+def get_scenario(scenario_file, scenario):
+    """
+    Parameters
+    ----------
+    scenario_file : string
+        Path to the scenario file.
+    scenario : string or int
+        Scenario name, e.g. '2058'.
+
+    Returns
+    -------
+    deltas : dictionary
+        {delta name: float or numpy array} of the scenario.
+
+    """
+    content = read_scenarios(scenario_file)
+    if str(scenario) not in content:
+        raise KeyError("Scenario "+str(scenario)+" not in "+scenario_file)
+    return {name: np.array(value) if isinstance(value,list) else value
+            for name,value in content[str(scenario)].items()}
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Repacking of CMIP6 chunk files (e.g. tsl/snd from the CEDA Archive) into
+one compressed local zarr store for repeated analysis.
+
+The downloaded NetCDF files are global, monthly and chunked for writing
+(one or a few time steps per chunk), while the extraction reads one month
+per year in a small Arctic box over many decades. The repacked store keeps
+only the region (longitudes reordered to -180,180 as in the extractors)
+and uses chunks that are small in lat/lon and long in time, so a
+warming-level study reads a few small chunks instead of every file.
+
+benchmark_extraction compares the extraction time and the bytes actually
+read (counted with CountingFileSystem) before and after repacking.
+"""
+
+import io
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+import xarray as xr
+from fsspec.implementations.local import LocalFileSystem
+
+import cmip6_access as ca
+import cmip6_files as c6f
+
+# the byte count of the NetCDF files (file objects) needs h5netcdf and its
+# h5py backend:
+try:
+    import h5netcdf
+    import h5py
+except ImportError:
+    h5netcdf = None
+
+# time steps (months) and grid points per chunk of the repacked store:
+default_chunks = {'time': 1200, 'lat': 16, 'lon': 16}
+
+
+def bounds_from_geometry(geometry, margin=2.5):
+    """
+    Latitude and longitude bounds of a GeoJSON polygon (e.g. the WRF domain)
+    plus a margin in degrees (default one NorESM2 grid spacing).
+    """
+    polygon = ca.polygon_from_geometry(geometry)
+    return ((polygon[:,1].min()-margin,polygon[:,1].max()+margin),
+            (polygon[:,0].min()-margin,polygon[:,0].max()+margin))
+
+def crop_region(ds, lat_bounds=None, lon_bounds=None):
+    """
+    Reorder longitudes to -180,180 and keep only the box given by
+    lat_bounds and lon_bounds (tuples (min, max), None keeps everything).
+    """
+    ds = ca.reorder_lon(ds)
+    if lat_bounds is not None:
+        ds = ds.sel(lat=slice(*lat_bounds))
+    if lon_bounds is not None:
+        ds = ds.sel(lon=slice(*lon_bounds))
+    return ds
+
+def _source_files(directory, variable_id, periods=None, months=None, **kwargs):
+    """
+    Files cmip6_files.open_variable opens for the same arguments (kwargs
+    passed on to cmip6_files.find_files).
+    """
+    index = c6f.file_index(directory,variable_id,**kwargs)
+    return list(index['path'].values) if periods is None else c6f.select_files(index,periods,months)
+
+def repack_variable(directory,
+                    variable_id,
+                    store_path,
+                    lat_bounds=None,
+                    lon_bounds=None,
+                    chunks=None,
+                    **kwargs):
+    """
+    Parameters
+    ----------
+    directory : string
+        Directory with the downloaded NetCDF files.
+    variable_id : string
+        Abbreviation for the variable, e.g. 'tsl' or 'snd'.
+    store_path : string
+        Path of the repacked zarr store (overwritten if it exists).
+    lat_bounds : tuple, optional
+        (min, max) latitude of the region kept. The default is None (all).
+    lon_bounds : tuple, optional
+        (min, max) longitude (-180 to 180) of the region kept. The default
+        is None (all).
+    chunks : dictionary, optional
+        Chunk sizes of the store. The default is None (default_chunks, other
+        dimensions like depth in one chunk).
+    **kwargs
+        Selection of the files as in cmip6_files.open_variable (table_id,
+        experiment_id, periods, months, ...).
+
+    Returns
+    -------
+    ds : xarray Dataset
+        The repacked store, lazily opened.
+
+    """
+    source_files = _source_files(directory,variable_id,**kwargs)
+    ds = c6f.open_cmip6_files(source_files)
+    ds = crop_region(ds[[variable_id]],lat_bounds,lon_bounds)
+
+    if chunks is None:
+        chunks = default_chunks
+    ds = ds.chunk({dim: chunks.get(dim,-1) for dim in ds[variable_id].dims})
+    for name in ds.variables:
+        ds[name].encoding = {}
+
+    ds.attrs['repack_source_files'] = ','.join(os.path.basename(f) for f in source_files)
+    ds.attrs['repack_lat_bounds'] = 'all' if lat_bounds is None else str(tuple(lat_bounds))
+    ds.attrs['repack_lon_bounds'] = 'all' if lon_bounds is None else str(tuple(lon_bounds))
+
+    ds.to_zarr(store_path,mode='w',consolidated=True)
+
+    return xr.open_zarr(store_path,consolidated=True)
+
+def window_means(ds, variable_id, start_years, month=11, window_length=10,
+                 lat_bounds=None, lon_bounds=None):
+    """
+    Mean of the given month over window_length years from each start year
+    in the region (the extraction done for every warming level).
+    """
+    da = crop_region(ds,lat_bounds,lon_bounds)[variable_id]
+    da = da.isel(time=np.flatnonzero(da['time'].dt.month.values==month))
+    year = da['time'].dt.year.values
+
+    means = [da.isel(time=np.flatnonzero((year>=start)&(year<start+window_length))).mean(dim='time')
+             for start in start_years]
+    return xr.concat(means,dim='start_year').assign_coords(start_year=list(start_years)).compute()
+
+class _CountedFile(io.RawIOBase):
+    """
+    Readable file object passing reads on to f and adding the bytes to
+    count.
+    """
+
+    def __init__(self, f, count):
+        super().__init__()
+        self.f = f
+        self.count = count
+
+    def readinto(self, buffer):
+        n = self.f.readinto(buffer)
+        self.count(n or 0)
+        return n
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        return self.f.seek(offset,whence)
+
+    def tell(self):
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+class CountingFileSystem(LocalFileSystem):
+    """
+    Local filesystem counting the bytes read through it (bytes_read), for
+    NetCDF files opened as file objects (xarray/h5netcdf) and zarr stores
+    opened with get_mapper.
+    """
+
+    cachable = False
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def _count(self, n):
+        with self._lock:
+            self.bytes_read += n
+
+    def _open(self, path, mode='rb', **kwargs):
+        f = super()._open(path,mode,**kwargs)
+        return _CountedFile(f,self._count) if 'r' in mode else f
+
+def benchmark_extraction(directory,
+                         variable_id,
+                         store_path,
+                         start_years,
+                         lat_bounds=None,
+                         lon_bounds=None,
+                         month=11,
+                         window_length=10,
+                         repeats=3,
+                         **kwargs):
+    """
+    Parameters
+    ----------
+    directory : string
+        Directory with the downloaded NetCDF files.
+    variable_id : string
+        Abbreviation for the variable, e.g. 'tsl' or 'snd'.
+    store_path : string
+        Repacked store, output path of repack_variable.
+    start_years : list of int
+        Start years of the extracted windows, e.g. [2015,2047,2074].
+    lat_bounds, lon_bounds : tuple, optional
+        Region of the extraction. The default is None (all).
+    month : int, optional
+        Extracted month. The default is 11 (November).
+    window_length : int, optional
+        Number of years per window. The default is 10.
+    repeats : int, optional
+        Number of timed runs (the fastest is reported). The default is 3.
+    **kwargs
+        Selection of the files as in cmip6_files.open_variable.
+
+    Returns
+    -------
+    result : dictionary
+        source_seconds and store_seconds (opening plus extraction),
+        speedup, source_bytes_read and store_bytes_read (bytes read from
+        disk by one extraction, see CountingFileSystem) and max_difference
+        between the two extractions. source_bytes_read is None if h5netcdf
+        (with h5py) is not installed.
+
+    """
+    if h5netcdf is None:
+        warnings.warn("h5netcdf (with h5py) is not installed: the bytes read from the NetCDF files "
+                      "are not counted (source_bytes_read is None), only the timings")
+
+    def extract(ds):
+        return window_means(ds,variable_id,start_years,month,window_length,
+                            lat_bounds,lon_bounds)
+
+    def timed(open_data):
+        times = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            means = extract(open_data())
+            times.append(time.perf_counter()-start)
+        return min(times),means
+
+    source_files = _source_files(directory,variable_id,**kwargs)
+    source_seconds,source_means = timed(lambda: c6f.open_cmip6_files(source_files))
+    store_seconds,store_means = timed(lambda: xr.open_zarr(store_path,consolidated=True))
+
+    # one more extraction each with the reads counted (NetCDF files as file
+    # objects, which needs h5netcdf):
+    source_bytes_read = None
+    if h5netcdf is not None:
+        source_fs = CountingFileSystem()
+        extract(c6f.open_cmip6_files([source_fs.open(f) for f in source_files],parallel=False))
+        source_bytes_read = source_fs.bytes_read
+    store_fs = CountingFileSystem()
+    extract(xr.open_zarr(store_fs.get_mapper(store_path),consolidated=True))
+
+    return {'source_seconds': source_seconds,
+            'store_seconds': store_seconds,
+            'speedup': source_seconds/store_seconds,
+            'source_bytes_read': source_bytes_read,
+            'store_bytes_read': store_fs.bytes_read,
+            'max_difference': float(np.nanmax(np.abs(source_means.values-store_means.values)))}
@@ -7,12 +7,15 @@ Created on Thu Jan 11 15:33:36 2024
 The vertical levels that soil temperature is given/required on is
 different for NorESM2 and the WRF met_em file. This code is for
 interpolating in between the two grids (from NorESM to WRF).
-Results are printed and copied into the script modify_met_em_files.py.
+The profiles of all scenarios are interpolated at once and written to the
+scenario file read by modify_met_em_files.py (see pgw_scenarios.py).
 """
 
 import numpy as np
 from scipy.interpolate import CubicSpline
 
+import pgw_scenarios as ps
+
 soil_levels_NorESM = np.array([1.00000000e-02, 4.00000000e-02, 
        9.00000000e-02, 1.60000000e-01, 2.60000000e-01, 4.00000000e-01, 
        5.80000000e-01, 8.00000000e-01, 1.06000000e+00, 1.36000000e+00, 
@@ -83,7 +86,59 @@ soil_warming_NorESM_2074 = np.array([5.55616856, 5.57749796, 5.60893679,
 
 soil_levels_met_em = np.array([0.035, 0.175, 0.64, 1.945, 5.0])
 
-warming_signal = CubicSpline(soil_levels_NorESM,soil_warming_NorESM_2074)
-delta_T_WRF = warming_signal(soil_levels_met_em)
+def interpolate_soil_warming(soil_warming,
+                             soil_levels=soil_levels_NorESM,
+                             target_levels=soil_levels_met_em):
+    """
+    Parameters
+    ----------
+    soil_warming : numpy array
+        Soil warming profiles on soil_levels, one row per scenario
+        (n_scenarios x n_levels) or a single profile.
+    soil_levels : numpy array, optional
+        Depths of the profiles. The default is soil_levels_NorESM.
+    target_levels : numpy array, optional
+        Depths to interpolate to. The default is soil_levels_met_em.
+
+    Returns
+    -------
+    delta_T_WRF : numpy array
+        Soil warming on target_levels (n_scenarios x n_target_levels), from
+        one cubic spline build over all scenarios.
+
+    """
+    warming_signal = CubicSpline(soil_levels,np.atleast_2d(soil_warming),axis=1)
+    return warming_signal(target_levels)
+
+def write_soil_scenarios(scenario_file, start_years, soil_warming):
+    """
+    Interpolate the soil warming profiles of all scenarios (rows of
+    soil_warming, scenarios named by start_years) to the met_em levels and
+    write them as delta_T_soil_layers to scenario_file.
+
+    Returns
+    -------
+    delta_T_WRF : numpy array
+        Output from interpolate_soil_warming.
+
+    """
+    delta_T_WRF = interpolate_soil_warming(soil_warming)
+    ps.write_scenarios(scenario_file,{str(year): {'delta_T_soil_layers': delta}
+                                      for year,delta in zip(start_years,delta_T_WRF)})
+    return delta_T_WRF
+
+
+scenario_file = "/nird/projects/NS9600K/brittsc/xxx/pgw_scenarios.json"
+
+# start years of the assessed periods (-4K, -2K, +2K, +4K, +6K and 2074):
+start_years = [1955, 1963, 2040, 2047, 2058, 2074]
+soil_warming_NorESM = np.stack([soil_warming_NorESM_1955,
+                                soil_warming_NorESM_1963,
+                                soil_warming_NorESM_2040,
+                                soil_warming_NorESM_2047,
+                                soil_warming_NorESM_2058,
+                                soil_warming_NorESM_2074])
+
+delta_T_WRF = write_soil_scenarios(scenario_file,start_years,soil_warming_NorESM)
 
 print(delta_T_WRF)
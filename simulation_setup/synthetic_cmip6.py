@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic NorESM2-like CMIP6 data for running and timing the extractors
+offline (no Pangeo or CEDA access).
+
+Written are
+  - zarr stores in the Pangeo layout (CMIP6/<activity_id>/NCC/<source_id>/
+    <experiment_id>/<member_id>/<table_id>/<variable_id>/gn/<version>/)
+    plus a catalog csv, usable with cmip6_access.load_catalog and a local
+    fsspec filesystem,
+  - NetCDF time-chunk files with CMIP6 filenames as downloaded from the
+    CEDA Archive, usable with cmip6_files.open_variable,
+  - a minimal met_em file (XLAT_M, XLONG_M) of a Svalbard domain, usable
+    with domain_footprint.domain_footprint.
+
+The data has the NorESM2 coordinates (lat, lon in 0-360, plev, depth,
+monthly noleap time, areacella, sftlf in %), a seasonal cycle, optional
+noise and a linear trend, so the deltas of any two periods are known
+(expected_delta) and the extraction result can be checked as well as
+timed.
+"""
+
+import os
+
+import cftime
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# CMIP6 plev19 pressure levels (Pa):
+PLEV19 = np.array([100000., 92500., 85000., 70000., 60000., 50000., 40000.,
+                   30000., 25000., 20000., 15000., 10000., 7000., 5000.,
+                   3000., 2000., 1000., 500., 100.])
+
+# depth of the NorESM2 (CLM5) soil levels (m):
+CLM5_DEPTH = np.array([0.01, 0.04, 0.09, 0.16, 0.26, 0.40, 0.58, 0.80, 1.06,
+                       1.36, 1.70, 2.08, 2.50, 2.99, 3.58, 4.27, 5.06, 5.95,
+                       6.94, 8.03, 9.79, 13.33, 19.48, 28.87, 41.99])
+
+# grid (lat and lon points) and years of the generated data:
+SIZES = {'small': {'nlat': 96, 'nlon': 144, 'historical': (2005,2014), 'scenario': (2015,2064)},
+         'typical': {'nlat': 96, 'nlon': 144, 'historical': (1950,2014), 'scenario': (2015,2100)},
+         'stress': {'nlat': 192, 'nlon': 288, 'historical': (1850,2014), 'scenario': (2015,2100)}}
+
+# variable_id: table_id, level dimension, units, trend per year
+# (relative to 2015) and value in 2015:
+VARIABLES = {'ta': ('Amon','plev','K',0.06,None),
+             'ts': ('Amon',None,'K',0.05,None),
+             'tsl': ('Lmon','depth','K',0.05,None),
+             'snd': ('LImon',None,'m',-0.002,0.4)}
+
+# land (sftlf = 100%) as (lat_min, lat_max, lon_min, lon_max), lon -180,180:
+LAND_BOXES = [(76.5,80.5,10.,28.),      # Svalbard
+              (60.,83.,-60.,-20.),      # Greenland
+              (58.,71.,5.,30.)]         # Scandinavia
+
+VERSION = 'v20191108'
+
+
+def grid(size='typical'):
+    """
+    Latitudes (-90 to 90) and longitudes (0 to 360) of the given size.
+    """
+    nlat,nlon = SIZES[size]['nlat'],SIZES[size]['nlon']
+    return np.linspace(-90.,90.,nlat),np.arange(nlon)*360./nlon
+
+def monthly_time(first_year, last_year):
+    """
+    Mid-month noleap time axis from January first_year to December
+    last_year.
+    """
+    return np.array([cftime.DatetimeNoLeap(year,month,15)
+                     for year in range(first_year,last_year+1) for month in range(1,13)])
+
+def area(lat, lon, radius=6371000.):
+    """
+    Grid cell area (m2) of a regular lat/lon grid, as areacella.
+    """
+    lat_edges = np.clip(np.concatenate(([lat[0]],(lat[1:]+lat[:-1])/2,[lat[-1]])),-90.,90.)
+    dlon = np.deg2rad(360./len(lon))
+    band = radius**2*dlon*np.abs(np.diff(np.sin(np.deg2rad(lat_edges))))
+    return np.repeat(band[:,None],len(lon),axis=1)
+
+def land_fraction(lat, lon):
+    """
+    Land area fraction in % (sftlf), 100 inside LAND_BOXES and 0 elsewhere.
+    """
+    lon_180 = (lon+180)%360-180
+    land = np.zeros((len(lat),len(lon)))
+    for lat_min,lat_max,lon_min,lon_max in LAND_BOXES:
+        land[np.ix_((lat>=lat_min)&(lat<=lat_max),(lon_180>=lon_min)&(lon_180<=lon_max))] = 100.
+    return land
+
+def levels(variable_id):
+    """
+    Level coordinate (name, values) of a variable, None for 2D variables.
+    """
+    level_dim = VARIABLES[variable_id][1]
+    if level_dim is None:
+        return None
+    return level_dim,(PLEV19 if level_dim == 'plev' else CLM5_DEPTH)
+
+def trend_profile(variable_id):
+    """
+    Trend factor per level (1 for 2D variables); soil warming decreases
+    with depth.
+    """
+    level = levels(variable_id)
+    if level is None:
+        return np.ones(1)
+    if level[0] == 'depth':
+        return np.exp(-level[1]/10.)
+    return np.ones(len(level[1]))
+
+def expected_delta(variable_id, start_year, reference_start_year=2015):
+    """
+    Imposed change between two equally long periods (per level), the value
+    the extraction of the noise-free data has to reproduce.
+    """
+    return VARIABLES[variable_id][3]*(start_year-reference_start_year)*trend_profile(variable_id)
+
+def synthetic_block(variable_id, first_year, last_year, size='typical',
+                    noise=0.5, seed=0):
+    """
+    Parameters
+    ----------
+    variable_id : string
+        'ta', 'ts', 'tsl' or 'snd'.
+    first_year, last_year : int
+        Years of the block (inclusive).
+    size : string, optional
+        Key of SIZES. The default is 'typical'.
+    noise : float, optional
+        Standard deviation of the added noise (for snd scaled by 1/50). The
+        default is 0.5.
+    seed : int, optional
+        Random seed, combined with first_year so every block differs. The
+        default is 0.
+
+    Returns
+    -------
+    ds : xarray Dataset
+        Monthly float32 data of the variable, NaN over the ocean for the
+        land variables tsl and snd.
+
+    """
+    table_id,level_dim,units,trend,value_2015 = VARIABLES[variable_id]
+    lat,lon = grid(size)
+    time = monthly_time(first_year,last_year)
+    year = np.repeat(np.arange(first_year,last_year+1),12).astype(float)
+    month = np.tile(np.arange(1,13),last_year-first_year+1)
+
+    level = levels(variable_id)
+    shape_level = () if level is None else (len(level[1]),)
+    sin_lat = np.sin(np.deg2rad(lat))[:,None]
+
+    if value_2015 is None:
+        climate = 288.-40.*sin_lat**2+np.zeros(len(lon))
+        season = 10.*np.cos(2*np.pi*(month-7)/12.)
+    else:
+        climate = np.full((len(lat),len(lon)),float(value_2015))
+        season = -0.2*value_2015*np.cos(2*np.pi*(month-7)/12.)
+    if level_dim == 'plev':
+        climate = climate*(level[1][:,None,None]/1e5)**0.19
+    elif level is not None:
+        climate = np.repeat(climate[None],len(level[1]),axis=0)
+
+    along_time = (slice(None),)+(None,)*(len(shape_level)+2)
+    profile = trend_profile(variable_id).reshape(shape_level+(1,1))
+    data = climate[None]+season[along_time]+(trend*(year-2015))[along_time]*profile
+    if noise:
+        rng = np.random.default_rng([seed,first_year])
+        data = data+rng.normal(0.,noise if value_2015 is None else noise/50.,data.shape)
+    if value_2015 is not None:
+        data = np.maximum(data,0.)
+    if variable_id in ('tsl','snd'):
+        data = np.where(land_fraction(lat,lon)>0,data,np.nan)
+
+    dims = ('time',)+(() if level is None else (level[0],))+('lat','lon')
+    coords = {'time': time, 'lat': lat, 'lon': lon}
+    if level is not None:
+        coords[level[0]] = level[1]
+    ds = xr.Dataset({variable_id: (dims,data.astype('float32'),{'units': units})},coords=coords)
+    ds['lat'].attrs = {'units': 'degrees_north', 'standard_name': 'latitude'}
+    ds['lon'].attrs = {'units': 'degrees_east', 'standard_name': 'longitude'}
+    return ds
+
+def fx_dataset(variable_id, size='typical'):
+    """
+    areacella (m2) or sftlf (%) as dataset.
+    """
+    lat,lon = grid(size)
+    values,units = (area(lat,lon),'m2') if variable_id == 'areacella' else (land_fraction(lat,lon),'%')
+    return xr.Dataset({variable_id: (('lat','lon'),values,{'units': units})},
+                      coords={'lat': lat, 'lon': lon})
+
+def _experiments(size, scenario):
+    """
+    (activity_id, experiment_id, first_year, last_year) of a size.
+    """
+    return [('CMIP','historical')+SIZES[size]['historical'],
+            ('ScenarioMIP',scenario)+SIZES[size]['scenario']]
+
+def _catalog_row(path, activity_id, source_id, experiment_id, member_id,
+                 table_id, variable_id):
+    return {'activity_id': activity_id, 'institution_id': 'NCC',
+            'source_id': source_id, 'experiment_id': experiment_id,
+            'member_id': member_id, 'table_id': table_id,
+            'variable_id': variable_id, 'grid_label': 'gn', 'zstore': path,
+            'dcpp_init_year': np.nan, 'version': VERSION[1:]}
+
+def write_zarr_stores(root,
+                      variables=('ta','ts','tsl','snd'),
+                      size='typical',
+                      source_id='NorESM2-LM',
+                      member_id='r1i1p1f1',
+                      scenario='ssp585',
+                      years_per_chunk=10,
+                      noise=0.5,
+                      seed=0):
+    """
+    Parameters
+    ----------
+    root : string
+        Local directory the stores and the catalog are written to.
+    variables : tuple of string, optional
+        Variables written for the historical and the scenario experiment
+        (areacella and sftlf are always written). The default is
+        ('ta','ts','tsl','snd').
+    size : string, optional
+        Key of SIZES. The default is 'typical'.
+    source_id : string, optional
+        Model name used in paths and catalog. The default is 'NorESM2-LM'.
+    member_id : string, optional
+        Ensemble member. The default is 'r1i1p1f1'.
+    scenario : string, optional
+        Scenario experiment. The default is 'ssp585'.
+    years_per_chunk : int, optional
+        Years per zarr chunk (and per written block) along time. The
+        default is 10.
+    noise, seed : optional
+        See synthetic_block.
+
+    Returns
+    -------
+    df : pandas DataFrame
+        Catalog of the written stores (also saved as
+        root/pangeo-cmip6.csv), to be used with cmip6_access.get_zstore and
+        fs = fsspec.filesystem('file').
+
+    """
+    rows = []
+    def store_path(activity_id, experiment_id, table_id, variable_id):
+        return os.path.join(root,'CMIP6',activity_id,'NCC',source_id,experiment_id,
+                            member_id,table_id,variable_id,'gn',VERSION)
+
+    for activity_id,experiment_id,first_year,last_year in _experiments(size,scenario):
+        for variable_id in variables:
+            table_id = VARIABLES[variable_id][0]
+            path = store_path(activity_id,experiment_id,table_id,variable_id)
+            for year in range(first_year,last_year+1,years_per_chunk):
+                ds = synthetic_block(variable_id,year,min(year+years_per_chunk-1,last_year),
+                                     size,noise,seed)
+                ds = ds.chunk({dim: (12*years_per_chunk if dim == 'time' else -1) for dim in ds.dims})
+                if year == first_year:
+                    ds.to_zarr(path,mode='w',consolidated=True)
+                else:
+                    ds.to_zarr(path,append_dim='time',consolidated=True)
+            rows.append(_catalog_row(path,activity_id,source_id,experiment_id,
+                                     member_id,table_id,variable_id))
+
+    for variable_id in ('areacella','sftlf'):
+        path = store_path('ScenarioMIP',scenario,'fx',variable_id)
+        fx_dataset(variable_id,size).to_zarr(path,mode='w',consolidated=True)
+        rows.append(_catalog_row(path,'ScenarioMIP',source_id,scenario,member_id,'fx',variable_id))
+
+    df = pd.DataFrame(rows)
+    df.to_csv(os.path.join(root,'pangeo-cmip6.csv'),index=False)
+    return df
+
+def write_netcdf_files(directory,
+                       variable_id,
+                       experiment_id='ssp585',
+                       size='typical',
+                       source_id='NorESM2-LM',
+                       member_id='r1i1p1f1',
+                       years_per_file=10,
+                       noise=0.5,
+                       seed=0):
+    """
+    Parameters
+    ----------
+    directory : string
+        Directory the files are written to (created if needed).
+    variable_id : string
+        'ta', 'ts', 'tsl' or 'snd'.
+    experiment_id : string, optional
+        'historical' or a scenario. The default is 'ssp585'.
+    size : string, optional
+        Key of SIZES. The default is 'typical'.
+    source_id, member_id : string, optional
+        Used in the filenames. The defaults are 'NorESM2-LM' and
+        'r1i1p1f1'.
+    years_per_file : int, optional
+        Years per file. The default is 10.
+    noise, seed : optional
+        See synthetic_block (same seed gives the same data as
+        write_zarr_stores).
+
+    Returns
+    -------
+    files : list of string
+        Written files, named by the CMIP6 convention
+        <variable_id>_<table_id>_<source_id>_<experiment_id>_<member_id>_gn_<YYYYMM>-<YYYYMM>.nc
+
+    """
+    table_id = VARIABLES[variable_id][0]
+    first_year,last_year = SIZES[size]['historical' if experiment_id == 'historical' else 'scenario']
+    os.makedirs(directory,exist_ok=True)
+
+    files = []
+    for year in range(first_year,last_year+1,years_per_file):
+        end_year = min(year+years_per_file-1,last_year)
+        path = os.path.join(directory,'_'.join([variable_id,table_id,source_id,experiment_id,member_id,'gn',
+                                                '%d01-%d12.nc' % (year,end_year)]))
+        synthetic_block(variable_id,year,end_year,size,noise,seed).to_netcdf(path)
+        files.append(path)
+    return files
+
+def write_local_directories(root,
+                            variables=('tsl','snd'),
+                            size='typical',
+                            scenario='ssp585',
+                            **kwargs):
+    """
+    NetCDF files (write_netcdf_files) of the historical and the scenario
+    experiment in root/<source_id>_<experiment_id>_<variable_id>/, returned
+    as {variable_id: {experiment_id: directory}} (the local_directories of
+    pgw_deltas.extract_pgw_deltas).
+    """
+    source_id = kwargs.get('source_id','NorESM2-LM')
+    directories = {}
+    for variable_id in variables:
+        directories[variable_id] = {}
+        for experiment_id in ('historical',scenario):
+            directory = os.path.join(root,source_id+'_'+experiment_id+'_'+variable_id)
+            write_netcdf_files(directory,variable_id,experiment_id,size,**kwargs)
+            directories[variable_id][experiment_id] = directory
+    return directories
+
+def write_met_em_file(path, lat_range=(74.,82.), lon_range=(5.,35.), shape=(89,119)):
+    """
+    Minimal met_em file with XLAT_M and XLONG_M (Time, south_north,
+    west_east) of a regular lat/lon domain, e.g. around Svalbard.
+    """
+    from netCDF4 import Dataset
+
+    lat,lon = np.meshgrid(np.linspace(*lat_range,shape[0]),np.linspace(*lon_range,shape[1]),indexing='ij')
+    with Dataset(path,'w') as data:
+        data.createDimension('Time',None)
+        data.createDimension('south_north',shape[0])
+        data.createDimension('west_east',shape[1])
+        for name,values in (('XLAT_M',lat),('XLONG_M',lon)):
+            var = data.createVariable(name,'f4',('Time','south_north','west_east'))
+            var[0] = values
+    return path
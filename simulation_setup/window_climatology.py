@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Month-filtered multi-year window means ("windowed climatology") for all
+possible start years of a GCM time series in one pass.
+
+Instead of rerunning future_GCM_*_from_WRF_domain for every candidate
+start_year_warmed_period (each call reading and averaging eleven Novembers),
+the clipped monthly series is streamed once, the selected month is
+accumulated into running (cumulative) sums along the year axis and the
+10-year mean for every start year follows from the difference of two
+cumulative sums. The result is a (start_year, [plev/depth,] lat, lon) cube
+that can be cached to disk, so the change signal between any two windows
+becomes a lookup.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+
+import area_weights as aw
+
+
+def yearly_month_series(data, month=11):
+    """
+    Parameters
+    ----------
+    data : xarray
+        Monthly GCM data with a 'time' dimension (e.g. clipped to the WRF
+        domain, but not time-averaged).
+    month : int, optional
+        Month to keep from each year. The default is 11 (November).
+
+    Returns
+    -------
+    series : xarray
+        Data of the selected month with dimension 'year' instead of 'time'.
+        Missing years inside the covered range are filled with NaN so that
+        the year axis is contiguous.
+
+    """
+    series = data.sel(time=(data['time'].dt.month==month).values)
+    years = series['time'].dt.year.values
+    if len(np.unique(years)) != len(years):
+        raise ValueError("More than one time step per year for month "
+                         + str(month) + ", is the data really monthly?")
+
+    series = series.assign_coords(year=('time',years)).swap_dims({'time':'year'})
+    series = series.drop_vars('time')
+    series = series.reindex(year=np.arange(years.min(),years.max()+1))
+
+    return series
+
+def cache_signature(data, window_length, month, min_years):
+    """
+    Parameters
+    ----------
+    data : xarray
+        Monthly GCM data with a 'time' dimension.
+    window_length, month, min_years :
+        As in window_climatology.
+
+    Returns
+    -------
+    signature : dict
+        Window settings, variable name, experiment, time span and a hash
+        of the coordinates and attributes of data (no data values are
+        read), stored in the attributes of a cached cube and compared
+        before the cache is used.
+
+    """
+    source_hash = hashlib.sha1()
+    for name in sorted(data.coords):
+        source_hash.update(name.encode())
+        source_hash.update(np.asarray(data[name].values).astype(str).tobytes())
+    source_hash.update(repr(sorted((key,str(value)) for key,value in data.attrs.items())).encode())
+    time = data['time'].values
+
+    return {'window_length': window_length,
+            'month': month,
+            'min_years': min_years,
+            'variable': str(data.name),
+            'experiment_id': str(data.attrs.get('experiment_id','')),
+            'time_span': str(time[0])+' to '+str(time[-1]),
+            'source_hash': source_hash.hexdigest()}
+
+def window_climatology(data,
+                       window_length=10,
+                       month=11,
+                       min_years=None,
+                       block_years=20,
+                       cache_file=None):
+    """
+    Parameters
+    ----------
+    data : xarray
+        Monthly GCM data with a 'time' dimension. Historical and scenario
+        data can be concatenated along time beforehand to get windows that
+        span both experiments.
+    window_length : int, optional
+        Number of years per window. The default is 10, i.e. the window
+        starting in start_year covers start_year to start_year+9.
+    month : int, optional
+        Month averaged within each window. The default is 11 (November).
+    min_years : int, optional
+        Minimum number of valid years in a window, windows with fewer valid
+        years are set to NaN. The default is None (all years required).
+    block_years : int, optional
+        Number of years loaded into memory at once while streaming through
+        the series. The default is 20.
+    cache_file : string, optional
+        Path to a NetCDF file. If it exists and was built from the same
+        source (see cache_signature: variable, experiment, time span,
+        coordinates and attributes) with the same window_length, month and
+        min_years, the cube is read from it; otherwise the cube is computed
+        and written to it. The default is None (no cache).
+
+    Returns
+    -------
+    cube : xarray
+        Window means with dimension 'start_year' in front of the remaining
+        (non-time) dimensions of data.
+
+    """
+    if min_years is None:
+        min_years = window_length
+
+    signature = cache_signature(data, window_length, month, min_years)
+    if cache_file is not None and os.path.exists(cache_file):
+        with xr.open_dataarray(cache_file) as cube:
+            if all(cube.attrs.get(key)==value for key,value in signature.items()):
+                return cube.load()
+
+    series = yearly_month_series(data, month)
+    n_years = series.sizes['year']
+    if n_years < window_length:
+        raise ValueError("Series covers only "+str(n_years)+" years, "
+                         "shorter than window_length="+str(window_length))
+
+    # STREAM THROUGH SERIES
+    # running sums and counts of valid values, index k holds the sum over
+    # the first k years:
+    field_shape = series.shape[1:]
+    csum = np.zeros((n_years+1,)+field_shape)
+    ccount = np.zeros((n_years+1,)+field_shape)
+
+    for start in range(0,n_years,block_years):
+        block = np.asarray(series.isel(year=slice(start,start+block_years)).values,
+                           dtype=float)
+        valid = np.isfinite(block)
+        end = start+block.shape[0]
+        csum[start+1:end+1] = csum[start] + np.cumsum(np.where(valid,block,0.),axis=0)
+        ccount[start+1:end+1] = ccount[start] + np.cumsum(valid,axis=0)
+
+    # WINDOW MEANS
+    window_sum = csum[window_length:]-csum[:-window_length]
+    window_count = ccount[window_length:]-ccount[:-window_length]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        window_mean = np.where(window_count>=min_years,
+                               window_sum/window_count,
+                               np.nan)
+
+    start_years = series['year'].values[:n_years-window_length+1]
+    coords = {name:coord for name,coord in series.coords.items()
+              if 'year' not in coord.dims}
+    coords['start_year'] = start_years
+    cube = xr.DataArray(window_mean,
+                        dims=('start_year',)+series.dims[1:],
+                        coords=coords,
+                        name=data.name,
+                        attrs=dict(data.attrs,**signature))
+
+    if cache_file is not None:
+        cube.to_netcdf(cache_file)
+
+    return cube
+
+def window_mean(cube, start_year):
+    """
+    Parameters
+    ----------
+    cube : xarray
+        Output from window_climatology.
+    start_year : int
+        Start year of the window.
+
+    Returns
+    -------
+    mean : xarray
+        Time-averaged field of the window starting in start_year. Note
+        that future_GCM_*_from_WRF_domain select start_year to
+        start_year+10 inclusively (11 Novembers); build the cube with
+        window_length=11 to reproduce their output exactly.
+
+    """
+    return cube.sel(start_year=start_year)
+
+def window_delta(cube, start_year, reference_start_year=2015, reference_cube=None):
+    """
+    Parameters
+    ----------
+    cube : xarray
+        Output from window_climatology for the assessed period.
+    start_year : int
+        Start year of the assessed (historic or future) window.
+    reference_start_year : int, optional
+        Start year of the reference window. The default is 2015.
+    reference_cube : xarray, optional
+        Output from window_climatology containing the reference window,
+        e.g. from ssp585 when cube is from the historical experiment. The
+        default is None (reference taken from cube).
+
+    Returns
+    -------
+    delta : xarray
+        Difference assessed minus reference window.
+
+    """
+    if reference_cube is None:
+        reference_cube = cube
+
+    return window_mean(cube,start_year)-window_mean(reference_cube,reference_start_year)
+
+def find_warming_level_windows(surface_cube,
+                               area,
+                               targets=(-4.,-2.,2.,4.,6.),
+                               reference_start_year=2015,
+                               candidate_start_years=None,
+                               profile_cube=None,
+                               soil_cube=None,
+                               soil_area=None,
+                               snow_cube=None,
+                               snow_area=None):
+    """
+    Parameters
+    ----------
+    surface_cube : xarray
+        Output from window_climatology for 'ts' or 'tas'.
+    area : xarray
+        Output from get_area_per_grid_point (cmip6_data_from_pangeo.py).
+    targets : list of float, optional
+        Target domain-averaged surface warming levels in K. The default is
+        (-4.,-2.,2.,4.,6.), i.e. the PGW experiments.
+    reference_start_year : int, optional
+        Start year of the reference (present day) window. The default is
+        2015.
+    candidate_start_years : array of int, optional
+        Start years to search. The default is None (all windows in
+        surface_cube that do not overlap the reference window).
+    profile_cube : xarray, optional
+        Output from window_climatology for 'ta'. The default is None.
+    soil_cube : xarray, optional
+        Output from window_climatology for 'tsl', restricted to the same
+        grid points as soil_area. The default is None.
+    soil_area : xarray, optional
+        Output from get_area_per_grid_point_svalbard. The default is None.
+    snow_cube : xarray, optional
+        Output from window_climatology for 'snd', restricted to the same
+        grid points as snow_area. The default is None.
+    snow_area : xarray, optional
+        Output from get_area_per_grid_point_svalbard. The default is None.
+
+    Returns
+    -------
+    windows : xarray Dataset
+        Along dimension 'target': start_year of the window whose domain
+        averaged surface warming is closest to the target, the achieved
+        surface_warming and its deviation from the target, and, if the
+        corresponding cubes are given, the matching warming_profile,
+        soil_warming and snow_depth_change.
+
+    """
+    targets = np.atleast_1d(np.asarray(targets,dtype=float))
+    window_length = surface_cube.attrs.get('window_length',10)
+
+    if candidate_start_years is None:
+        start_years = surface_cube['start_year'].values
+        overlap = np.abs(start_years-reference_start_year) < window_length
+        candidate_start_years = start_years[~overlap]
+
+    # surface warming of all candidate windows in one go:
+    surface_delta = (surface_cube.sel(start_year=candidate_start_years)
+                     - surface_cube.sel(start_year=reference_start_year))
+    warming = aw.weighted_domain_mean(surface_delta,aw.normalised_weights(area)).values
+    if np.all(np.isnan(warming)):
+        raise ValueError("No valid candidate window found in surface_cube")
+
+    best = np.array([np.nanargmin(np.abs(warming-target)) for target in targets])
+    best_start_years = np.asarray(candidate_start_years)[best]
+
+    windows = xr.Dataset(
+        {'start_year': ('target',best_start_years),
+         'surface_warming': ('target',warming[best]),
+         'deviation': ('target',warming[best]-targets)},
+        coords={'target':targets})
+
+    for name,cube,cube_area in (('warming_profile',profile_cube,area),
+                                ('soil_warming',soil_cube,soil_area),
+                                ('snow_depth_change',snow_cube,snow_area)):
+        if cube is None:
+            continue
+        delta = (cube.sel(start_year=best_start_years)
+                 - cube.sel(start_year=reference_start_year))
+        signal = aw.weighted_domain_mean(delta,aw.normalised_weights(cube_area))
+        windows[name] = signal.rename({'start_year':'target'}).assign_coords(target=targets)
+
+    windows.attrs['reference_start_year'] = reference_start_year
+    windows.attrs['window_length'] = window_length
+
+    return windows